@@ -1,16 +1,585 @@
+import threading
+from array import array
+from bisect import bisect_left, bisect_right
+from contextlib import contextmanager
 from datetime import datetime, timedelta
+from heapq import heappop, heappush
+from time import localtime
+
+
+TABLE_ARCS = (3, 2, 1) # Prefixo (tuplo) da tabela dataTableGeneratedKeys
+TABLE_COLUMN_TYPES = {1: "Int", 2: "Str", 3: "Str", 4: "Int", 5: "Int", 6: "Int"} # Tipo de cada coluna da tabela
+
+
+def oid_to_tuple(oid):
+
+	"""Converte um OID em texto (ex.: "3.2.1.1.5") num tuplo de inteiros, comparável componente a componente"""
+
+	return tuple(int(arc) for arc in oid.split(".")) # Converter cada componente do OID num inteiro
+
+
+def parse_table_oid(oid):
+
+	"""Traduz um OID 3.2.1.<coluna>.<keyId> no par (coluna, keyId); retorna None se o OID não for uma instância da tabela"""
+
+	if not oid.startswith("3.2.1."): # Se o OID não pertencer à tabela
+		return None # Não é uma instância da tabela
+	parts = oid[6:].split(".") # Coluna e keyId
+	if len(parts) != 2 or len(parts[0]) != 1 or not parts[1].isdigit() or not parts[1].isascii() or parts[1][0] == "0": # Se o OID não tiver a forma <coluna>.<keyId>
+		return None # Não é uma instância da tabela
+	column = ord(parts[0]) - ord("0") # Índice da coluna
+	if column not in TABLE_COLUMN_TYPES: # Se a coluna não existir
+		return None # Não é uma instância da tabela
+	return column, int(parts[1]) # Retornar a coluna e o keyId
+
+
+def convert_value(instance_type, value):
+
+	"""Converte value para o tipo de uma instância ("Int" ou "Str"), lançando uma exceção se não for possível"""
+
+	target_type = instance_type.casefold() # Tipo de valor esperado
+
+	if target_type != type(value).__name__.casefold(): # Se o tipo de valor não for o esperado
+
+		# Tentativa de conversão do tipo de valor
+		try:
+			if target_type == "int".casefold(): # Se o tipo de valor for inteiro
+				value = int(value) # Converter para inteiro
+			elif target_type == "Str".casefold(): # Se o tipo de valor for string
+				value = str(value) # Converter para string
+		except ValueError: # Se não for possível converter o tipo de valor
+			raise ValueError(f"Não foi possível converter o tipo de valor {type(value)} para {target_type}.") # Lançar uma exceção
+
+	return value # Retornar o valor convertido
+
+
+def expiration_timestamp(key_expiration_date, key_expiration_time):
+
+	"""Converte o par (AAAAMMDD, HHMMSS) da expiração de uma chave num instante único (segundos desde a época, hora local)"""
+
+	date, time = int(key_expiration_date), int(key_expiration_time) # Data e hora como inteiros
+	return int(datetime(date // 10000, date // 100 % 100, date % 100, time // 10000, time // 100 % 100, time % 100).timestamp()) # Instante de expiração
+
+
+def expiration_fields(expires_at):
+
+	"""Converte o instante de expiração de uma chave no par (AAAAMMDD, HHMMSS) das colunas 3.2.1.4 e 3.2.1.5 (hora local)"""
+
+	fields = localtime(expires_at) # Data e hora locais do instante (uma só conversão para as duas colunas)
+	return fields.tm_year * 10000 + fields.tm_mon * 100 + fields.tm_mday, fields.tm_hour * 10000 + fields.tm_min * 100 + fields.tm_sec
+
+
+class KeyExpiryWheel:
+
+	"""Roda temporal (timer wheel) com granularidade de um segundo para a expiração das chaves
+
+	Cada segundo com chaves a expirar tem um balde com os IDs dessas chaves; os segundos ocupados
+	são mantidos numa min-heap, pelo que cada tick só visita os baldes que já venceram. Uma entrada
+	cancelada (chave removida ou reagendada) fica no balde até vencer e é então ignorada pela tabela;
+	live conta só as entradas atuais.
+	"""
+
+	def __init__(self):
+
+		"""Construtor da classe"""
+
+		self.buckets = {} # Segundo de expiração -> array com os IDs das chaves
+		self.ticks = [] # Min-heap dos segundos que têm um balde
+		self.live = 0 # Entradas agendadas e não canceladas
+
+	def __len__(self):
+
+		"""Número de chaves agendadas para expirar (sem as entradas canceladas)"""
+
+		return self.live
+
+	def schedule(self, key_id, expires_at):
+
+		"""Agenda a expiração da chave key_id para o instante expires_at"""
+
+		bucket = self.buckets.get(expires_at) # Balde do segundo de expiração
+		if bucket is None: # Se ainda não existir um balde para esse segundo
+			bucket = self.buckets[expires_at] = array("I") # Criar o balde
+			heappush(self.ticks, expires_at) # Registar o segundo na heap
+		elif type(bucket) is memoryview: # Se o balde for uma vista só de leitura sobre um snapshot
+			bucket = self.buckets[expires_at] = array("I", bucket) # Copiar o balde
+		bucket.append(key_id) # Adicionar a chave ao balde
+		self.live += 1
+
+	def cancel(self):
+
+		"""Cancela a entrada atual de uma chave removida ou reagendada (a entrada fica no balde e é ignorada quando vencer)"""
+
+		self.live -= 1
+
+	def pop_due(self, now):
+
+		"""Retira e retorna os pares (ID, instante) de todas as chaves cujo instante de expiração é anterior a now"""
+
+		due = [] # Entradas vencidas
+		while self.ticks and self.ticks[0] < now: # Enquanto o segundo mais antigo já tiver passado
+			expires_at = heappop(self.ticks) # Retirar o segundo da heap
+			due.extend((key_id, expires_at) for key_id in self.buckets.pop(expires_at)) # Retirar o balde
+		return due # Retornar as entradas vencidas
+
+
+class GeneratedKeysTable:
+
+	"""Tabela dataTableGeneratedKeys (3.2.1) com armazenamento compacto por colunas
+
+	Cada chave ocupa uma posição (slot) comum a todas as colunas: arrays de inteiros para o keyId, o
+	instante de expiração (segundos desde a época), a visibilidade e o requerente (índice numa pequena
+	tabela de requerentes), e uma arena de bytes com key_size bytes por slot para o valor da chave. As
+	colunas keyExpirationDate e keyExpirationTime (AAAAMMDD e HHMMSS) só são calculadas a partir do
+	instante quando são lidas. Os slots libertados são
+	reutilizados através de uma lista livre. A ordem dos keyIds, usada pelo get_next, é mantida em dois
+	arrays ordenados (keyId, slot) cujas entradas removidas só são descartadas na compactação.
+
+	Uma tabela carregada de um snapshot binário (mibSnapshot) tem as colunas como vistas só de leitura
+	sobre o ficheiro mapeado (mapping); são copiadas para arrays na primeira alteração.
+	"""
+
+	mapping = None # Snapshot mapeado em memória que contém as colunas (None = colunas em arrays)
+
+	def __init__(self, key_size=10):
+
+		"""Construtor da classe"""
+
+		self.key_size = key_size # Número de bytes reservados por chave na arena
+		self.ids = array("I") # slot -> keyId (0 = slot livre)
+		self.values = bytearray() # Arena com os valores das chaves (key_size bytes por slot)
+		self.requesters = array("I") # slot -> índice do requerente em requester_names
+		self.expires = array("q") # slot -> instante de expiração (segundos desde a época)
+		self.visibilities = array("B") # slot -> keyVisibility
+		self.free_slots = array("I") # Pilha de slots livres
+		self.requester_names = [] # Índice -> requerente
+		self.requester_index = {} # Requerente -> índice
+		self.order_ids = array("I") # keyIds por ordem crescente (inclui entradas removidas ainda não compactadas)
+		self.order_slots = array("I") # Slot de cada entrada de order_ids
+		self.order_start = 0 # Posição da primeira entrada possivelmente viva em order_ids
+		self.dead = 0 # Número de entradas removidas em order_ids
+		self.live = 0 # Número de chaves na tabela
+		self.visibility_counts = {0: 0, 1: 0, 2: 0} # Contadores de chaves por visibilidade
+		self.expiry_wheel = KeyExpiryWheel() # Roda temporal das expirações
+
+	def __setstate__(self, state):
+
+		"""Restaura o estado da tabela (pickle), convertendo as colunas de data e hora de versões anteriores"""
+
+		self.__dict__.update(state) # Restaurar os atributos
+		if "dates" in state: # Se a expiração estiver guardada como data e hora (versão anterior)
+			self.convert_expiration_columns()
+		if "live" not in self.expiry_wheel.__dict__: # Roda temporal de uma versão anterior (sem contagem)
+			self.expiry_wheel.live = self.live # Uma entrada atual por chave
+
+	def convert_expiration_columns(self):
+
+		"""Substitui as colunas dates e times (AAAAMMDD e HHMMSS) de versões anteriores pela coluna expires"""
+
+		dates, times = self.__dict__.pop("dates"), self.__dict__.pop("times") # Colunas anteriores
+		self.expires = array("q", (expiration_timestamp(date, time) if key_id else 0 for key_id, date, time in zip(self.ids, dates, times))) # Um instante por slot
+
+	def __len__(self):
+
+		"""Número de chaves na tabela"""
+
+		return self.live # Retornar o número de chaves
+
+	def __contains__(self, key_id):
+
+		"""Verifica se existe uma chave com o keyId indicado"""
+
+		return self.slot_of(key_id) is not None # Existe se tiver um slot
+
+	def is_live(self, pos):
+
+		"""Verifica se a entrada pos de order_ids corresponde a uma chave presente na tabela"""
+
+		return self.ids[self.order_slots[pos]] == self.order_ids[pos] # O slot ainda guarda o mesmo keyId
+
+	def slot_of(self, key_id):
+
+		"""Retorna o slot da chave key_id, ou None se a chave não existir"""
+
+		pos = bisect_left(self.order_ids, key_id) # Posição do keyId na ordem
+		if pos < len(self.order_ids) and self.order_ids[pos] == key_id and self.is_live(pos): # Se a entrada existir e estiver viva
+			return self.order_slots[pos] # Retornar o slot
+		return None # A chave não existe
+
+	def next_id(self, key_id):
+
+		"""Retorna o menor keyId presente na tabela que seja maior do que key_id, ou None"""
+
+		order_ids, order_slots, ids = self.order_ids, self.order_slots, self.ids # Referências locais (ciclo crítico)
+		pos = max(bisect_right(order_ids, key_id), self.order_start) # Primeira entrada candidata
+		while pos < len(order_ids): # Enquanto houver entradas
+			if ids[order_slots[pos]] == order_ids[pos]: # Se a entrada estiver viva
+				return order_ids[pos] # Retornar o keyId
+			pos += 1 # Saltar a entrada removida
+		return None # Não há keyIds seguintes
+
+	def max_id(self):
+
+		"""Retorna o maior keyId presente na tabela, ou 0 se a tabela estiver vazia"""
+
+		for pos in range(len(self.order_ids) - 1, self.order_start - 1, -1): # Do fim para o início da ordem
+			if self.is_live(pos): # Se a entrada estiver viva
+				return self.order_ids[pos] # Retornar o keyId
+		return 0 # Tabela vazia
+
+	def rows(self):
+
+		"""Itera os pares (keyId, slot) das chaves presentes, por ordem crescente de keyId"""
+
+		for pos in range(self.order_start, len(self.order_ids)): # Para cada entrada da ordem
+			if self.is_live(pos): # Se a entrada estiver viva
+				yield self.order_ids[pos], self.order_slots[pos] # Retornar o keyId e o slot
+
+	def intern_requester(self, requester):
+
+		"""Retorna o índice do requerente na tabela de requerentes, acrescentando-o se for novo"""
+
+		idx = self.requester_index.get(requester) # Índice do requerente
+		if idx is None: # Se o requerente for novo
+			idx = self.requester_index[requester] = len(self.requester_names) # Atribuir um novo índice
+			self.requester_names.append(requester) # Guardar o requerente
+		return idx # Retornar o índice
+
+	def widen(self, key_size):
+
+		"""Aumenta o número de bytes reservados por chave na arena, preservando os valores existentes"""
+
+		width = self.key_size # Largura atual
+		self.values = bytearray(b"".join(bytes(self.values[i:i + width]).ljust(key_size, b"\0") for i in range(0, len(self.values), width))) # Reescrever a arena
+		self.key_size = key_size # Nova largura
+
+	def encode_key(self, key):
+
+		"""Codifica o valor de uma chave com key_size bytes (completado com bytes nulos)"""
+
+		data = key.encode("latin-1") # Um byte por carácter (lança ValueError se não for possível)
+		if len(data) > self.key_size: # Se a chave não couber na arena
+			self.widen(len(data)) # Alargar a arena
+		return data.ljust(self.key_size, b"\0") # Completar com bytes nulos
+
+	def read_key(self, slot):
+
+		"""Retorna o valor da chave guardada no slot"""
+
+		start = slot * self.key_size # Início do valor na arena
+		return bytes(self.values[start:start + self.key_size]).rstrip(b"\0").decode("latin-1") # Descodificar o valor
+
+	def value(self, column, slot):
+
+		"""Retorna o valor da coluna column no slot"""
+
+		if column == 1: # keyId
+			return self.ids[slot]
+		if column == 2: # keyValue
+			return self.read_key(slot)
+		if column == 3: # KeyRequester
+			return self.requester_names[self.requesters[slot]]
+		if column == 4 or column == 5: # keyExpirationDate ou keyExpirationTime (calculadas a partir do instante)
+			return expiration_fields(self.expires[slot])[column - 4]
+		return self.visibilities[slot] # keyVisibility
+
+	def row(self, slot):
+
+		"""Retorna os campos (chave, requerente, instante de expiração, visibilidade) do slot, pela ordem de insert"""
+
+		return self.read_key(slot), self.requester_names[self.requesters[slot]], self.expires[slot], self.visibilities[slot]
+
+	def materialize(self):
+
+		"""Copia as colunas servidas a partir de um snapshot mapeado para arrays (antes da primeira alteração)"""
+
+		for name in ("ids", "requesters", "expires", "visibilities", "free_slots", "order_ids", "order_slots"): # Para cada coluna
+			column = getattr(self, name)
+			if type(column) is memoryview: # Se a coluna for uma vista sobre o ficheiro
+				copy = array(column.format) # Cópia da coluna (memcpy)
+				copy.frombytes(column.cast("B"))
+				setattr(self, name, copy)
+		if type(self.values) is memoryview: # Arena dos valores das chaves
+			self.values = bytearray(self.values)
+		self.mapping = None # As colunas já não dependem do ficheiro
+
+	def set_value(self, column, slot, value):
+
+		"""Altera o valor da coluna column no slot (o keyId não pode ser alterado)"""
+
+		if self.mapping is not None: # Se as colunas forem vistas só de leitura sobre um snapshot
+			self.materialize() # Copiar as colunas
+		if column == 1: # keyId
+			raise ValueError("O keyId de uma chave não pode ser alterado.") # Lançar uma exceção
+		if column == 2: # keyValue
+			data = self.encode_key(value) # Codificar o valor (pode alargar a arena)
+			self.values[slot * self.key_size:(slot + 1) * self.key_size] = data # Escrever o valor na arena
+		elif column == 3: # KeyRequester
+			self.requesters[slot] = self.intern_requester(value) # Guardar o índice do requerente
+		elif column == 6: # keyVisibility
+			if value not in (0, 1, 2): # Se a visibilidade for inválida
+				raise ValueError(f"A visibilidade da chave tem de ser 0, 1 ou 2 (recebido {value}).") # Lançar uma exceção
+			self.visibility_counts[self.visibilities[slot]] -= 1 # Descontar a visibilidade anterior
+			self.visibilities[slot] = value # Guardar a nova visibilidade
+			self.visibility_counts[value] += 1 # Contar a nova visibilidade
+		else: # keyExpirationDate ou keyExpirationTime
+			date, time = expiration_fields(self.expires[slot]) # Data e hora atuais
+			expires_at = expiration_timestamp(*((value, time) if column == 4 else (date, value))) # Validar e converter a nova expiração
+			self.expires[slot] = expires_at # Guardar o instante
+			self.expiry_wheel.cancel() # A entrada antiga é descartada quando vencer
+			self.expiry_wheel.schedule(self.ids[slot], expires_at) # Reagendar a expiração
+
+	def insert(self, key_id, key, requester, expires_at, key_visibility):
+
+		"""Insere uma chave que expira no instante expires_at (substituindo a chave com o mesmo keyId, se existir)"""
+
+		self.insert_batch(key_id, [key], requester, expires_at, [key_visibility]) # Lote com uma chave
+
+	def insert_batch(self, first_key_id, keys, requester, expires_at, visibilities):
+
+		"""Insere chaves com keyIds consecutivos a partir de first_key_id, com o mesmo requerente e o mesmo instante
+		de expiração (substituindo as chaves com os mesmos keyIds, se existirem); o lote é validado antes de qualquer inserção"""
+
+		if not (0 < first_key_id and first_key_id + len(keys) - 1 <= 0xFFFFFFFF): # Se algum keyId não couber na coluna
+			raise ValueError(f"O keyId {first_key_id} é inválido.") # Lançar uma exceção
+		if self.mapping is not None: # Se as colunas forem vistas só de leitura sobre um snapshot
+			self.materialize() # Copiar as colunas
+		for key_visibility in visibilities: # Para cada visibilidade
+			if key_visibility not in (0, 1, 2): # Se a visibilidade for inválida
+				raise ValueError(f"A visibilidade da chave tem de ser 0, 1 ou 2 (recebido {key_visibility}).") # Lançar uma exceção
+		encoded = [key.encode("latin-1") for key in keys] # Um byte por carácter (lança ValueError se não for possível)
+		width = max(map(len, encoded), default=0) # Maior chave do lote
+		if width > self.key_size: # Se alguma chave não couber na arena
+			self.widen(width) # Alargar a arena
+		expires_at = int(expires_at) # Instante de expiração (comum ao lote)
+		requester_idx = self.intern_requester(requester) # Índice do requerente (comum ao lote)
+
+		for offset, (data, key_visibility) in enumerate(zip(encoded, visibilities)): # Para cada chave do lote
+			key_id = first_key_id + offset # keyId da chave
+			data = data.ljust(self.key_size, b"\0") # Completar com bytes nulos
+
+			if key_id in self: # Se já existir uma chave com este keyId
+				self.remove(key_id) # Remover a chave anterior
+
+			if self.free_slots: # Se houver slots livres
+				slot = self.free_slots.pop() # Reutilizar um slot
+				self.ids[slot] = key_id
+				self.values[slot * self.key_size:(slot + 1) * self.key_size] = data
+				self.requesters[slot] = requester_idx
+				self.expires[slot] = expires_at
+				self.visibilities[slot] = key_visibility
+			else: # Se não houver slots livres
+				slot = len(self.ids) # Novo slot no fim das colunas
+				self.ids.append(key_id)
+				self.values += data
+				self.requesters.append(requester_idx)
+				self.expires.append(expires_at)
+				self.visibilities.append(key_visibility)
+
+			self.index_id(key_id, slot) # Registar o keyId na ordem
+			self.live += 1 # Contar a chave
+			self.visibility_counts[key_visibility] += 1 # Contar a visibilidade
+			self.expiry_wheel.schedule(key_id, expires_at) # Agendar a expiração
+
+	def index_id(self, key_id, slot):
+
+		"""Regista o keyId na ordem dos keyIds"""
+
+		if not self.order_ids or key_id > self.order_ids[-1]: # Caso habitual: keyIds crescentes
+			self.order_ids.append(key_id) # Acrescentar no fim
+			self.order_slots.append(slot)
+			return
+		pos = bisect_left(self.order_ids, key_id) # Posição do keyId
+		if self.order_ids[pos] == key_id: # Se existir uma entrada removida com este keyId
+			self.order_slots[pos] = slot # Reativar a entrada
+			self.dead -= 1 # Há menos uma entrada removida
+		else: # Se o keyId for novo
+			self.order_ids.insert(pos, key_id) # Inserir na posição
+			self.order_slots.insert(pos, slot)
+		self.order_start = min(self.order_start, pos) # A primeira entrada viva pode ter recuado
+
+	def remove(self, key_id):
+
+		"""Remove a chave key_id da tabela"""
+
+		slot = self.slot_of(key_id) # Slot da chave
+		if slot is None: # Se a chave não existir
+			raise ValueError(f"A chave {key_id} não existe.") # Lançar uma exceção
+		if self.mapping is not None: # Se as colunas forem vistas só de leitura sobre um snapshot
+			self.materialize() # Copiar as colunas
+		self.visibility_counts[self.visibilities[slot]] -= 1 # Descontar a visibilidade
+		self.ids[slot] = 0 # Libertar o slot
+		self.values[slot * self.key_size:(slot + 1) * self.key_size] = bytes(self.key_size) # Apagar o valor da chave da memória
+		self.free_slots.append(slot) # Permitir a reutilização do slot
+		self.live -= 1 # Descontar a chave
+		self.expiry_wheel.cancel() # A entrada da roda temporal é descartada quando vencer
+		self.dead += 1 # A entrada na ordem passa a estar removida
+		while self.order_start < len(self.order_ids) and not self.is_live(self.order_start): # Saltar as entradas removidas do início
+			self.order_start += 1
+		if self.dead > 1024 and self.dead > self.live: # Se a ordem tiver mais entradas removidas do que vivas
+			self.compact_order() # Compactar a ordem
+
+	def compact_order(self):
+
+		"""Descarta as entradas removidas dos arrays da ordem dos keyIds"""
+
+		order_ids, order_slots = array("I"), array("I") # Novos arrays da ordem
+		for key_id, slot in self.rows(): # Para cada chave presente
+			order_ids.append(key_id)
+			order_slots.append(slot)
+		self.order_ids, self.order_slots = order_ids, order_slots # Substituir a ordem
+		self.order_start = 0 # Todas as entradas estão vivas
+		self.dead = 0 # Não há entradas removidas
+
+	def remove_expired(self, now):
+
+		"""Remove as chaves cujo instante de expiração é anterior a now e retorna os seus keyIds"""
+
+		expired = [] # keyIds das chaves removidas
+		for key_id, expires_at in self.expiry_wheel.pop_due(now): # Para cada entrada vencida na roda temporal
+			slot = self.slot_of(key_id) # Slot da chave
+			if slot is not None and self.expires[slot] == expires_at: # Se a chave ainda existir com essa expiração
+				self.remove(key_id) # Remover a chave
+				expired.append(key_id) # Registar a chave removida
+		return expired # Retornar os keyIds das chaves removidas
+
+	def count_visibilities(self):
+
+		"""Conta as chaves por visibilidade percorrendo todos os slots (usado para verificação)"""
+
+		counts = {0: 0, 1: 0, 2: 0} # Contadores por visibilidade
+		for key_id, visibility in zip(self.ids, self.visibilities): # Para cada slot
+			if key_id: # Se o slot estiver ocupado
+				counts[visibility] += 1 # Incrementar o contador
+		return counts # Retornar os contadores
 
 
 class InstanceData:
 
 	""" Classe que representa os dados de uma instância da MIB """
 
+	persistent = True # A instância faz parte do estado guardado da MIB
+
 	def __init__(self, access_type, instance_type, value):
 		self.access_type = access_type # RO = Read Only, RW = Read Write
 		self.instance_type = instance_type # Int = Integer, Str = String
 		self.value = value # Valor da instância
 
 
+class ComputedInstanceData:
+
+	"""Instância só de leitura cujo valor é calculado a cada leitura (ex.: as métricas do agente); não faz
+	parte do estado guardado da MIB"""
+
+	persistent = False # A instância não é guardada no snapshot
+
+	def __init__(self, instance_type, getter):
+		self.access_type = "RO" # Read Only
+		self.instance_type = instance_type # Int = Integer, Str = String
+		self.getter = getter # Função sem argumentos que retorna o valor
+
+	@property
+	def value(self):
+
+		"""Valor atual da instância"""
+
+		return self.getter()
+
+	@value.setter
+	def value(self, value):
+		raise ValueError("A instância é calculada a cada leitura e não pode ser alterada.") # Lançar uma exceção
+
+
+class ReadWriteLock:
+
+	"""Lock de leitores/escritor para a MIB
+
+	Vários leitores (pedidos get) podem estar dentro da secção crítica ao mesmo tempo; um escritor
+	(pedidos set, expiração das chaves) tem acesso exclusivo. Os escritores têm prioridade: quando um
+	escritor está à espera, novos leitores aguardam, para que os sets não fiquem bloqueados por um
+	fluxo contínuo de gets. O lock não é reentrante.
+	"""
+
+	def __init__(self):
+
+		"""Construtor da classe"""
+
+		self.condition = threading.Condition(threading.Lock()) # Condição que protege os contadores
+		self.readers = 0 # Número de leitores dentro da secção crítica
+		self.writer = False # Indica se um escritor está dentro da secção crítica
+		self.waiting_writers = 0 # Número de escritores à espera
+
+	def acquire_read(self):
+
+		"""Entra na secção crítica como leitor"""
+
+		with self.condition:
+			while self.writer or self.waiting_writers: # Enquanto houver um escritor ativo ou à espera
+				self.condition.wait()
+			self.readers += 1 # Registar o leitor
+
+	def try_acquire_read(self):
+
+		"""Entra na secção crítica como leitor se puder fazê-lo sem esperar; retorna se entrou"""
+
+		with self.condition:
+			if self.writer or self.waiting_writers: # Se houver um escritor ativo ou à espera
+				return False
+			self.readers += 1 # Registar o leitor
+			return True
+
+	def release_read(self):
+
+		"""Sai da secção crítica como leitor"""
+
+		with self.condition:
+			self.readers -= 1 # Retirar o leitor
+			if self.readers == 0: # Se for o último leitor
+				self.condition.notify_all() # Acordar os escritores à espera
+
+	def acquire_write(self):
+
+		"""Entra na secção crítica como escritor"""
+
+		with self.condition:
+			self.waiting_writers += 1 # Bloquear a entrada de novos leitores
+			while self.writer or self.readers: # Enquanto houver leitores ou outro escritor
+				self.condition.wait()
+			self.waiting_writers -= 1
+			self.writer = True # Registar o escritor
+
+	def release_write(self):
+
+		"""Sai da secção crítica como escritor"""
+
+		with self.condition:
+			self.writer = False # Retirar o escritor
+			self.condition.notify_all() # Acordar os leitores e escritores à espera
+
+	@contextmanager
+	def read_locked(self, acquired=False):
+
+		"""Gestor de contexto para uma secção de leitura (com acquired o leitor já entrou com try_acquire_read)"""
+
+		if not acquired: # Se o leitor ainda não tiver entrado
+			self.acquire_read()
+		try:
+			yield
+		finally:
+			self.release_read()
+
+	@contextmanager
+	def write_locked(self):
+
+		"""Gestor de contexto para uma secção de escrita"""
+
+		self.acquire_write()
+		try:
+			yield
+		finally:
+			self.release_write()
+
+
 class SNMPKeyShareMIB:
 
 	""" Classe que representa a MIB SNMPKeyShare """
@@ -34,6 +603,91 @@ class SNMPKeyShareMIB:
 			"3.1.0": InstanceData("RO", "Int", 0),  # dataNumberOfValidKeys
 		}
 
+		self.table = GeneratedKeysTable(self.mib["1.3.0"].value) # Tabela dataTableGeneratedKeys (3.2.1)
+		self.rebuild_oid_index() # Construir o índice ordenado dos OIDs escalares
+
+	def __setstate__(self, state):
+
+		"""Restaura o estado da MIB (pickle), convertendo os estados de versões anteriores"""
+
+		self.__dict__.update(state) # Restaurar os atributos
+		if "table" not in state: # Se as chaves estiverem guardadas como instâncias no dicionário (versão anterior)
+			self.table = GeneratedKeysTable(self.mib["1.3.0"].value) # Criar a tabela
+			for oid in [oid for oid in self.mib if oid.startswith("3.2.1.1.")]: # Para cada keyId guardado
+				key_id = self.mib[oid].value # ID da chave
+				_, key, requester, date, time, visibility = [self.mib.pop(f"3.2.1.{column}.{key_id}").value for column in range(1, 7)] # Instâncias da linha
+				self.table.insert(key_id, key, requester, expiration_timestamp(date, time), visibility) # Mover a linha para a tabela
+			for name in ("expiry_wheel", "key_expirations", "visibility_counts"): # Atributos que passaram para a tabela
+				self.__dict__.pop(name, None) # Descartar o atributo
+		self.rebuild_oid_index() # Reconstruir o índice ordenado
+
+	def rebuild_oid_index(self):
+
+		"""Reconstrói o índice ordenado (ordem lexicográfica SNMP) dos OIDs escalares da MIB"""
+
+		self.sorted_keys = sorted(oid_to_tuple(oid) for oid in self.mib) # OIDs como tuplos, ordenados componente a componente
+		self.sorted_oids = [".".join(map(str, key)) for key in self.sorted_keys] # OIDs em texto, pela mesma ordem
+
+	def add_computed_instances(self, instances):
+
+		"""Adiciona instâncias calculadas a cada leitura (dicionário OID -> (tipo, função)) e reconstrói o índice"""
+
+		for oid, (instance_type, getter) in instances.items(): # Para cada instância
+			self.mib[oid] = ComputedInstanceData(instance_type, getter)
+		self.rebuild_oid_index() # Os novos OIDs passam a ser visitados pelo get_next
+
+	def count_visibilities(self):
+
+		"""Conta as chaves da tabela de dados por visibilidade percorrendo toda a tabela (usado para verificação)"""
+
+		return self.table.count_visibilities() # Recontagem completa
+
+	def count_valid_keys(self):
+
+		"""Retorna o número de chaves válidas (visíveis ao requerente ou a todos) sem percorrer a tabela"""
+
+		return self.table.visibility_counts[1] + self.table.visibility_counts[2] # Chaves com visibilidade 1 ou 2
+
+	def verify_visibility_counts(self):
+
+		"""Compara os contadores de visibilidade com uma recontagem completa; se divergirem, corrige-os e lança uma exceção"""
+
+		counts = self.count_visibilities() # Recontagem completa
+		if counts != self.table.visibility_counts: # Se os contadores divergirem
+			expected, self.table.visibility_counts = self.table.visibility_counts, counts # Corrigir os contadores
+			raise ValueError(f"Contadores de visibilidade inconsistentes: {expected} (mantidos) != {counts} (recontados).") # Lançar uma exceção
+
+	def table_location(self, oid):
+
+		"""Traduz um OID da tabela de dados no par (coluna, slot); retorna None se a instância não existir"""
+
+		parsed = parse_table_oid(oid) # Coluna e keyId
+		if parsed is None: # Se o OID não for uma instância da tabela
+			return None # A instância não existe
+		slot = self.table.slot_of(parsed[1]) # Slot da chave
+		if slot is None: # Se a chave não existir
+			return None # A instância não existe
+		return parsed[0], slot # Retornar a coluna e o slot
+
+	def next_table_key(self, key):
+
+		"""Retorna o OID (tuplo) da tabela de dados que se segue a key na ordem lexicográfica, ou None"""
+
+		prefix = key[:3] # Prefixo do OID
+		if prefix > TABLE_ARCS: # Se o OID estiver depois da tabela
+			return None # Não há OIDs seguintes na tabela
+		column = key[3] if prefix == TABLE_ARCS and len(key) > 3 else 0 # Coluna do OID (0 se o OID estiver antes da tabela)
+		if len(key) > 4 and 1 <= column <= 6: # Se o OID indicar uma linha
+			next_id = self.table.next_id(key[4]) # keyId seguinte na mesma coluna
+			if next_id is not None: # Se existir
+				return TABLE_ARCS + (column, next_id) # OID seguinte na mesma coluna
+			column += 1 # Passar para a coluna seguinte
+		column = max(column, 1) # Primeira coluna candidata
+		first_id = self.table.next_id(0) # Menor keyId da tabela
+		if first_id is None or column > 6: # Se a tabela estiver vazia ou não houver mais colunas
+			return None # Não há OIDs seguintes na tabela
+		return TABLE_ARCS + (column, first_id) # Primeira linha da coluna
+
 	"""
 	-- when a manager/client wants to request a generation of a key it 
 	-- sends a set() request to write 0,1 or 2 into the keyVisibility.0 instance; 
@@ -43,19 +697,23 @@ class SNMPKeyShareMIB:
 
 	# Pensar nisso como 3.2.1 é a tabela de dados e o próximo valor é o índice da coluna e o current_key_id é o índice da linha
 
-	def add_entry_to_dataTableGeneratedKeys(self, current_key_id, key, KeyRequester, key_expiration_date, key_expiration_time, key_visibility=0):
+	def add_entry_to_dataTableGeneratedKeys(self, current_key_id, key, KeyRequester, key_expiration, key_visibility=0):
 
-		"""Adiciona uma entrada à tabela de dados"""
+		"""Adiciona uma entrada à tabela de dados (key_expiration: instante de expiração, em segundos desde a época)"""
 
-		self.mib[f"3.2.1.1.{current_key_id}"] = InstanceData("RO", "Int", current_key_id)  # keyId
-		self.mib[f"3.2.1.2.{current_key_id}"] = InstanceData("RO", "Str", key)  # keyValue
-		self.mib[f"3.2.1.3.{current_key_id}"] = InstanceData("RO", "Str", KeyRequester)  # KeyRequester
-		self.mib[f"3.2.1.4.{current_key_id}"] = InstanceData("RO", "Int", key_expiration_date)  # keyExpirationDate
-		self.mib[f"3.2.1.5.{current_key_id}"] = InstanceData("RO", "Int", key_expiration_time)  # keyExpirationTime
-		self.mib[f"3.2.1.6.{current_key_id}"] = InstanceData("RO", "Int", key_visibility)  # keyVisibility (0 = invisible, 1 = visible to requester, 2 = visible to all)
+		key_visibility = convert_value("Int", key_visibility) # keyVisibility (0 = invisible, 1 = visible to requester, 2 = visible to all)
+		self.table.insert(current_key_id, key, KeyRequester, key_expiration, key_visibility) # Guardar a linha nas colunas da tabela
 		oid = f"3.2.1.6.{current_key_id}" # keyVisibility
 		return oid, key_visibility # Retorna o OID e o valor da visibilidade da chave
 
+	def add_entries_to_dataTableGeneratedKeys(self, first_key_id, keys, KeyRequester, key_expiration, key_visibilities):
+
+		"""Adiciona um lote de entradas com IDs consecutivos e o mesmo instante de expiração à tabela de dados e retorna os pares (OID, visibilidade)"""
+
+		key_visibilities = [convert_value("Int", key_visibility) for key_visibility in key_visibilities] # keyVisibility de cada entrada
+		self.table.insert_batch(first_key_id, keys, KeyRequester, key_expiration, key_visibilities) # Guardar o lote nas colunas da tabela
+		return [(f"3.2.1.6.{first_key_id + offset}", key_visibility) for offset, key_visibility in enumerate(key_visibilities)] # OID e visibilidade de cada chave
+
 	def get_id_from_oid(self, oid):
 
 		"""Retorna o ID de uma chave a partir do OID"""
@@ -67,80 +725,78 @@ class SNMPKeyShareMIB:
 		"""Remove uma entrada da tabela de dados"""
 
 		ident = self.get_id_from_oid(oid) # Identificador da entrada
-		for i in range(1, 7): # Para cada coluna da entrada
-			del self.mib[f"3.2.1.{i}.{ident}"] # Remover a entrada
+		self.table.remove(int(ident)) # Remover a linha da tabela
+
+	def remove_expired_entries_from_dataTableGeneratedKeys(self, now):
+
+		"""Remove as entradas cujo instante de expiração é anterior a now e retorna os seus IDs"""
+
+		return self.table.remove_expired(now) # Remover apenas as chaves vencidas na roda temporal
 
 	def get(self, oid):
 
 		"""Retorna o valor de uma instância da MIB"""
 
-		if oid not in self.mib: # Se o OID não existir
+		instance = self.mib.get(oid) # Instância escalar
+		if instance is not None: # Se o OID for escalar
+			return instance.value # Retornar o valor da instância
+		location = self.table_location(oid) # Coluna e slot na tabela de dados
+		if location is None: # Se o OID não existir
 			raise ValueError(f"O OID {oid} não existe.") # Lançar uma exceção
-		return self.mib[oid].value # Retornar o valor da instância
+		return self.table.value(*location) # Retornar o valor da instância
 
 	def get_next(self, oid, current_key_id=None):
 
 		"""Retorna o próximo OID e o seu valor"""
 
-		if oid not in self.mib: # Se o OID não existir
+		parsed = parse_table_oid(oid) # Coluna e keyId, se o OID for da tabela de dados
+		if parsed is not None and parsed[1] in self.table: # Se o OID for uma instância da tabela
+			key = TABLE_ARCS + parsed # OID como tuplo
+		elif oid in self.mib: # Se o OID for escalar
+			key = oid_to_tuple(oid) # OID como tuplo
+		else: # Se o OID não existir
 			raise ValueError(f"O OID {oid} não existe.") # Lançar uma exceção
 
-		keys = list(self.mib.keys()) # Lista de OIDs
-		idx = keys.index(oid) # Índice do OID
+		idx = bisect_right(self.sorted_keys, key) # Posição do OID escalar seguinte na ordem lexicográfica
+		table_key = self.next_table_key(key) # OID seguinte na tabela de dados
 
-		if idx == len(keys) - 1: # Se o OID for o último
+		if idx == len(self.sorted_keys) and table_key is None: # Se o OID for o último
 			raise ValueError(f"O OID {oid} é o último OID na MIB.") # Lançar uma exceção
 
 		if current_key_id is not None: # Se o ID da chave atual for especificado
 			if current_key_id != self.get_id_from_oid(oid): # Se o ID da chave atual não for o mesmo que o ID da chave atual
 				raise ValueError(f"O ID {current_key_id} não pertence ao OID {oid}.") # Lançar uma exceção
 
-		next_oid = keys[idx + 1] # Próximo OID
+		if table_key is not None and (idx == len(self.sorted_keys) or table_key < self.sorted_keys[idx]): # Se o OID seguinte for da tabela
+			column, key_id = table_key[3], table_key[4] # Coluna e keyId
+			return f"3.2.1.{column}.{key_id}", self.table.value(column, self.table.slot_of(key_id)) # Retornar o próximo OID e o seu valor
+		next_oid = self.sorted_oids[idx] # Próximo OID
 		return next_oid, self.mib[next_oid].value # Retornar o próximo OID e o seu valor
 
 	def set(self, oid, value):
 
 		"""Define o valor de uma instância da MIB"""
 
-		if oid not in self.mib: # Se o OID não existir
+		if oid not in self.mib: # Se o OID não for escalar
+			if self.table_location(oid) is not None: # Se o OID for da tabela de dados (só de leitura)
+				raise ValueError(f"O OID {oid} é de leitura apenas.") # Lançar uma exceção
 			raise ValueError(f"O OID {oid} não existe.") # Lançar uma exceção
 		
 		if self.mib[oid].access_type == "RO": # Se o OID for de leitura apenas
 			raise ValueError(f"O OID {oid} é de leitura apenas.") # Lançar uma exceção
-		
-		target_type = self.mib[oid].instance_type.casefold() # Tipo de valor esperado
-
-		if target_type != type(value).__name__.casefold(): # Se o tipo de valor não for o esperado
 
-			# Tentativa de conversão do tipo de valor
-			try:
-				if target_type == "int".casefold(): # Se o tipo de valor for inteiro
-					value = int(value) # Converter para inteiro
-				elif target_type == "Str".casefold(): # Se o tipo de valor for string
-					value = str(value) # Converter para string
-			except ValueError: # Se não for possível converter o tipo de valor
-				raise ValueError(f"Não foi possível converter o tipo de valor {type(value)} para {target_type}.") # Lançar uma exceção
-
-		self.mib[oid].value = value # Definir o valor da instância
+		self.mib[oid].value = convert_value(self.mib[oid].instance_type, value) # Definir o valor da instância
 
 	def setAdmin(self, oid, value):
 
 		"""Define o valor de uma instância da MIB sem verificar o acesso"""
 
-		if oid not in self.mib: # Se o OID não existir
-			raise ValueError(f"O OID {oid} não existe.") # Lançar uma exceção
-		
-		target_type = self.mib[oid].instance_type.casefold() # Tipo de valor esperado
-
-		if target_type != type(value).__name__.casefold(): # Se o tipo de valor não for o esperado
-
-			# Tentativa de conversão do tipo de valor
-			try:
-				if target_type == "int".casefold(): # Se o tipo de valor for inteiro
-					value = int(value) # Converter para inteiro
-				elif target_type == "Str".casefold(): # Se o tipo de valor for string
-					value = str(value) # Converter para string
-			except ValueError: # Se não for possível converter o tipo de valor
-				raise ValueError(f"Não foi possível converter o tipo de valor {type(value)} para {target_type}.") # Lançar uma exceção
+		if oid not in self.mib: # Se o OID não for escalar
+			location = self.table_location(oid) # Coluna e slot na tabela de dados
+			if location is None: # Se o OID não existir
+				raise ValueError(f"O OID {oid} não existe.") # Lançar uma exceção
+			column, slot = location # Coluna e slot
+			self.table.set_value(column, slot, convert_value(TABLE_COLUMN_TYPES[column], value)) # Definir o valor na tabela
+			return
 
-		self.mib[oid].value = value # Definir o valor da instância
+		self.mib[oid].value = convert_value(self.mib[oid].instance_type, value) # Definir o valor da instância
@@ -1,13 +1,31 @@
+import asyncio
 import datetime
-import pickle
+import queue
+import select
+import signal
 import socket
 import threading
 import configparser
+import json
+import os
 import time
+from collections import deque
+from itertools import cycle
+from concurrent.futures import ThreadPoolExecutor
 
 from MIB import *
-from SNMPKeySharePDU import SNMPKeySharePDU
-from keyMaintenance import generate_matrices, process_Z, generate_key
+from agentMetrics import MetricsRegistry
+from agentProfiler import StackSampler, RequestTracer
+from SNMPKeySharePDU import SNMPKeySharePDU, detect_wire_format
+from keyMaintenance import process_Z, generate_keys, select_z_engine
+from matrixCache import cached_matrices, invalidate_matrices
+from fileUtils import write_file_atomically
+from mibJournal import MIBJournal, OP_ADD, OP_REMOVE, OP_SET
+from sharedKeyStore import SharedKeyStore, SharedKeysTable
+
+
+SERVE_POLL_INTERVAL = 0.5 # Tempo máximo (segundos) que os ciclos de receção esperam antes de verificarem a flag running
+METRICS_LATENCIES = ("get", "set", "decode", "encode", "process_Z", "expire_keys", "key_update_tick", "master_key_rebuild", "master_key_swap") # Operações medidas (linhas da tabela 4.10.1)
 
 
 def read_config_file(file_path):
@@ -19,21 +37,113 @@ def read_config_file(file_path):
 
 	parameters = {
 		"udp_port": int(config.get("Network", "udp_port")), # Ler o parâmetro udp_port e convertê-lo para inteiro
+		"accept_pickle": config.getboolean("Network", "accept_pickle", fallback=False), # Aceitar PDUs codificados com pickle (opcional, migração)
+		"serve_mode": config.get("Network", "serve_mode", fallback="single").strip(), # Ler o modo de atendimento dos pedidos (opcional)
+		"workers": config.getint("Network", "workers", fallback=4), # Ler o número de workers dos modos threaded e asyncio (opcional)
+		"queue_size": config.getint("Network", "queue_size", fallback=1024), # Ler a capacidade da fila de pedidos do modo threaded (opcional)
+		"batch_size": config.getint("Network", "batch_size", fallback=64), # Ler o número máximo de datagramas por lote do modo batch (opcional)
+		"recv_buffer_size": config.getint("Network", "recv_buffer_size", fallback=1400), # Ler o tamanho máximo de um datagrama recebido (opcional)
+		"max_response_size": config.getint("Network", "max_response_size", fallback=1400), # Ler o tamanho máximo de um datagrama de resposta (opcional)
+		"max_response_fragments": config.getint("Network", "max_response_fragments", fallback=64), # Ler o número máximo de fragmentos da resposta a um get (opcional)
+		"processes": config.getint("Network", "processes", fallback=1), # Ler o número de processos do agente (opcional, >1 usa SO_REUSEPORT)
+		"shared_state_file": config.get("Network", "shared_state_file", fallback="snmpkeyshare_shared.bin").strip(), # Ler o ficheiro do estado partilhado (opcional)
+		"shared_table_capacity": config.getint("Network", "shared_table_capacity", fallback=65536), # Ler a capacidade da tabela partilhada (opcional)
+		"replay_window_size": config.getint("Network", "replay_window_size", fallback=65536), # Ler o número máximo de pedidos guardados na janela de repetições (opcional)
 		"K": int(config.get("Key Maintenance", "K")), # Ler o parâmetro K e convertê-lo para inteiro
 		"M": config.get("Key Maintenance", "M"), # Ler o parâmetro M
 		"T": int(config.get("Key Maintenance", "T")), # Ler o parâmetro T e convertê-lo para inteiro
 		"V": int(config.get("Key Maintenance", "V")), # Ler o parâmetro V e convertê-lo para inteiro
-		"X": int(config.get("Key Maintenance", "X")) # Ler o parâmetro X e convertê-lo para inteiro
+		"X": int(config.get("Key Maintenance", "X")), # Ler o parâmetro X e convertê-lo para inteiro
+		"z_engine": config.get("Key Maintenance", "z_engine", fallback="auto").strip(), # Ler o motor da matriz Z (opcional)
+		"key_pool_low_watermark": config.getint("Key Maintenance", "key_pool_low_watermark", fallback=16), # Ler a marca inferior da reserva de chaves (opcional)
+		"key_pool_high_watermark": config.getint("Key Maintenance", "key_pool_high_watermark", fallback=64), # Ler a marca superior da reserva de chaves (opcional)
+		"z_cache_dir": config.get("Key Maintenance", "z_cache_dir", fallback="z_cache").strip(), # Ler o diretório da cache da matriz Z inicial (opcional, vazio = só em memória)
+		"journal": config.getboolean("Persistence", "journal", fallback=True), # Ler se as alterações à MIB são registadas num journal (opcional)
+		"journal_commit_interval": config.getint("Persistence", "journal_commit_interval", fallback=10), # Ler o intervalo entre commits do journal em milissegundos (opcional)
+		"journal_compact_size": config.getint("Persistence", "journal_compact_size", fallback=16777216), # Ler o tamanho do journal que provoca um novo snapshot (opcional)
+		"journal_sync_sets": config.getboolean("Persistence", "journal_sync_sets", fallback=True), # Ler se as respostas aos sets esperam pelo journal (opcional)
+		"metrics": config.getboolean("Metrics", "metrics", fallback=True), # Ler se o agente mede as latências e publica as métricas na MIB (opcional)
+		"metrics_sampling": config.getint("Metrics", "metrics_sampling", fallback=8), # Ler de quantos em quantos pedidos é medida a latência (opcional)
+		"metrics_dump_file": config.get("Metrics", "metrics_dump_file", fallback="").strip(), # Ler o ficheiro JSON com as métricas (opcional, vazio = sem ficheiro)
+		"metrics_dump_interval": config.getint("Metrics", "metrics_dump_interval", fallback=10), # Ler o intervalo entre escritas do ficheiro das métricas em segundos (opcional)
+		"consistency_checks": config.getboolean("Debug", "consistency_checks", fallback=False), # Ler o parâmetro consistency_checks (opcional)
+		"profile": config.getboolean("Debug", "profile", fallback=False), # Ler se o profiler por amostragem é ligado no arranque (opcional, SIGUSR1 alterna)
+		"profile_interval": config.getint("Debug", "profile_interval", fallback=5), # Ler o intervalo entre amostras do profiler em milissegundos (opcional)
+		"profile_file": config.get("Debug", "profile_file", fallback="snmpkeyshare_profile.folded").strip(), # Ler o ficheiro collapsed-stack do profiler (opcional)
+		"trace": config.getboolean("Debug", "trace", fallback=False), # Ler se o rastreio dos pedidos é ligado no arranque (opcional, SIGUSR2 alterna)
+		"trace_file": config.get("Debug", "trace_file", fallback="snmpkeyshare_trace.jsonl").strip(), # Ler o ficheiro JSON lines do rastreio (opcional)
+		"trace_threshold": config.getint("Debug", "trace_threshold", fallback=0), # Ler a duração mínima dos pedidos rastreados em microssegundos (opcional)
 	}
 
 	return parameters # Retornar o dicionário com os parâmetros
 
 
+class ReplayWindow:
+
+	"""Janela dos pedidos recentes (endereço do gestor, P), usada para rejeitar repetições dentro de V segundos
+
+	Os pedidos ficam num dicionário (procura O(1)) e, por ordem de registo, numa fila; os que têm V ou
+	mais segundos estão sempre no início da fila e são removidos a cada registo (O(1) amortizado), pelo
+	que a memória fica limitada aos pedidos dos últimos V segundos. Com capacity > 0 a janela tem no máximo capacity entradas; acima disso
+	é removida a mais antiga ainda dentro de V (a esse ritmo uma repetição pode deixar de ser detetada).
+	"""
+
+	def __init__(self, V, capacity=0):
+
+		"""Construtor da classe"""
+
+		if capacity < 0: # Se a capacidade for inválida
+			raise ValueError(f"A capacidade da janela de pedidos tem de ser positiva ou 0 (recebido {capacity}).") # Lançar uma exceção
+		self.V = V # Duração da janela (segundos)
+		self.capacity = capacity # Número máximo de entradas (0 = sem limite)
+		self.entries = {} # (endereço, P) -> tempo do pedido aceite
+		self.order = deque() # Chaves dos pedidos por ordem de registo
+		self.lock = threading.Lock() # Verificação e registo atómicos (pedidos atendidos em paralelo)
+		self.rejected = 0 # Repetições rejeitadas
+		self.expired = 0 # Entradas removidas por terem V ou mais segundos
+		self.evicted = 0 # Entradas removidas antes de V segundos por a janela estar cheia
+
+	def __len__(self):
+
+		"""Número de pedidos na janela"""
+
+		return len(self.entries)
+
+	def record(self, addr, P, accept, now):
+
+		"""Retorna o tempo do pedido (addr, P) se estiver na janela (uma repetição) ou None; se accept for
+		verdadeiro e não for uma repetição, regista-o"""
+
+		key = (addr, P) # Chave do pedido
+		entries, order = self.entries, self.order # Referências locais
+		with self.lock:
+			while order and now - entries[order[0]] >= self.V: # Remover as entradas que saíram da janela
+				del entries[order.popleft()]
+				self.expired += 1
+			last_request_time = entries.get(key) # Tempo do pedido anterior com a mesma chave
+			if last_request_time is not None: # Se for uma repetição
+				if accept:
+					self.rejected += 1
+			elif accept: # Se o pedido for aceite
+				entries[key] = now # Registar o pedido
+				order.append(key)
+				if self.capacity and len(order) > self.capacity: # Se a janela estiver cheia
+					del entries[order.popleft()] # Remover a entrada mais antiga
+					self.evicted += 1
+		return last_request_time # Retornar o tempo do pedido anterior
+
+	def metrics(self):
+
+		"""Retorna as métricas da janela"""
+
+		return {"entries": len(self.entries), "rejected": self.rejected, "expired": self.expired, "evicted": self.evicted}
+
+
 class SNMPKeyShareAgent:
 
 	"""Classe que representa um agente SNMPKeyShare"""
 
-	def __init__(self, K, M, T, V, X, mib):
+	def __init__(self, K, M, T, V, X, mib, consistency_checks=False, z_engine="auto", key_pool_low_watermark=0, key_pool_high_watermark=0, accept_pickle=False, max_response_size=1400, max_response_fragments=64, replay_window_size=65536, journal=False, journal_commit_interval=10, journal_compact_size=16777216, journal_sync_sets=True, metrics=True, metrics_sampling=8, metrics_dump_file="", metrics_dump_interval=10, profile=False, profile_interval=5, profile_file="snmpkeyshare_profile.folded", trace=False, trace_file="snmpkeyshare_trace.jsonl", trace_threshold=0, z_cache_dir=""):
 
 		"""Construtor da classe"""
 
@@ -43,40 +153,99 @@ class SNMPKeyShareAgent:
 		self.mib = mib
 		self.T = T # Intervalo de tempo entre atualizações
 		self.K = K # Tamanho da chave
-		self.M = M # Matriz de parâmetros
+		self.M = M # Chave mestra (a da matriz Z atual ou a da que está a ser preparada)
 		self.V = V # Intervalo de tempo para o qual o agente espera por uma resposta
 		self.X = X # Número máximo de chaves geradas
-		self.Z = generate_matrices(list(map(int, M)), K, use_zs=False) # Matriz Z
+		self.consistency_checks = consistency_checks # Verificar os contadores mantidos contra uma recontagem completa
+		self.z_cache_dir = z_cache_dir # Diretório da cache da matriz Z inicial (vazio = só em memória)
+		self.z_engine = z_engine # Motor da matriz Z (também usado nas rotações da chave mestra)
+		self.master_key_generation = 0 # Número da última rotação da chave mestra pedida (só a mais recente é aplicada)
+		if not 0 <= key_pool_low_watermark <= key_pool_high_watermark: # Se as marcas da reserva de chaves forem inválidas
+			raise ValueError(f"As marcas da reserva de chaves são inválidas (inferior {key_pool_low_watermark}, superior {key_pool_high_watermark}).") # Lançar uma exceção
+		self.key_lock = threading.Lock() # Protege Z, num_updates e a reserva de chaves
+		self.key_pool = deque() # Reserva de valores de chaves prontos a emitir
+		self.key_pool_alphabet = None # Alfabeto (primeiro carácter, cardinalidade) das chaves da reserva
+		self.key_pool_low_watermark = key_pool_low_watermark # Abaixo deste número de chaves a reserva é reposta (0 = sem reserva)
+		self.key_pool_high_watermark = key_pool_high_watermark # Número de chaves da reserva após a reposição
+		self.key_pool_hits = 0 # Chaves emitidas a partir da reserva
+		self.key_pool_misses = 0 # Chaves calculadas no pedido por a reserva estar vazia
+		self.journal = MIBJournal("mib_state.snap", "mib_state.wal", journal, journal_commit_interval / 1000, journal_compact_size, "mib_state.pkl") # Snapshot e journal da MIB
+		self.journal_sync_sets = journal and journal_sync_sets # As respostas aos sets só são enviadas com as alterações no disco
 		self.load_mib_state()  # Carregar o estado anterior da MIB
 		if self.mib is None: # Se não houver um estado anterior da MIB
 			self.mib = SNMPKeyShareMIB() # Criar uma nova MIB
 			self.set_mib_initial_values() # Definir os valores iniciais da MIB
 		else:
-			self.mib.setAdmin("1.1.0", int(datetime.now().strftime("%Y%m%d"))) # Obter a data atual
-			self.mib.setAdmin("1.2.0", int(datetime.now().strftime("%H%M%S"))) # Obter a hora atual
+			restart_date, restart_time = expiration_fields(time.time()) # Data e hora atuais (uma só leitura do relógio)
+			self.mib.setAdmin("1.1.0", restart_date) # systemRestartDate
+			self.mib.setAdmin("1.2.0", restart_time) # systemRestartTime
+			stored_M = str(self.mib.get("2.1.0")) # Chave mestra guardada (pode ter sido rodada com um set)
+			if stored_M != M and self.is_valid_master_key(stored_M): # Se for diferente da do ficheiro de configuração
+				print("A usar a chave mestra guardada na MIB (configMasterKey) em vez da do ficheiro de configuração.") # Imprimir uma mensagem informativa
+				self.M = stored_M
+		self.Z = select_z_engine(cached_matrices(list(map(int, self.M)), K, False, z_cache_dir), z_engine) # Matriz Z (listas ou array NumPy), calculada uma vez por (M, K)
 		self.running = False # Flag que indica se o agente está a correr
 		self.num_updates = 0 # Número de atualizações
-		self.current_key_id = 1 # ID da chave atual
+		self.current_key_id = self.mib.table.max_id() + 1 # ID da chave atual (a seguir às chaves carregadas)
 		self.addr = None # Endereço do gestor
 
-		self.last_request_times = {} # Dicionário que guarda os tempos das últimas requisições
+		self.replay_window = ReplayWindow(V, replay_window_size) # Pedidos (endereço, P) dos últimos V segundos
+		self.mib_lock = ReadWriteLock() # Gets partilham a MIB; sets e a thread de atualização têm acesso exclusivo
+		self.dropped_requests = 0 # Datagramas descartados por a fila de pedidos estar cheia
+		self.shared_store = None # Estado partilhado entre processos (modo com vários processos)
+		self.accept_pickle = accept_pickle # Aceitar PDUs codificados com pickle (gestores ainda não migrados)
+		if max_response_size < 256 or max_response_fragments < 0: # Se os limites das respostas forem inválidos
+			raise ValueError(f"Os limites das respostas são inválidos (tamanho {max_response_size}, fragmentos {max_response_fragments}).") # Lançar uma exceção
+		self.max_response_size = max_response_size # Tamanho máximo de um datagrama de resposta (respostas maiores são fragmentadas)
+		self.max_response_fragments = max_response_fragments # Número máximo de fragmentos da resposta a um get (0 = sem limite)
+		if metrics_sampling < 1: # Se a amostragem for inválida
+			raise ValueError(f"A amostragem das latências tem de ser positiva (recebido {metrics_sampling}).") # Lançar uma exceção
+		self.metrics = MetricsRegistry(metrics) # Contadores e histogramas de latência do agente
+		self.decode_sample = cycle([metrics] + [False] * (metrics_sampling - 1)) # Datagramas cuja descodificação é medida (um em cada metrics_sampling)
+		self.response_sample = cycle([metrics] + [False] * (metrics_sampling - 1)) # Lotes cujo processamento e codificação são medidos
+		self.request_latency = {1: self.metrics.histogram("get").add, 2: self.metrics.histogram("set").add} # Registo da latência do processamento de cada primitiva (Y)
+		self.decode_latency = self.metrics.histogram("decode").add # Registo da latência da descodificação dos PDUs
+		self.encode_latency = self.metrics.histogram("encode").add # Registo da latência da codificação das respostas
+		for name in ("get", "set", "response_errors", "invalid_pdus", "expired_keys", "master_key_rotations"): # Contadores (mantidos mesmo sem métricas)
+			self.metrics.counter(name)
+		self.count_get, self.count_set = self.metrics.counter("get"), self.metrics.counter("set") # Incremento dos contadores de gets e sets (atendimento dos pedidos)
+		self.metrics_dump_file = metrics_dump_file # Ficheiro JSON com as métricas (vazio = sem ficheiro)
+		self.metrics_dump_interval = metrics_dump_interval # Intervalo entre escritas do ficheiro (segundos)
+		self.metrics_dumped_at = 0 # Última escrita do ficheiro
+		if metrics: # Se as métricas forem publicadas
+			self.add_metrics_instances() # Subárvore 4 da MIB
+		if profile_interval <= 0 or trace_threshold < 0: # Se os parâmetros de depuração forem inválidos
+			raise ValueError(f"Os parâmetros de depuração são inválidos (intervalo do profiler {profile_interval}, limiar do rastreio {trace_threshold}).") # Lançar uma exceção
+		self.profile_interval = profile_interval # Intervalo entre amostras do profiler (ms)
+		self.profile_file = profile_file # Ficheiro collapsed-stack do profiler
+		self.trace_file = trace_file # Ficheiro JSON lines do rastreio dos pedidos
+		self.trace_threshold = trace_threshold # Duração mínima dos pedidos rastreados (µs)
+		self.profiler = None # Profiler por amostragem (None = desligado)
+		self.tracer = None # Rastreio dos pedidos (None = desligado)
+		self.debug_lock = threading.Lock() # Serializa a ativação do profiler e do rastreio
+		if journal: # Se as alterações forem registadas no journal
+			self.journal.start(self.mib) # Continuar o journal carregado (ou escrever um snapshot) e iniciar o commit em grupo
+		self.set_profiling(profile) # Profiler ligado no arranque
+		self.set_tracing(trace) # Rastreio ligado no arranque
 
 	def save_mib_state(self):
 
-		"""Guarda o estado atual da MIB para um arquivo"""
+		"""Guarda o estado atual da MIB num snapshot (e recomeça o journal)"""
 
-		with open('mib_state.pkl', 'wb') as f: # Abrir o arquivo mib_state.pkl para escrita
-			pickle.dump(self.mib, f) # Serializar a MIB e guardá-la no arquivo
+		with self.mib_lock.write_locked(): # Sem alterações à MIB durante o snapshot
+			self.journal.compact(self.mib) # Escrever o snapshot
 
 	def load_mib_state(self):
 
-		"""Carrega o estado anterior da MIB de um arquivo, se disponível"""
+		"""Carrega o estado anterior da MIB (snapshot e journal), se disponível"""
 
-		try:
-			with open('mib_state.pkl', 'rb') as f: # Abrir o arquivo mib_state.pkl para leitura
-				self.mib = pickle.load(f) # Deserializar a MIB e guardá-la na variável mib
-		except FileNotFoundError: # Se o arquivo não existir
+		mib = self.journal.load() # Snapshot com as alterações do journal repetidas
+		if mib is None: # Se não houver um estado anterior
 			print("Não foi encontrado nenhum estado da MIB anterior.\n") # Imprimir uma mensagem de erro
+			return
+		self.mib = mib # Usar a MIB carregada
+		if self.journal.replayed: # Se o journal tiver alterações posteriores ao snapshot
+			print(f"{self.journal.replayed} alterações repetidas a partir do journal.") # Imprimir uma mensagem informativa
 
 	def set_mib_initial_values(self):
 		
@@ -100,20 +269,59 @@ class SNMPKeyShareAgent:
 		"""Para a thread que atualiza as chaves"""
 
 		self.running = False  # Definir a flag running como False
-		self.key_update_thread.join() # Esperar que a thread termine
+		if self.key_update_thread is not None: # No modo asyncio as chaves são atualizadas por uma corrotina
+			self.key_update_thread.join() # Esperar que a thread termine
 		self.save_mib_state()  # Salvar o estado da MIB
 
 
-	def key_update_loop(self):
+	def key_update_tick(self):
 
-		"""Loop que atualiza as chaves"""
+		"""Uma atualização das chaves: processa Z, repõe a reserva e remove as chaves expiradas"""
 
-		while self.running: # Enquanto a flag running for True
+		start = time.perf_counter_ns() # Início da atualização
+		with self.key_lock: # Impedir a geração de chaves durante a atualização de Z
 			process_Z(self.Z) # Processar a matriz Z
+		z_done = time.perf_counter_ns() # Fim do processamento de Z
+		self.refill_key_pool() # Repor a reserva de chaves
+		with self.mib_lock.write_locked(): # Acesso exclusivo à MIB
+			if self.shared_store is not None: # Se a MIB for partilhada com outros processos
+				self.shared_store.sync_scalars(self.mib) # Aplicar os escalares alterados noutro processo
+				shared_M = str(self.mib.get("2.1.0")) # Chave mestra partilhada
+				if shared_M != self.M: # Se tiver sido rodada noutro processo
+					self.rotate_master_key(shared_M) # Rodar a chave mestra
+			expire_start = time.perf_counter_ns() # Início da remoção das chaves expiradas
 			self.expire_keys() # Remover as chaves expiradas
+			expire_done = time.perf_counter_ns() # Fim da remoção
 			self.update_number_valid_keys() # Atualizar o número de chaves válidas
+			if self.journal.needs_compaction(): # Se o journal tiver crescido demasiado
+				self.journal.compact(self.mib) # Novo snapshot e journal vazio
+		if self.metrics.enabled: # Se o agente medir as latências
+			self.metrics.histogram("process_Z").record(z_done - start)
+			self.metrics.histogram("expire_keys").record(expire_done - expire_start)
+			self.metrics.histogram("key_update_tick").record(time.perf_counter_ns() - start)
+			self.metrics.flush() # Agregar as latências e os contadores dos pedidos (limita a memória dos valores pendentes)
+		else:
+			self.metrics.flush_counters() # Os contadores são mantidos mesmo sem métricas (limita a memória dos incrementos pendentes)
+		if self.metrics_dump_file and time.time() - self.metrics_dumped_at >= self.metrics_dump_interval: # Se for altura de escrever o ficheiro das métricas
+			self.dump_metrics()
+
+	def key_update_loop(self):
+
+		"""Loop que atualiza as chaves"""
+
+		while self.running: # Enquanto a flag running for True
+			self.key_update_tick() # Atualizar as chaves
 			time.sleep(self.T/1000) # Esperar T milissegundos
 
+	async def key_update_task(self, executor):
+
+		"""Corrotina que atualiza as chaves a cada T milissegundos (modo asyncio); o cálculo corre no executor"""
+
+		loop = asyncio.get_running_loop() # Ciclo de eventos atual
+		while self.running: # Enquanto a flag running for True
+			await loop.run_in_executor(executor, self.key_update_tick) # Atualizar as chaves fora do ciclo de eventos
+			await asyncio.sleep(self.T/1000) # Esperar T milissegundos sem ocupar uma thread
+
 	def get_id_from_oid(self, oid):
 		
 		"""Retorna o ID de uma chave a partir do OID"""
@@ -124,30 +332,191 @@ class SNMPKeyShareAgent:
 		
 		"""Remove as chaves expiradas"""
 
-		current_date = int(datetime.now().strftime("%Y%m%d")) # Data atual
-		current_time = int(datetime.now().strftime("%H%M%S")) # Hora atual
+		expired = self.mib.remove_expired_entries_from_dataTableGeneratedKeys(int(time.time())) # Remover apenas as chaves cuja expiração já venceu
+		if expired: # Se alguma chave tiver sido removida
+			self.journal.append(OP_REMOVE, tuple(expired)) # Registar as remoções
+			self.metrics.count("expired_keys", len(expired))
+
+	def add_metrics_instances(self):
+
+		"""Publica as métricas na subárvore 4 da MIB (só de leitura, calculadas a cada get)
+
+		4.1.0 a 4.9.0: gets, sets, erros nas respostas, PDUs inválidos, datagramas descartados, repetições
+		rejeitadas, atualizações das chaves, chaves expiradas e chaves por expirar. 4.10.1.<coluna>.<linha>:
+		tabela das latências (1 nome, 2 medições, 3 p50, 4 p99, 5 p999 e 6 máximo, em microssegundos),
+		com uma linha por operação medida (METRICS_LATENCIES); as latências dos pedidos são medidas em um
+		de cada metrics_sampling pedidos, pelo que a coluna 2 não é o número de pedidos.
+		"""
+
+		histogram, counter = self.metrics.histogram, self.metrics.value # Referências locais
+		instances = {
+			"4.1.0": ("Int", lambda: counter("get")), # Gets atendidos
+			"4.2.0": ("Int", lambda: counter("set")), # Sets atendidos
+			"4.3.0": ("Int", lambda: counter("response_errors")), # Erros devolvidos nas respostas
+			"4.4.0": ("Int", lambda: counter("invalid_pdus")), # Datagramas com PDUs inválidos
+			"4.5.0": ("Int", lambda: self.dropped_requests), # Datagramas descartados (fila cheia)
+			"4.6.0": ("Int", lambda: self.replay_metrics()["rejected"]), # Repetições rejeitadas
+			"4.7.0": ("Int", lambda: histogram("key_update_tick").count), # Atualizações das chaves
+			"4.8.0": ("Int", lambda: counter("expired_keys")), # Chaves expiradas
+			"4.9.0": ("Int", lambda: len(self.mib.table.expiry_wheel)), # Chaves agendadas para expirar
+		}
+		for row, name in enumerate(METRICS_LATENCIES, 1): # Para cada operação medida
+			instances[f"4.10.1.1.{row}"] = ("Str", lambda name=name: name)
+			instances[f"4.10.1.2.{row}"] = ("Int", lambda name=name: histogram(name).count)
+			for column, q in ((3, 0.5), (4, 0.99), (5, 0.999)): # Percentis
+				instances[f"4.10.1.{column}.{row}"] = ("Int", lambda name=name, q=q: histogram(name).percentile(q) // 1000)
+			instances[f"4.10.1.6.{row}"] = ("Int", lambda name=name: histogram(name).percentile(1) // 1000) # Máximo
+		self.mib.add_computed_instances(instances) # Registar as instâncias
+
+	def metrics_report(self):
+
+		"""Retorna o relatório das métricas com os valores instantâneos do agente"""
+
+		gauges = {
+			"valid_keys": self.mib.count_valid_keys(), # Chaves válidas
+			"table_keys": len(self.mib.table), # Chaves na tabela
+			"expiry_backlog": len(self.mib.table.expiry_wheel), # Chaves agendadas para expirar
+			"dropped_requests": self.dropped_requests, # Datagramas descartados
+			"key_pool": len(self.key_pool), # Chaves na reserva
+			"key_pool_hits": self.key_pool_hits, # Chaves emitidas a partir da reserva
+			"key_pool_misses": self.key_pool_misses, # Chaves calculadas no pedido
+			"replay_window": self.replay_metrics(), # Janela de repetições
+			"journal": self.journal.metrics(), # Journal da MIB
+		}
+		return self.metrics.report(gauges)
+
+	def dump_metrics(self):
+
+		"""Escreve o relatório das métricas (JSON) no ficheiro metrics_dump_file"""
+
+		self.metrics_dumped_at = time.time() # Próxima escrita daqui a metrics_dump_interval segundos
+		try:
+			write_file_atomically(self.metrics_dump_file, json.dumps(self.metrics_report(), indent=1, sort_keys=True).encode("utf-8")) # Substituir o ficheiro
+		except OSError as e: # Um erro na escrita não pode parar a atualização das chaves
+			print(f"Não foi possível escrever as métricas em {self.metrics_dump_file}: {e}") # Imprimir uma mensagem de erro
+
+	def set_profiling(self, enabled):
+
+		"""Liga ou desliga o profiler por amostragem; ao desligar as pilhas são escritas em profile_file"""
+
+		with self.debug_lock:
+			if enabled and self.profiler is None: # Ligar
+				self.profiler = StackSampler(self.profile_file, self.profile_interval / 1000)
+				self.profiler.start()
+				print(f"Profiler ligado (uma amostra a cada {self.profile_interval} ms, ficheiro {self.profile_file}).") # Imprimir uma mensagem informativa
+			elif not enabled and self.profiler is not None: # Desligar
+				profiler, self.profiler = self.profiler, None
+				try:
+					profiler.stop() # Parar a thread e escrever o ficheiro
+					print(f"Profiler desligado ({profiler.samples} amostras em {profiler.path}).") # Imprimir uma mensagem informativa
+				except OSError as e: # Se o ficheiro não puder ser escrito
+					print(f"Não foi possível escrever o perfil em {profiler.path}: {e}") # Imprimir uma mensagem de erro
+
+	def set_tracing(self, enabled):
+
+		"""Liga ou desliga o rastreio dos pedidos (linhas JSON em trace_file); desligado não tem qualquer custo"""
+
+		with self.debug_lock:
+			if enabled and self.tracer is None: # Ligar
+				tracer = RequestTracer(self, self.trace_file, self.trace_threshold * 1000)
+				try:
+					tracer.install() # Abrir o ficheiro e medir as fases dos pedidos
+				except OSError as e: # Se o ficheiro não puder ser aberto
+					print(f"Não foi possível abrir o ficheiro do rastreio {self.trace_file}: {e}") # Imprimir uma mensagem de erro
+					return
+				self.tracer = tracer
+				print(f"Rastreio dos pedidos ligado (pedidos com pelo menos {self.trace_threshold} µs, ficheiro {self.trace_file}).") # Imprimir uma mensagem informativa
+			elif not enabled and self.tracer is not None: # Desligar
+				tracer, self.tracer = self.tracer, None
+				tracer.uninstall() # Repor os métodos e fechar o ficheiro
+				print(f"Rastreio dos pedidos desligado ({tracer.written} pedidos em {tracer.path}).") # Imprimir uma mensagem informativa
+
+	def toggle_profiling(self):
+
+		"""Alterna o profiler por amostragem (SIGUSR1)"""
+
+		self.set_profiling(self.profiler is None)
+
+	def toggle_tracing(self):
+
+		"""Alterna o rastreio dos pedidos (SIGUSR2)"""
+
+		self.set_tracing(self.tracer is None)
+
+	def stop_debugging(self):
+
+		"""Desliga o profiler e o rastreio, escrevendo os ficheiros"""
+
+		self.set_profiling(False)
+		self.set_tracing(False)
 
-		mib = self.mib.mib.copy() # Copiar a MIB para uma nova variável
-		for entry in mib: # Para cada entrada da MIB
-			if entry.startswith("3.2.1.1"): # Se a entrada for uma chave
-				ident = self.get_id_from_oid(entry) # Obter o ID da chave
-				key_expiration_date = int(self.mib.get(f"3.2.1.4.{ident}")) # Data de expiração da chave
-				key_expiration_time = int(self.mib.get(f"3.2.1.5.{ident}")) # Hora de expiração da chave
-				if key_expiration_date < current_date or (key_expiration_date == current_date and key_expiration_time < current_time): # Se a chave estiver expirada
-					self.mib.remove_entry_from_dataTableGeneratedKeys(entry) # Remover a chave da MIB
+	def is_valid_master_key(self, M):
+
+		"""Verifica se M pode ser a chave mestra do agente (2K dígitos)"""
+
+		return len(M) == 2 * self.K and M.isdigit() and M.isascii()
+
+	def rotate_master_key(self, M):
+
+		"""Roda a chave mestra para M sem parar o agente (nada a fazer se M já for a chave mestra ou for inválida)
+
+		A matriz Z inicial de M é preparada numa thread (a partir da cache, se existir) enquanto os pedidos
+		continuam a ser atendidos com a matriz atual; a troca é feita com key_lock, que process_Z também
+		usa, pelo que acontece entre duas atualizações e nunca a meio de uma geração de chaves. As chaves
+		da reserva, calculadas com a matriz anterior, são descartadas na troca. A matriz Z inicial da chave
+		anterior é removida das caches. Se M mudar outra vez antes da troca só a rotação mais recente é
+		aplicada.
+		"""
+
+		if M == self.M or not self.is_valid_master_key(M): # Chave atual ou inválida
+			return
+		try:
+			invalidate_matrices(list(map(int, self.M)), self.K, False, self.z_cache_dir) # A chave anterior deixa de ser usada
+		except ValueError: # A chave anterior não era uma sequência de dígitos (não podia estar na cache)
+			pass
+		except OSError as e: # Se o ficheiro da cache não puder ser removido
+			print(f"Não foi possível remover a matriz Z da chave mestra anterior de {self.z_cache_dir}: {e}") # Imprimir uma mensagem de erro
+		self.M = M # Chave mestra em preparação
+		self.master_key_generation += 1
+		threading.Thread(target=self.rebuild_master_key, args=(M, self.master_key_generation), name="master-key-rotation", daemon=True).start()
+
+	def rebuild_master_key(self, M, generation):
+
+		"""Thread da rotação da chave mestra: calcula a matriz Z inicial de M e troca-a pela atual"""
+
+		start = time.perf_counter_ns() # Início da preparação
+		Z = select_z_engine(cached_matrices(list(map(int, M)), self.K, False, self.z_cache_dir), self.z_engine) # Nova matriz Z
+		built = time.perf_counter_ns() # Fim da preparação (início da troca)
+		with self.key_lock: # Entre duas atualizações de Z e fora das gerações de chaves
+			superseded = generation != self.master_key_generation # Foi pedida uma rotação mais recente
+			if not superseded:
+				self.Z = Z # Trocar a matriz
+				self.key_pool.clear() # Chaves calculadas com a matriz anterior
+		swapped = time.perf_counter_ns() # Fim da troca
+		if superseded: # M não chegou a ser usada
+			if M == self.M: # Se a rotação mais recente for para a mesma chave
+				return
+			try:
+				invalidate_matrices(list(map(int, M)), self.K, False, self.z_cache_dir) # Guardada na cache depois de a rotação seguinte a ter removido
+			except OSError as e: # Se o ficheiro da cache não puder ser removido
+				print(f"Não foi possível remover a matriz Z de uma chave mestra substituída de {self.z_cache_dir}: {e}") # Imprimir uma mensagem de erro
+			return
+		self.metrics.count("master_key_rotations")
+		if self.metrics.enabled: # Se o agente medir as latências
+			self.metrics.histogram("master_key_rebuild").record(built - start)
+			self.metrics.histogram("master_key_swap").record(swapped - built)
+		print(f"Chave mestra rodada (matriz Z preparada em {(built - start) / 1e6:.1f} ms, troca em {(swapped - built) / 1e3:.0f} µs).") # Imprimir uma mensagem informativa
 
 	def count_number_valid_keys(self):
 		
 		"""Conta o número de chaves válidas"""
 
-		count = 0 # Inicializar o contador
-		for entry in self.mib.mib: # Para cada entrada da MIB
-			if entry.startswith("3.2.1.1"): # Se a entrada for uma chave
-				ident = self.get_id_from_oid(entry) # Obter o ID da chave
-				key_visibility = self.mib.get(f"3.2.1.6.{ident}") # Visibilidade da chave
-				if key_visibility == 1 or key_visibility == 2: # Se a chave for visível
-					count += 1 # Incrementar o contador
-		return count # Retornar o contador
+		if self.consistency_checks: # Se o modo de verificação estiver ativo
+			try:
+				self.mib.verify_visibility_counts() # Comparar os contadores com uma recontagem completa
+			except ValueError as e: # Se os contadores estiverem inconsistentes
+				print(e) # Imprimir o erro (os contadores já foram corrigidos)
+		return self.mib.count_valid_keys() # Retornar o contador mantido pela MIB
 	
 	def update_number_valid_keys(self):
 		
@@ -161,43 +530,156 @@ class SNMPKeyShareAgent:
 
 		return time.time() - self.start_time # Retornar o tempo de atividade do agente
 	
-	def calculate_key_expiration_date(self):
-
-		"""Calcula a data de expiração de uma chave"""	
+	def calculate_key_expiration(self):
 
-		new_date = datetime.now() + timedelta(seconds=self.mib.get("1.6.0")) # Calcular a nova data
-		return int(new_date.strftime("%Y%m%d")) # Retornar a nova data
+		"""Calcula o instante de expiração de uma chave gerada agora (segundos desde a época); a data e a hora
+		de expiração (3.2.1.4 e 3.2.1.5) são calculadas a partir dele só quando são lidas"""
 
-	def calculate_key_expiration_time(self):
-
-		"""Calcula o tempo de expiração de uma chave"""
-
-		new_time = datetime.now() + timedelta(seconds=self.mib.get("1.6.0")) # Calcular o novo tempo
-		return int(new_time.strftime("%H%M%S")) # Retornar o novo tempo
+		return int(time.time()) + self.mib.get("1.6.0") # Instante atual + tempo de vida das chaves
 	
 	def check_limits(self):
 		
 		"""Verifica se o número de chaves geradas está dentro dos limites"""
 
-		if self.count_number_valid_keys() >= self.mib.get("1.5.0"): # Se o número de chaves geradas for maior ou igual ao limite
+		if self.mib.count_valid_keys() >= self.mib.get("1.5.0"): # Se o número de chaves geradas for maior ou igual ao limite
 			return False # Retornar False
 		else: # Se o número de chaves geradas for menor que o limite
 			return True # Retornar True
 
+	def current_alphabet(self):
+
+		"""Retorna o alfabeto atual das chaves: (primeiro carácter, cardinalidade)"""
+
+		return self.mib.get("2.2.0"), self.mib.get("2.3.0") # configFirstCharOfKeysAlphabet e configCardinalityOfKeysAlphabet
+
+	def refill_key_pool(self):
+
+		"""Repõe a reserva de chaves até à marca superior quando desce abaixo da marca inferior
+		(chamado pela thread de atualização, a única que altera Z, pelo que as chaves são calculadas fora do lock;
+		uma rotação da chave mestra troca Z, e as chaves calculadas com a matriz anterior são descartadas)"""
+
+		with self.mib_lock.read_locked(): # Ler a MIB
+			alphabet = self.current_alphabet() # Alfabeto atual
+		with self.key_lock: # Reservar os valores de N
+			if self.key_pool_alphabet != alphabet: # Se o alfabeto tiver mudado
+				self.key_pool.clear() # Descartar as chaves com o alfabeto anterior
+				self.key_pool_alphabet = alphabet # Registar o novo alfabeto
+			if len(self.key_pool) >= self.key_pool_low_watermark: # Se a reserva ainda estiver acima da marca inferior
+				return # Não é preciso repor
+			missing = self.key_pool_high_watermark - len(self.key_pool) # Chaves em falta
+			first_N = self.reserve_updates(missing) # Reservar os valores de N
+			Z = self.Z # Matriz atual (pode ser trocada por uma rotação da chave mestra)
+		keys = generate_keys(Z, first_N, missing, *alphabet) # Calcular as chaves
+		with self.key_lock: # Guardar as chaves
+			if self.key_pool_alphabet == alphabet and self.Z is Z: # Se o alfabeto e a matriz não tiverem mudado entretanto
+				self.key_pool.extend(keys) # Acrescentar as chaves à reserva
+
+	def reserve_updates(self, count):
+
+		"""Reserva count valores consecutivos de N e retorna o primeiro (chamado com key_lock); com vários processos
+		os valores são reservados no estado partilhado, para que processos com a mesma Z não gerem as mesmas chaves"""
+
+		if self.shared_store is not None: # Se houver vários processos
+			return self.shared_store.allocate("next_update", count) # Reservar no estado partilhado
+		first_N = self.num_updates # Primeiro valor de N reservado
+		self.num_updates += count # Incrementar o número de atualizações
+		return first_N # Retornar o primeiro valor
+
+	def reserve_key_ids(self, count):
+
+		"""Reserva count keyIds consecutivos e retorna o primeiro (no estado partilhado, se houver vários processos)"""
+
+		if self.shared_store is not None: # Se houver vários processos
+			return self.shared_store.allocate("next_key_id", count) # Reservar no estado partilhado
+		first_key_id = self.current_key_id # Primeiro keyId reservado
+		self.current_key_id += count # Incrementar o ID da chave
+		return first_key_id # Retornar o primeiro keyId
+
+	def record_request(self, P, Y, current_time, addr):
+
+		"""Retorna o tempo da última requisição P do gestor addr nos últimos V segundos (ou None) e regista
+		esta, se for um get ou set aceite, de forma atómica (na janela partilhada, se houver vários processos)"""
+
+		accept = Y in (1, 2) # Só os gets e sets ficam registados
+		if self.shared_store is not None: # Se houver vários processos
+			return self.shared_store.record_request(addr, P, accept, current_time, self.V) # Janela partilhada
+		return self.replay_window.record(addr, P, accept, current_time) # Janela local
+
+	def replay_metrics(self):
+
+		"""Retorna as métricas da janela de repetições (partilhada, se houver vários processos)"""
+
+		if self.shared_store is not None: # Se houver vários processos
+			return self.shared_store.replay_metrics()
+		return self.replay_window.metrics()
+
+	def generate_and_update_keys(self, count):
+
+		"""Obtém count chaves (da reserva e, se não chegar, calculadas a partir do estado atual de Z para
+		valores consecutivos de N), com um único instante de expiração"""
+
+		alphabet = self.current_alphabet() # Alfabeto atual
+		with self.key_lock: # Impedir a atualização de Z e a reposição da reserva
+			if self.key_pool_alphabet != alphabet: # Se a reserva tiver chaves com outro alfabeto
+				self.key_pool.clear() # Descartar as chaves da reserva
+				self.key_pool_alphabet = alphabet # Registar o novo alfabeto
+			hits = min(count, len(self.key_pool)) # Chaves disponíveis na reserva
+			keys = [self.key_pool.popleft() for _ in range(hits)] # Retirar as chaves da reserva
+			if hits < count: # Se a reserva não chegar
+				keys += generate_keys(self.Z, self.reserve_updates(count - hits), count - hits, *alphabet) # Calcular as restantes chaves
+			self.key_pool_hits += hits # Contar as chaves servidas pela reserva
+			self.key_pool_misses += count - hits # Contar as chaves calculadas no pedido
+		return keys, self.calculate_key_expiration() # Retornar as chaves e o instante de expiração (comum ao lote)
+
 	def generate_and_update_key(self):
 		"""Gera e atualiza uma chave"""
 		
 		if self.check_limits(): # Se o número de chaves geradas estiver dentro dos limites
-			key = generate_key(self.Z, self.num_updates, self.mib.get("2.2.0"), self.mib.get("2.3.0")) # Gerar a chave
+			keys, key_expiration = self.generate_and_update_keys(1) # Gerar a chave
 
-			self.num_updates += 1 # Incrementar o número de atualizações
-			key_expiration_date = self.calculate_key_expiration_date() # Calcular a data de expiração da chave
-			key_expiration_time = self.calculate_key_expiration_time() # Calcular o tempo de expiração da chave
-
-			return key, key_expiration_date, key_expiration_time # Retornar a chave, a data de expiração e o tempo de expiração
+			return keys[0], key_expiration # Retornar a chave e o instante de expiração
 		else: # Se o número de chaves geradas estiver fora dos limites
-			raise ValueError(f"O número de chaves geradas ({self.count_number_valid_keys()}) está acima do limite ({self.mib.get('1.5.0')}).") # Lançar uma exceção
-		 
+			raise ValueError(f"O número de chaves geradas ({self.mib.count_valid_keys()}) está acima do limite ({self.mib.get('1.5.0')}).") # Lançar uma exceção
+
+	def generate_and_add_keys(self, visibilities, addr=None):
+
+		"""Gera e adiciona à MIB uma chave por visibilidade pedida (requerente addr), com uma única verificação
+		de limites, um único cálculo de expiração e uma única inserção na tabela; retorna, para cada pedido,
+		o par (OID, visibilidade) da nova chave ou a exceção que impediu a sua geração"""
+
+		if addr is None: # Se o endereço do gestor não for indicado
+			addr = self.addr # Usar o endereço do último gestor
+
+		results = [None] * len(visibilities) # Resultado de cada pedido
+		limit = self.mib.get("1.5.0") # Número máximo de chaves válidas
+		valid = self.mib.count_valid_keys() # Número de chaves válidas (só as visíveis contam para o limite)
+		accepted = [] # Pedidos aceites: (posição, visibilidade)
+
+		for idx, visibility in enumerate(visibilities): # Para cada pedido
+			try:
+				visibility = convert_value("Int", visibility) # Visibilidade como inteiro
+				if visibility not in (0, 1, 2): # Se a visibilidade for inválida
+					raise ValueError(f"A visibilidade da chave tem de ser 0, 1 ou 2 (recebido {visibility}).") # Lançar uma exceção
+				if valid >= limit: # Se o número de chaves geradas estiver fora dos limites
+					raise ValueError(f"O número de chaves geradas ({valid}) está acima do limite ({limit}).") # Lançar uma exceção
+			except ValueError as e: # Se o pedido for rejeitado
+				results[idx] = e # Guardar o erro
+				continue # Passar ao pedido seguinte
+			accepted.append((idx, visibility)) # Aceitar o pedido
+			if visibility != 0: # Se a chave for visível
+				valid += 1 # Conta para o limite dos pedidos seguintes
+
+		if accepted: # Se houver chaves a gerar
+			keys, key_expiration = self.generate_and_update_keys(len(accepted)) # Gerar as chaves
+			first_key_id = self.reserve_key_ids(len(accepted)) # keyIds das chaves
+			visibilities = [visibility for _, visibility in accepted] # Visibilidade de cada chave
+			entries = self.mib.add_entries_to_dataTableGeneratedKeys(first_key_id, keys, addr, key_expiration, visibilities) # Adicionar as chaves à MIB
+			self.journal.append(OP_ADD, first_key_id, tuple(keys), addr, key_expiration, tuple(visibilities)) # Registar a inserção
+			for (idx, _), entry in zip(accepted, entries): # Para cada chave gerada
+				results[idx] = entry # Guardar o par (OID, visibilidade)
+
+		return results # Retornar os resultados
+
 	def get_key_info(self, oid, addr): 
 		
 		"""Retorna a informação de uma chave"""
@@ -213,9 +695,12 @@ class SNMPKeyShareAgent:
 		else: # Se a chave for pública
 			pass # Não fazer nada
 
-	def snmpkeyshare_response(self, P, NL_or_NW, L_or_W, Y):
+	def snmpkeyshare_response(self, P, NL_or_NW, L_or_W, Y, addr=None):
 
-		"""Processa um PDU SNMPKeyShare e retorna a resposta"""
+		"""Processa um PDU SNMPKeyShare enviado pelo gestor com endereço addr e retorna a resposta"""
+
+		if addr is None: # Se o endereço do gestor não for indicado
+			addr = self.addr # Usar o endereço do último gestor
 
 		# L = GET
 		# W = SET
@@ -228,13 +713,14 @@ class SNMPKeyShareAgent:
 		# Se o PDU recebido for um snmpkeyshare-get
 
 		current_time = time.time() # Tempo atual
-		last_request_time = self.last_request_times.get(P) # Tempo da última requisição
+		last_request_time = self.record_request(P, Y, current_time, addr) # Tempo da última requisição (regista esta, se for aceite)
 		try: 
 			if last_request_time is not None and current_time - last_request_time < self.V: # Se o tempo da última requisição for menor que o intervalo de tempo V
 				raise ValueError(f"Requisição {P} foi feita há menos de {self.V} segundos") # Lançar uma exceção
 			else: # Se o tempo da última requisição for maior que o intervalo de tempo V
 				if Y == 1: # Se o PDU recebido for um snmpkeyshare-get
 
+					self.count_get(1) # Contar o get
 					L = [] # Lista de instâncias e valores associados
 
 					for pair in L_or_W: # Para cada par da lista de instâncias e valores associados
@@ -242,7 +728,7 @@ class SNMPKeyShareAgent:
 						if n == 0: # Se o número de instâncias for 0
 							if oid.startswith("3.2.1."): # Se o OID for de uma chave
 								try: 
-									self.get_key_info(oid, self.addr) # Verificar se a chave é visível
+									self.get_key_info(oid, addr) # Verificar se a chave é visível
 									value = self.mib.get(oid) # Obter o valor da chave
 									L.append((oid, value)) # Adicionar o par (OID, valor) à lista de instâncias e valores associados
 								except ValueError as e: # Se a chave não for visível
@@ -258,7 +744,7 @@ class SNMPKeyShareAgent:
 						else: # Se o número de instâncias for diferente de 0
 							if oid.startswith("3.2.1."): # Se o OID for de uma chave
 								try:
-									self.get_key_info(oid, self.addr) # Verificar se a chave é visível
+									self.get_key_info(oid, addr) # Verificar se a chave é visível
 									value = self.mib.get(oid) # Obter o valor da chave
 									L.append((oid, value)) # Adicionar o par (OID, valor) à lista de instâncias e valores associados
 								except ValueError as e: # Se a chave não for visível
@@ -274,7 +760,7 @@ class SNMPKeyShareAgent:
 							for i in range(n): # Para cada instância
 								if oid.startswith("3.2.1."): # Se o OID for de uma chave
 									try:
-										self.get_key_info(oid, self.addr) # Verificar se a chave é visível
+										self.get_key_info(oid, addr) # Verificar se a chave é visível
 										oid, value = self.mib.get_next(oid, self.get_id_from_oid(oid)) # Obter o OID e o valor da chave
 										L.append((oid, value)) # Adicionar o par (OID, valor) à lista de instâncias e valores associados
 									except ValueError as e: # Se a chave não for visível
@@ -288,41 +774,51 @@ class SNMPKeyShareAgent:
 										R.append((oid, e)) # Adicionar o par (OID, erro) à lista de erros
 										NR += 1 # Incrementar o número de erros
 					if NR == 0: # Se o número de erros for 0
-						self.last_request_times[P] = current_time # Atualizar o tempo da última requisição
 						return SNMPKeySharePDU(P=P, Y=0, NL_or_NW=len(L), L_or_W=L, NR=NR, R=[]) # Retornar o PDU de resposta
 					else: # Se o número de erros for diferente de 0
-						self.last_request_times[P] = current_time # Atualizar o tempo da última requisição
+						self.metrics.count("response_errors", NR) # Contar os erros
 						return SNMPKeySharePDU(P=P, Y=0, NL_or_NW=len(L), L_or_W=L, NR=NR, R=R) # Retornar o PDU de resposta
 
 				# Se o PDU recebido for um snmpkeyshare-set
 
 				elif Y == 2: 
 
+					self.count_set(1) # Contar o set
 					W = [] # Lista de instâncias e valores associados
 
-					for pair in L_or_W: # Para cada par da lista de instâncias e valores associados
-						oid, value = pair # Obter o OID e o valor
+					pairs = list(L_or_W) # Pares (OID, valor) do pedido
+					idx = 0 # Posição do par atual
+					while idx < len(pairs): # Para cada par da lista de instâncias e valores associados
+						oid, value = pairs[idx] # Obter o OID e o valor
 						if oid == "3.2.1.6.0": # Se o OID for o da visibilidade de uma chave
-							try: 
-								key, key_expiration_date, key_expiration_time = self.generate_and_update_key() # Gerar e atualizar uma chave
-								oid, value = self.mib.add_entry_to_dataTableGeneratedKeys(self.current_key_id, key, self.addr, key_expiration_date, key_expiration_time, value) # Adicionar a chave à MIB
-								self.current_key_id += 1 # Incrementar o ID da chave
-								W.append((oid, value)) # Adicionar o par (OID, valor) à lista de instâncias e valores associados
-							except ValueError as e: # Se o número de chaves geradas estiver fora dos limites
-								R.append((oid, e)) # Adicionar o par (OID, erro) à lista de erros
-								NR += 1 # Incrementar o número de erros
+							end = idx # Fim da sequência de pedidos de chaves consecutivos
+							while end < len(pairs) and pairs[end][0] == "3.2.1.6.0": # Enquanto o par seguinte também pedir uma chave
+								end += 1
+							results = self.generate_and_add_keys([value for _, value in pairs[idx:end]], addr) # Gerar as chaves da sequência num único lote
+							for result in results: # Para cada chave pedida
+								if isinstance(result, ValueError): # Se a chave não tiver sido gerada
+									R.append((oid, result)) # Adicionar o par (OID, erro) à lista de erros
+									NR += 1 # Incrementar o número de erros
+								else: # Se a chave tiver sido gerada
+									W.append(result) # Adicionar o par (OID, valor) à lista de instâncias e valores associados
+							idx = end # Continuar depois da sequência
 						else: # Se o OID não for o da visibilidade de uma chave
 							try: 
+								if oid == "2.1.0" and not self.is_valid_master_key(str(value)): # Se a nova chave mestra for inválida
+									raise ValueError(f"A chave mestra tem de ter {2 * self.K} dígitos.") # Lançar uma exceção
 								self.mib.set(oid, value) # Atualizar o valor da instância
+								self.journal.append(OP_SET, oid, self.mib.get(oid)) # Registar a alteração (valor convertido)
 								W.append((oid, value)) # Adicionar o par (OID, valor) à lista de instâncias e valores associados
+								if oid == "2.1.0": # Se for a chave mestra
+									self.rotate_master_key(str(self.mib.get(oid))) # Preparar a nova matriz Z em segundo plano
 							except ValueError as e: # Se a instância não existir
 								R.append((oid, e)) # Adicionar o par (OID, erro) à lista de erros
 								NR += 1 # Incrementar o número de erros
+							idx += 1 # Passar ao par seguinte
 					if NR == 0: # Se o número de erros for 0
-						self.last_request_times[P] = current_time # Atualizar o tempo da última requisição
 						return SNMPKeySharePDU(P=P, Y=0, NL_or_NW=len(W), L_or_W=W, NR=1, R=[(0, 0)]) # Retornar o PDU de resposta
 					else:
-						self.last_request_times[P] = current_time # Atualizar o tempo da última requisição
+						self.metrics.count("response_errors", NR) # Contar os erros
 						return SNMPKeySharePDU(P=P, Y=0, NL_or_NW=len(W), L_or_W=W, NR=NR, R=R) # Retornar o PDU de resposta
 
 				# Se o PDU recebido for um snmpkeyshare-response
@@ -339,38 +835,427 @@ class SNMPKeyShareAgent:
 
 			R.append((0, e)) # Adicionar o par (OID, erro) à lista de erros
 			NR += 1 # Incrementar o número de erros
+			self.metrics.count("response_errors", NR) # Contar os erros
 			return SNMPKeySharePDU(P=P, Y=0, NL_or_NW=0, L_or_W=[], NR=NR, R=R) # Retornar o PDU de resposta
 
-	def serve(self, ip, port):
+	def decode_datagram(self, data, addr):
+
+		"""Descodifica um datagrama e retorna (PDU, codificação), ou None se o datagrama for inválido"""
+
+		self.addr = addr[0]  # Endereço do último gestor
+
+		wire_format = detect_wire_format(data) # Codificação usada pelo gestor (a resposta usa a mesma)
+		start = time.perf_counter_ns() if next(self.decode_sample) else 0 # Início da descodificação (só nos datagramas da amostra)
+		try:
+			pdu = SNMPKeySharePDU.deserialize(data, allow_pickle=self.accept_pickle) # Descodificar o PDU
+		except ValueError as e: # Se o PDU for inválido ou a codificação não for aceite
+			self.metrics.count("invalid_pdus")
+			print(f"PDU inválido recebido de {addr[0]}: {e}") # Imprimir uma mensagem de erro
+			return None # Ignorar o datagrama
+		if start: # Se o agente medir as latências
+			self.decode_latency(time.perf_counter_ns() - start)
+		return pdu, wire_format # Retornar o PDU e a codificação
+
+	def encode_response(self, request_pdu, response_pdu, wire_format):
+
+		"""Codifica uma resposta nos datagramas a enviar (nenhum se não houver resposta)
+
+		Na codificação binária as respostas maiores do que max_response_size são divididas em fragmentos;
+		as respostas a gets têm no máximo max_response_fragments fragmentos (as instâncias que não couberem
+		são omitidas e assinaladas por um erro no último fragmento, e o gestor continua a partir do último
+		OID recebido), as respostas a sets são sempre completas. Os gestores pickle não sabem juntar fragmentos e recebem a resposta num só datagrama.
+		"""
+
+		if response_pdu is None: # Se não houver resposta
+			return []
+		if wire_format == "pickle": # Se o gestor ainda usar pickle
+			return [response_pdu.serialize(wire_format)]
+		return response_pdu.serialize_fragments(self.max_response_size, self.max_response_fragments if request_pdu.Y == 1 else 0) # Datagramas da resposta
+
+	def respond(self, pdu, wire_format, addr, blocking=True):
+
+		"""Processa um PDU com o lock da MIB adequado e retorna os datagramas da resposta (nenhum se não houver resposta);
+		com blocking falso retorna None se o pedido tivesse de esperar pelo lock (ver respond_batch)"""
+
+		responses = self.respond_batch([(pdu, wire_format, addr)], blocking) # Lote com um pedido
+		return None if responses is None else responses[0]
+
+	def respond_batch(self, requests, blocking=True):
+
+		"""Processa um lote de pedidos (PDU, codificação, endereço) com uma única aquisição do lock da MIB
+		(exclusivo se o lote tiver algum set) e retorna os datagramas de cada resposta (nenhum se não houver resposta)
+
+		Com blocking falso o lote só é processado se for só de gets e o lock de leitura estiver livre; caso
+		contrário retorna None sem esperar (usado no ciclo de eventos do modo asyncio). Um pedido cujo
+		processamento ou codificação lance uma exceção fica sem resposta, sem afetar os restantes do lote.
+		"""
+
+		writes = any(pdu.Y == 2 for pdu, _, _ in requests) # Se algum pedido alterar a MIB
+		if not blocking: # Se o chamador não puder esperar pelo lock
+			if writes or not self.mib_lock.try_acquire_read(): # Se o lote tivesse de esperar
+				return None
+			mib_lock = self.mib_lock.read_locked(acquired=True) # Leitor já registado
+		else:
+			mib_lock = self.mib_lock.write_locked() if writes else self.mib_lock.read_locked() # Sets alteram a MIB, gets só a leem
+		with mib_lock:
+			if self.shared_store is not None: # Se a MIB for partilhada com outros processos
+				self.shared_store.sync_scalars(self.mib) # Aplicar os escalares alterados noutro processo
+			sampled = next(self.response_sample) # Medir as latências deste lote
+			if sampled: # Se o lote pertencer à amostra
+				response_pdus = self.measured_responses(requests) # Processar os PDUs, medindo cada um
+			else:
+				respond = self.snmpkeyshare_response # Referência local
+				response_pdus = [] # Resposta a cada pedido
+				for pdu, _, addr in requests: # Para cada pedido
+					try:
+						response_pdus.append(respond(pdu.P, pdu.NL_or_NW, pdu.L_or_W, pdu.Y, addr[0])) # Processar o PDU e gerar a resposta
+					except Exception as e: # Um pedido com erro não pode terminar o agente nem o lote
+						print(f"Erro ao atender o pedido de {addr[0]}: {e}") # Imprimir uma mensagem de erro
+						response_pdus.append(None) # Pedido sem resposta
+			if self.shared_store is not None and writes: # Se um set puder ter alterado escalares
+				self.shared_store.publish_scalars(self.mib) # Publicar os escalares para os outros processos
+			sequence = self.journal.appended # Último registo do journal com as alterações do lote
+		if writes and self.journal_sync_sets: # Se as respostas aos sets só puderem sair com as alterações no disco
+			self.journal.wait_durable(sequence) # Esperar pelo commit em grupo
+
+		clock, record = time.perf_counter_ns, self.encode_latency # Referências locais
+		responses = [] # Datagramas de cada resposta
+		start = clock() if sampled else 0 # Início da primeira codificação (só medida nos lotes da amostra)
+		for response_pdu, (pdu, wire_format, addr) in zip(response_pdus, requests): # Para cada resposta (codificada fora do lock)
+			try:
+				responses.append(self.encode_response(pdu, response_pdu, wire_format))
+			except Exception as e: # Resposta que não pode ser codificada
+				print(f"Erro ao codificar a resposta para {addr[0]}: {e}") # Imprimir uma mensagem de erro
+				responses.append([]) # Pedido sem resposta
+			if sampled: # Se o lote pertencer à amostra
+				end = clock() # O fim de uma codificação é o início da seguinte
+				record(end - start)
+				start = end
+		return responses
+
+	def measured_responses(self, requests):
+
+		"""Processa um lote de pedidos como em respond_batch (com o lock da MIB), registando a latência de
+		cada primitiva; uma leitura do relógio por pedido (a resposta a um pedido com erro é None)"""
+
+		clock, latencies, respond = time.perf_counter_ns, self.request_latency, self.snmpkeyshare_response # Referências locais
+		response_pdus = [] # Resposta a cada pedido
+		start = clock() # Início do primeiro pedido
+		for pdu, _, addr in requests: # Para cada pedido
+			Y = pdu.Y # Primitiva
+			try:
+				response_pdus.append(respond(pdu.P, pdu.NL_or_NW, pdu.L_or_W, Y, addr[0])) # Processar o PDU e gerar a resposta
+			except Exception as e: # Um pedido com erro não pode terminar o agente nem o lote
+				print(f"Erro ao atender o pedido de {addr[0]}: {e}") # Imprimir uma mensagem de erro
+				response_pdus.append(None) # Pedido sem resposta
+			end = clock() # O fim de um pedido é o início do seguinte
+			if Y in latencies: # Se for um get ou um set
+				latencies[Y](end - start)
+			start = end
+		return response_pdus
+
+	def handle_datagram(self, sock, data, addr):
+
+		"""Descodifica um datagrama, processa o pedido e envia a resposta"""
+
+		request = self.decode_datagram(data, addr) # Descodificar o datagrama
+		if request is None: # Se o datagrama for inválido
+			return
+		try:
+			for response in self.respond(*request, addr): # Processar o pedido e enviar os datagramas da resposta
+				sock.sendto(response, addr) # Enviar a resposta para o gestor
+		except Exception as e: # Um pedido com erro não pode terminar o agente (ex.: modo single)
+			print(f"Erro ao atender o pedido de {addr[0]}: {e}") # Imprimir uma mensagem de erro
+
+	def serve_worker(self, sock, requests):
+
+		"""Worker do modo threaded: atende os datagramas da fila até receber None"""
+
+		while True:
+			request = requests.get() # Esperar por um datagrama
+			if request is None: # Se o receptor tiver terminado
+				break
+			try:
+				self.handle_datagram(sock, *request) # Atender o pedido
+			except Exception as e: # Um pedido com erro não pode terminar o worker
+				print(f"Erro ao atender o pedido de {request[1][0]}: {e}") # Imprimir uma mensagem de erro
 
-		"""Inicia o agente SNMPKeyShare"""
+	def serve_batch(self, sock, batch_size, recv_buffer_size):
+
+		"""Modo batch: a cada acordar do socket (não bloqueante) lê até batch_size datagramas pendentes para
+		buffers pré-alocados, processa-os como um lote e envia as respostas de seguida"""
+
+		sock.setblocking(False) # As leituras terminam quando não houver mais datagramas
+		views = [memoryview(bytearray(recv_buffer_size)) for _ in range(batch_size)] # Buffers pré-alocados (reutilizados em cada lote)
+		use_recvmsg = hasattr(sock, "recvmsg_into") # recvmsg_into indica datagramas truncados (não existe em todas as plataformas)
+		truncated = getattr(socket, "MSG_TRUNC", 0) # Flag de datagrama truncado
+
+		while self.running: # Enquanto a flag running for True
+			if not select.select([sock], [], [], SERVE_POLL_INTERVAL)[0]: # Esperar por datagramas (no máximo SERVE_POLL_INTERVAL)
+				continue # Verificar a flag running
+
+			if not self.running:  # Verifica se a flag 'running' ainda é True
+				break
+
+			requests = [] # Pedidos do lote: (PDU, codificação, endereço)
+			for view in views: # Para cada buffer
+				try:
+					if use_recvmsg: # Se a plataforma tiver recvmsg_into
+						nbytes, _, flags, addr = sock.recvmsg_into([view]) # Ler um datagrama para o buffer
+						if flags & truncated: # Se o datagrama não couber no buffer
+							print(f"Datagrama de {addr[0]} maior do que {recv_buffer_size} bytes descartado.") # Imprimir uma mensagem de erro
+							continue
+					else:
+						nbytes, addr = sock.recvfrom_into(view) # Ler um datagrama para o buffer
+				except BlockingIOError: # Se não houver mais datagramas pendentes
+					break
+				request = self.decode_datagram(view[:nbytes], addr) # Descodificar o datagrama (sem cópia)
+				if request is not None: # Se o datagrama for válido
+					requests.append(request + (addr,))
+
+			if not requests: # Se o lote não tiver pedidos válidos
+				continue
+			for responses, (_, _, addr) in zip(self.respond_batch(requests), requests): # Para cada resposta do lote
+				for response in responses: # Para cada datagrama da resposta
+					self.send_response(sock, response, addr) # Enviar a resposta para o gestor
+
+	def send_response(self, sock, response, addr):
+
+		"""Envia uma resposta num socket não bloqueante, esperando que o socket aceite dados se o buffer estiver cheio"""
+
+		while True:
+			try:
+				sock.sendto(response, addr) # Enviar a resposta para o gestor
+				return
+			except BlockingIOError: # Se o buffer de envio estiver cheio
+				if not self.running: # Se o agente estiver a terminar
+					return
+				select.select([], [sock], [], SERVE_POLL_INTERVAL) # Esperar que o socket aceite dados
+
+	def serve(self, ip, port, mode="single", workers=4, queue_size=1024, reuse_port=False, batch_size=64, recv_buffer_size=1400):
+
+		"""Inicia o agente SNMPKeyShare
+
+		No modo single os pedidos são atendidos um a um pela thread que os recebe; no modo threaded essa
+		thread só recebe os datagramas e coloca-os numa fila limitada (queue_size) atendida por workers
+		threads. Com a fila cheia os datagramas são descartados, tal como um socket UDP sobrecarregado.
+		No modo asyncio os pedidos são atendidos por um ciclo de eventos (ver serve_async) e no modo batch
+		são lidos e processados em lotes de até batch_size datagramas (ver serve_batch). Com reuse_port
+		o socket é criado com SO_REUSEPORT, para que vários processos partilhem a porta (ver serve_processes).
+		"""
+
+		if mode not in ("single", "threaded", "asyncio", "batch"): # Se o modo for desconhecido
+			raise ValueError(f"O modo de atendimento {mode} é inválido (single, threaded, asyncio ou batch).") # Lançar uma exceção
+		if batch_size < 1 or recv_buffer_size < 1: # Se o lote ou o buffer forem inválidos
+			raise ValueError(f"O lote e o buffer de receção têm de ser positivos (lote {batch_size}, buffer {recv_buffer_size}).") # Lançar uma exceção
+		if mode == "asyncio": # Se os pedidos forem atendidos por um ciclo de eventos
+			asyncio.run(self.serve_async(ip, port, workers, reuse_port)) # Iniciar o ciclo de eventos
+			return
+		if mode == "threaded" and (workers < 1 or queue_size < 1): # Se o número de workers ou a capacidade da fila forem inválidos
+			raise ValueError(f"O modo threaded precisa de pelo menos um worker e uma fila não vazia (workers {workers}, fila {queue_size}).") # Lançar uma exceção
 
 		sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM) # Criar o socket UDP
+		if reuse_port: # Se a porta for partilhada por vários processos
+			sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1) # O kernel distribui os datagramas pelos processos
 		sock.bind((ip, port)) # Associar o socket ao endereço e porta
 
-		print(f"Agente SNMPKeyShare a ouvir no endereço {ip}:{port}") # Imprimir uma mensagem de sucesso
+		print(f"Agente SNMPKeyShare a ouvir no endereço {ip}:{port} (modo {mode})") # Imprimir uma mensagem de sucesso
 
-		while self.running: # Enquanto a flag running for True
-					
-					if not self.running:  # Verifica se a flag 'running' ainda é True
-						break
+		if mode == "batch": # Se os pedidos forem lidos e processados em lotes
+			self.serve_batch(sock, batch_size, recv_buffer_size) # Atender os pedidos em lotes
+			return
+
+		sock.settimeout(SERVE_POLL_INTERVAL) # A receção acorda periodicamente para verificar a flag running
+		if mode == "single": # Se os pedidos forem atendidos pela thread que os recebe
+			while self.running: # Enquanto a flag running for True
+				try:
+					data, addr = sock.recvfrom(recv_buffer_size) # Esperar por dados
+				except socket.timeout: # Se não tiver chegado nenhum datagrama
+					continue # Verificar a flag running
+
+				if not self.running:  # Verifica se a flag 'running' ainda é True
+					break
+
+				self.handle_datagram(sock, data, addr) # Atender o pedido
+			return
+
+		requests = queue.Queue(maxsize=queue_size) # Fila limitada de datagramas por atender
+		threads = [threading.Thread(target=self.serve_worker, args=(sock, requests), daemon=True) for _ in range(workers)] # Workers
+		for thread in threads: # Para cada worker
+			thread.start() # Iniciar o worker
+		try:
+			while self.running: # Enquanto a flag running for True
+				try:
+					data, addr = sock.recvfrom(recv_buffer_size) # Esperar por dados
+				except socket.timeout: # Se não tiver chegado nenhum datagrama
+					continue # Verificar a flag running
+
+				if not self.running:  # Verifica se a flag 'running' ainda é True
+					break
+
+				try:
+					requests.put_nowait((data, addr)) # Entregar o datagrama a um worker
+				except queue.Full: # Se a fila estiver cheia
+					self.dropped_requests += 1 # Descartar o datagrama
+		finally:
+			for _ in threads: # Para cada worker
+				requests.put(None) # Pedir ao worker que termine
+
+	async def serve_async(self, ip, port, workers=4, reuse_port=False):
+
+		"""Inicia o agente SNMPKeyShare sobre um ciclo de eventos asyncio
+
+		Os datagramas são recebidos por um SNMPKeyShareDatagramProtocol; os gets são atendidos no ciclo de
+		eventos quando o lock de leitura da MIB está livre, e os sets, que podem calcular chaves, e os gets
+		que teriam de esperar pelo lock (um set ou a atualização das chaves em curso) num executor com
+		workers threads, para que o ciclo de eventos nunca bloqueie. Se não houver uma
+		thread de atualização das chaves, a atualização de Z e a expiração das chaves correm numa corrotina.
+		"""
 
-					data, addr = sock.recvfrom(1024) # Esperar por dados
+		if workers < 1: # Se o número de workers for inválido
+			raise ValueError(f"O modo asyncio precisa de pelo menos um worker (workers {workers}).") # Lançar uma exceção
 
-					if not self.running:  # Verifica se a flag 'running' ainda é True
-						break
+		loop = asyncio.get_running_loop() # Ciclo de eventos atual
+		executor = ThreadPoolExecutor(max_workers=workers) # Executor para o trabalho pesado
+		transport, _ = await loop.create_datagram_endpoint(lambda: SNMPKeyShareDatagramProtocol(self, executor), local_addr=(ip, port), reuse_port=reuse_port or None) # Associar o protocolo ao endereço e porta
 
-					self.addr = addr[0]  # Endereço do gestor
+		print(f"Agente SNMPKeyShare a ouvir no endereço {ip}:{port} (modo asyncio)") # Imprimir uma mensagem de sucesso
 
-					# Usar pickle para desserializar os dados
-					pdu = pickle.loads(data)
+		try:
+			if self.key_update_thread is None: # Se as chaves não forem atualizadas por uma thread
+				await self.key_update_task(executor) # Atualizar as chaves até a flag running ser False
+			else: # Se houver uma thread de atualização
+				await loop.create_future() # Atender pedidos até o ciclo de eventos ser interrompido
+		finally:
+			transport.close() # Fechar o socket
+			executor.shutdown(wait=False) # Terminar o executor
+
+	def serve_processes(self, ip, port, processes, shared_state_file, table_capacity, replay_window_size, mode="single", workers=4, queue_size=1024, batch_size=64, recv_buffer_size=1400):
+
+		"""Inicia processes processos do agente (fork) que partilham a porta UDP com SO_REUSEPORT
+
+		A tabela de chaves, os contadores de keyIds e de N, os escalares RW e a janela de pedidos passam
+		para um SharedKeyStore (ficheiro mapeado em memória), pelo que uma chave gerada num processo pode
+		ser lida em qualquer outro. Cada processo tem a sua thread de atualização das chaves e atende os
+		pedidos no modo indicado. Retorna quando todos os processos terminarem, com as chaves copiadas de
+		volta para a MIB local (para que o estado possa ser guardado).
+		"""
+
+		if processes < 1: # Se o número de processos for inválido
+			raise ValueError(f"O número de processos ({processes}) tem de ser positivo.") # Lançar uma exceção
+		if not hasattr(socket, "SO_REUSEPORT") or not hasattr(os, "fork"): # Se a plataforma não suportar o modo
+			raise ValueError("O modo com vários processos precisa de SO_REUSEPORT e fork.") # Lançar uma exceção
+
+		store = SharedKeyStore.create(shared_state_file, table_capacity, self.K, max(1, replay_window_size // 4)) # Criar o estado partilhado
+		table = SharedKeysTable(store) # Tabela de chaves partilhada
+		table.load_rows(self.mib.table) # Copiar as chaves do estado guardado
+		store.set_counter("next_key_id", max(store.counter("next_key_id"), self.current_key_id)) # Continuar a numeração local
+		store.set_counter("next_update", self.num_updates) # Continuar os valores de N
+		store.publish_scalars(self.mib) # Publicar os escalares RW
+		self.mib.table, self.mib_lock, self.shared_store = table, store.mib_lock, store # Usar o estado partilhado
+		journal_enabled, self.journal.enabled = self.journal.enabled, False # Os processos não escrevem o journal (o estado é guardado no fim)
+		self.journal.close() # Escrever os registos pendentes e parar a thread de commit antes do fork
+		profile, trace = self.profiler is not None, self.tracer is not None # Depuração ligada no processo pai
+		self.stop_debugging() # Parar a thread do profiler e fechar o ficheiro do rastreio antes do fork
+		profile_file, trace_file = self.profile_file, self.trace_file # Ficheiros do processo pai
+
+		children = [] # PIDs dos processos do agente
+		for _ in range(processes): # Para cada processo
+			pid = os.fork() # Criar o processo (ainda sem threads no processo pai)
+			if pid == 0: # Processo filho
+				status = 0 # Código de saída
+				try:
+					self.profile_file, self.trace_file = f"{profile_file}.{os.getpid()}", f"{trace_file}.{os.getpid()}" # Um ficheiro por processo
+					self.set_profiling(profile) # Continuar a depuração do processo pai
+					self.set_tracing(trace)
+					self.start_key_update_thread() # Iniciar a thread que atualiza as chaves
+					self.serve(ip, port, mode=mode, workers=workers, queue_size=queue_size, reuse_port=True, batch_size=batch_size, recv_buffer_size=recv_buffer_size) # Atender pedidos (SO_REUSEPORT)
+				except KeyboardInterrupt: # Se o agente for terminado pelo utilizador
+					pass
+				except Exception as e: # Se o processo falhar
+					print(f"O processo {os.getpid()} do agente terminou com um erro: {e}") # Imprimir uma mensagem de erro
+					status = 1
+				finally:
+					self.running = False # Parar a thread que atualiza as chaves
+					if self.key_update_thread is not None: # Se a thread tiver sido iniciada
+						self.key_update_thread.join() # Esperar que a thread termine
+					self.stop_debugging() # Escrever os ficheiros do profiler e do rastreio
+					os._exit(status) # Terminar sem executar o resto do programa do pai
+			children.append(pid) # Registar o processo
+
+		print(f"Agente SNMPKeyShare com {processes} processos (estado partilhado em {shared_state_file})") # Imprimir uma mensagem de sucesso
+		pending = list(children) # Processos por terminar
+		while pending: # Enquanto houver processos
+			try:
+				os.waitpid(pending[0], 0) # Esperar que o processo termine
+				pending.pop(0)
+			except KeyboardInterrupt: # Os processos filhos também recebem o sinal e terminam
+				continue # Continuar a esperar
+
+		store.sync_scalars(self.mib) # Copiar os escalares alterados pelos processos
+		self.mib.table = table.snapshot() # Copiar as chaves para uma tabela local
+		self.mib_lock, self.shared_store = ReadWriteLock(), None # Voltar ao estado local
+		store.close() # Fechar o estado partilhado
+		self.journal.enabled = journal_enabled # Voltar a escrever o journal
+		if journal_enabled: # Se as alterações forem registadas no journal
+			self.journal.start(self.mib) # Snapshot com as chaves dos processos e novo journal
+		self.profile_file, self.trace_file = profile_file, trace_file # Voltar aos ficheiros do processo pai
+		self.set_profiling(profile) # Voltar à depuração do processo pai
+		self.set_tracing(trace)
+
+
+class SNMPKeyShareDatagramProtocol(asyncio.DatagramProtocol):
+
+	"""Protocolo asyncio que entrega os datagramas recebidos ao agente SNMPKeyShare"""
+
+	def __init__(self, agent, executor):
+
+		"""Construtor da classe"""
+
+		self.agent = agent # Agente que processa os pedidos
+		self.executor = executor # Executor para os sets
+		self.transport = None # Transporte UDP (definido em connection_made)
+
+	def connection_made(self, transport):
+
+		"""Guarda o transporte UDP"""
+
+		self.transport = transport
+
+	def datagram_received(self, data, addr):
 
-					response_pdu = self.snmpkeyshare_response(pdu.P, pdu.NL_or_NW, pdu.L_or_W, pdu.Y) # Processar o PDU e gerar a resposta
+		"""Processa um datagrama: gets no ciclo de eventos se o lock da MIB estiver livre, sets e gets que teriam de esperar no executor"""
 
-					# Usar pickle para serializar o response_pdu
-					response_pdu = pickle.dumps(response_pdu)
+		request = self.agent.decode_datagram(data, addr) # Descodificar o datagrama
+		if request is None: # Se o datagrama for inválido
+			return
+		if request[0].Y != 2: # Se for um get (só lê a MIB)
+			responses = self.agent.respond(*request, addr, blocking=False) # Processar de imediato se não for preciso esperar pelo lock
+			if responses is not None: # Se o get tiver sido processado
+				self.send(responses, addr) # Responder de imediato
+				return
+		future = asyncio.get_running_loop().run_in_executor(self.executor, self.agent.respond, *request, addr) # Processar no executor (sets e gets à espera do lock)
+		future.add_done_callback(lambda done: self.send_response(done, addr)) # Enviar a resposta quando estiver pronta
+
+	def send_response(self, future, addr):
+
+		"""Envia a resposta produzida no executor"""
+
+		try:
+			responses = future.result() # Datagramas da resposta ao pedido
+		except Exception as e: # Um pedido com erro não pode terminar o agente
+			print(f"Erro ao atender o pedido de {addr[0]}: {e}") # Imprimir uma mensagem de erro
+			return
+		self.send(responses, addr) # Enviar a resposta
+
+	def send(self, responses, addr):
+
+		"""Envia os datagramas de uma resposta para o gestor"""
+
+		for response in responses: # Para cada datagrama da resposta
+			if not self.transport.is_closing(): # Se o socket estiver aberto
+				self.transport.sendto(response, addr) # Enviar a resposta para o gestor
 
-					sock.sendto(response_pdu, addr) # Enviar a resposta para o gestor
 
 def main():
 
@@ -384,14 +1269,81 @@ def main():
 	T = int(config_parameters['T']) # Intervalo de tempo entre atualizações 
 	V = int(config_parameters['V']) # Intervalo de tempo para o qual o agente espera por uma resposta
 	X = int(config_parameters['X']) # Número máximo de chaves geradas
+	consistency_checks = config_parameters['consistency_checks'] # Verificar os contadores da MIB a cada tick
+	z_engine = config_parameters['z_engine'] # Motor da matriz Z (auto, python ou numpy)
+	key_pool_low_watermark = config_parameters['key_pool_low_watermark'] # Marca inferior da reserva de chaves
+	key_pool_high_watermark = config_parameters['key_pool_high_watermark'] # Marca superior da reserva de chaves
+	z_cache_dir = config_parameters['z_cache_dir'] # Diretório da cache da matriz Z inicial
+	accept_pickle = config_parameters['accept_pickle'] # Aceitar PDUs codificados com pickle
+	max_response_size = config_parameters['max_response_size'] # Tamanho máximo de um datagrama de resposta
+	max_response_fragments = config_parameters['max_response_fragments'] # Número máximo de fragmentos da resposta a um get
+	replay_window_size = config_parameters['replay_window_size'] # Número máximo de pedidos na janela de repetições
+	journal = config_parameters['journal'] # Registar as alterações à MIB num journal
+	journal_commit_interval = config_parameters['journal_commit_interval'] # Intervalo entre commits do journal (ms)
+	journal_compact_size = config_parameters['journal_compact_size'] # Tamanho do journal que provoca um novo snapshot
+	journal_sync_sets = config_parameters['journal_sync_sets'] # As respostas aos sets esperam pelo journal
+	metrics = config_parameters['metrics'] # Medir as latências e publicar as métricas na MIB
+	metrics_sampling = config_parameters['metrics_sampling'] # Medir as latências de um em cada metrics_sampling pedidos
+	metrics_dump_file = config_parameters['metrics_dump_file'] # Ficheiro JSON com as métricas
+	metrics_dump_interval = config_parameters['metrics_dump_interval'] # Intervalo entre escritas do ficheiro das métricas (s)
+	serve_mode = config_parameters['serve_mode'] # Modo de atendimento dos pedidos (single, threaded, asyncio ou batch)
+	workers = config_parameters['workers'] # Número de workers dos modos threaded e asyncio
+	queue_size = config_parameters['queue_size'] # Capacidade da fila de pedidos do modo threaded
+	batch_size = config_parameters['batch_size'] # Número máximo de datagramas por lote do modo batch
+	recv_buffer_size = config_parameters['recv_buffer_size'] # Tamanho máximo de um datagrama recebido
+	processes = config_parameters['processes'] # Número de processos do agente
+	profile = config_parameters['profile'] # Ligar o profiler por amostragem no arranque
+	profile_interval = config_parameters['profile_interval'] # Intervalo entre amostras do profiler (ms)
+	profile_file = config_parameters['profile_file'] # Ficheiro collapsed-stack do profiler
+	trace = config_parameters['trace'] # Ligar o rastreio dos pedidos no arranque
+	trace_file = config_parameters['trace_file'] # Ficheiro JSON lines do rastreio
+	trace_threshold = config_parameters['trace_threshold'] # Duração mínima dos pedidos rastreados (µs)
 	ip = "127.0.0.1" # Endereço IP
 	port = udp_port # Porta UDP
-	agent = SNMPKeyShareAgent(K, M, T, V, X, None) # Instanciar o agente
+	agent = SNMPKeyShareAgent( # Instanciar o agente
+		K, M, T, V, X, None,
+		consistency_checks=consistency_checks,
+		z_engine=z_engine,
+		key_pool_low_watermark=key_pool_low_watermark,
+		key_pool_high_watermark=key_pool_high_watermark,
+		accept_pickle=accept_pickle,
+		max_response_size=max_response_size,
+		max_response_fragments=max_response_fragments,
+		replay_window_size=replay_window_size,
+		journal=journal,
+		journal_commit_interval=journal_commit_interval,
+		journal_compact_size=journal_compact_size,
+		journal_sync_sets=journal_sync_sets,
+		metrics=metrics,
+		metrics_sampling=metrics_sampling,
+		metrics_dump_file=metrics_dump_file,
+		metrics_dump_interval=metrics_dump_interval,
+		profile=profile,
+		profile_interval=profile_interval,
+		profile_file=profile_file,
+		trace=trace,
+		trace_file=trace_file,
+		trace_threshold=trace_threshold,
+		z_cache_dir=z_cache_dir,
+	)
+	if hasattr(signal, "SIGUSR1"): # Sinais de depuração (não existem no Windows)
+		signal.signal(signal.SIGUSR1, lambda signum, frame: threading.Thread(target=agent.toggle_profiling, daemon=True).start()) # Alternar o profiler (fora do handler, que pode interromper o código que o profiler usa)
+		signal.signal(signal.SIGUSR2, lambda signum, frame: threading.Thread(target=agent.toggle_tracing, daemon=True).start()) # Alternar o rastreio dos pedidos
+	if processes > 1: # Se os pedidos forem atendidos por vários processos
+		agent.serve_processes(ip, port, processes, config_parameters['shared_state_file'], config_parameters['shared_table_capacity'], replay_window_size, mode=serve_mode, workers=workers, queue_size=queue_size, batch_size=batch_size, recv_buffer_size=recv_buffer_size) # Iniciar os processos (retorna quando terminarem)
+		agent.stop_key_update_thread() # Guardar o estado da MIB
+		agent.stop_debugging() # Escrever os ficheiros do profiler e do rastreio
+		print("O agente foi terminado pelo utilizador.")
+		return
 	try: 
-		agent.start_key_update_thread() # Iniciar a thread que atualiza as chaves
-		agent.serve(ip, port) # Iniciar o agente
+		if serve_mode == "asyncio": # No modo asyncio as chaves são atualizadas por uma corrotina
+			agent.running = True # Definir a flag running como True
+		else:
+			agent.start_key_update_thread() # Iniciar a thread que atualiza as chaves
+		agent.serve(ip, port, mode=serve_mode, workers=workers, queue_size=queue_size, batch_size=batch_size, recv_buffer_size=recv_buffer_size) # Iniciar o agente
 	except KeyboardInterrupt:
 		agent.stop_key_update_thread() # Parar a thread que atualiza as chaves
+		agent.stop_debugging() # Escrever os ficheiros do profiler e do rastreio
 		print("O agente foi terminado pelo utilizador.") 
 
 
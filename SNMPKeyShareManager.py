@@ -1,6 +1,9 @@
+import asyncio
 import configparser
-import pickle
+import copy
+import random
 import socket
+import time
 from SNMPKeySharePDU import SNMPKeySharePDU
 
 
@@ -14,72 +17,299 @@ def read_config_file(file_path):
 	parameters = {
 		"udp_port": int(config.get("Network", "udp_port")), # Ler o parâmetro udp_port e convertê-lo para inteiro
 		"V": int(config.get("Key Maintenance", "V")), # Ler o parâmetro V e convertê-lo para inteiro
+		"wire_format": config.get("Network", "wire_format", fallback="binary").strip(), # Ler a codificação dos PDUs (opcional)
+		"retries": config.getint("Network", "manager_retries", fallback=2), # Ler o número de repetições dos gets (opcional)
 	}
 
 	return parameters # Retornar o dicionário com os parâmetros
 
 
+def collect_fragment(partial, pdu):
+
+	"""Junta um PDU recebido às respostas incompletas (P -> {F: fragmento}) e retorna a resposta completa,
+	ou None se ainda faltarem fragmentos"""
+
+	if pdu.NF <= 1: # Se a resposta vier num só datagrama
+		return pdu
+	fragments = partial.setdefault(pdu.P, {}) # Fragmentos já recebidos da resposta
+	fragments[pdu.F] = pdu # Um fragmento duplicado substitui o anterior
+	if len(fragments) < pdu.NF: # Se ainda faltarem fragmentos
+		return None
+	del partial[pdu.P] # Resposta completa
+	return SNMPKeySharePDU.reassemble(list(fragments.values())) # Juntar os fragmentos
+
+
 class SNMPKeyShareManager:
 
-	"""Classe que representa um gestor SNMPKeyShare"""
+	"""Classe que representa um gestor SNMPKeyShare
 
-	def __init__(self, V):
+	O gestor mantém um socket UDP por agente (ip, porta), reutilizado entre pedidos; as respostas são
+	associadas aos pedidos pelo identificador P, pelo que respostas atrasadas de pedidos anteriores são
+	descartadas. As respostas grandes chegam em vários fragmentos, que são juntados antes de serem
+	retornadas; se faltar algum no fim do tempo de espera a resposta é dada como perdida.
+
+	Como no AsyncSNMPKeyShareManager, os gets são repetidos até retries vezes, cada tentativa com o
+	tempo de espera timeout (por omissão V) multiplicado por backoff em relação à anterior. Cada
+	repetição envia uma cópia do PDU com um novo P (o agente rejeita um P repetido dentro de V
+	segundos); o PDU do chamador não é alterado e o P usado é o da resposta. Os sets não são repetidos.
+	"""
+
+	def __init__(self, V, wire_format="binary", retries=0, backoff=2.0, timeout=None):
 
 		"""Construtor da classe"""
 
+		if retries < 0 or backoff < 1 or (timeout is not None and timeout <= 0): # Se os parâmetros forem inválidos
+			raise ValueError(f"Parâmetros inválidos (retries {retries}, backoff {backoff}, timeout {timeout}).") # Lançar uma exceção
 		self.V = V # Intervalo de tempo para o qual o gestor espera por uma respostaS
+		self.timeout = V if timeout is None else timeout # Tempo de espera da primeira tentativa (segundos)
+		self.wire_format = wire_format # Codificação dos PDUs (binary ou pickle, durante a migração)
+		self.retries = retries # Número máximo de repetições de um get
+		self.backoff = backoff # Fator de crescimento do tempo de espera entre tentativas
+		self.sockets = {} # (ip, porta) do agente -> socket UDP
+		self.next_P = random.randrange(1, 1 << 30) # Próximo identificador atribuído às repetições
 
-	def snmpkeyshare_get(self, P, NL, L, agent_ip, agent_port):
+	def agent_socket(self, agent_ip, agent_port):
 
-		"""Envia um pedido snmpkeyshare-get para o agente SNMPKeyShare"""	
+		"""Retorna o socket do agente (ip, porta), criando-o no primeiro pedido"""
 
-		pdu = SNMPKeySharePDU(S=0, NS=0, Q=[], P=P, Y=1, NL_or_NW=NL, L_or_W=L, NR=0, R=[]) # Criar o PDU
+		udp_socket = self.sockets.get((agent_ip, agent_port)) # Socket já criado
+		if udp_socket is None: # Se for o primeiro pedido para o agente
+			udp_socket = self.sockets[(agent_ip, agent_port)] = socket.socket(socket.AF_INET, socket.SOCK_DGRAM) # Criar o socket
+		return udp_socket # Retornar o socket
+
+	def close(self):
+
+		"""Fecha os sockets dos agentes"""
+
+		for udp_socket in self.sockets.values(): # Para cada socket
+			udp_socket.close() # Fechar o socket
+		self.sockets.clear()
+
+	def new_request_id(self):
 
-		# Enviar o PDU para o agente utilizando comunicação UDP
-		with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as udp_socket:
+		"""Retorna um novo identificador de pedido (P) para uma repetição"""
 
-			udp_socket.settimeout(self.V) # Definir o tempo máximo de espera por uma resposta
+		self.next_P += 1
+		return self.next_P
 
-			pdu = pickle.dumps(pdu) # Serializar o PDU
-			udp_socket.sendto(pdu, (agent_ip, agent_port)) # Enviar o PDU para o agente
+	def request(self, pdu, agent_ip, agent_port):
 
+		"""Envia um PDU para o agente e espera pela resposta a um dos P enviados (None se não chegar); as
+		repetições dos gets usam cópias do PDU com um novo P, que é o P da resposta"""
+
+		udp_socket = self.agent_socket(agent_ip, agent_port) # Socket do agente
+		agent_addr = (socket.gethostbyname(agent_ip), agent_port) # Endereço de origem das respostas (IP numérico)
+		retries = self.retries if pdu.Y == 1 else 0 # Só os gets são repetidos
+		timeout = self.timeout # Tempo de espera da primeira tentativa
+		sent = set() # P das tentativas (a resposta a uma tentativa anterior também serve)
+		partial = {} # Fragmentos recebidos das respostas
+		for attempt in range(retries + 1): # Para cada tentativa
+			if attempt: # Se for uma repetição
+				previous, pdu = pdu.P, copy.copy(pdu) # Cópia do PDU (o do chamador não é alterado)
+				pdu.P = self.new_request_id() # Novo P (o agente rejeita um P repetido)
+				print(f"Sem resposta ao pedido {previous}; repetido com P = {pdu.P}.") # Imprimir o P usado
+			sent.add(pdu.P)
+			udp_socket.sendto(pdu.serialize(self.wire_format), (agent_ip, agent_port)) # Enviar o PDU para o agente
+			deadline = time.monotonic() + timeout # Instante limite para a resposta a esta tentativa
 			try:
-				response_data, _ = udp_socket.recvfrom(1024) # Esperar pela resposta do agente
+				while True:
+					udp_socket.settimeout(max(deadline - time.monotonic(), 0.001)) # Tempo de espera restante
+					response_data, addr = udp_socket.recvfrom(65535) # Esperar pela resposta do agente
+					if addr[:2] != agent_addr: # Se o datagrama não vier do agente (IP e porta)
+						continue # Descartar o datagrama
+					try:
+						response_pdu = SNMPKeySharePDU.deserialize(response_data, allow_pickle=self.wire_format == "pickle") # Deserializar a resposta
+					except ValueError: # Se a resposta for inválida
+						continue # Descartar o datagrama
+					if response_pdu.P not in sent: # Resposta atrasada de um pedido anterior
+						continue # Descartar o datagrama
+					try:
+						response_pdu = collect_fragment(partial, response_pdu) # Juntar os fragmentos da resposta
+					except ValueError: # Se os fragmentos forem inconsistentes
+						partial.pop(response_pdu.P, None) # Descartar os fragmentos recebidos
+						continue
+					if response_pdu is not None: # Se a resposta estiver completa
+						return response_pdu # Retornar a resposta
+			except socket.timeout: # Se o tempo de espera desta tentativa for excedido
+				timeout *= self.backoff # Aumentar o tempo de espera da tentativa seguinte
+
+		print(
+			f"O agente não respondeu em {retries + 1} tentativas.") # Imprimir uma mensagem de erro
+		return None # Retornar None
 
-				response_pdu = pickle.loads(response_data) # Deserializar a resposta
+	def snmpkeyshare_get(self, P, NL, L, agent_ip, agent_port):
 
-				return response_pdu # Retornar a resposta
+		"""Envia um pedido snmpkeyshare-get para o agente SNMPKeyShare"""	
 
-			except socket.timeout: # Se o tempo de espera for excedido
-				print( 
-					f"O agente não respondeu no intervalo de tempo {self.V} segundos.") # Imprimir uma mensagem de erro
-				return None # Retornar None
+		pdu = SNMPKeySharePDU(S=0, NS=0, Q=[], P=P, Y=1, NL_or_NW=NL, L_or_W=L, NR=0, R=[]) # Criar o PDU
+		return self.request(pdu, agent_ip, agent_port) # Enviar o PDU e retornar a resposta
 
 	def snmpkeyshare_set(self, P, NW, W, agent_ip, agent_port):
 
 		"""Envia um pedido snmpkeyshare-set para o agente SNMPKeyShare"""
 
 		pdu = SNMPKeySharePDU(S=0, NS=0, Q=[], P=P, Y=2, NL_or_NW=NW, L_or_W=W, NR=0, R=[]) # Criar o PDU
+		return self.request(pdu, agent_ip, agent_port) # Enviar o PDU e retornar a resposta
+
+
+class AgentEndpointProtocol(asyncio.DatagramProtocol):
+
+	"""Protocolo asyncio de um socket UDP ligado a um agente: entrega cada resposta (com os fragmentos
+	juntos) ao futuro do pedido com o mesmo P"""
+
+	def __init__(self, wire_format):
+
+		"""Construtor da classe"""
+
+		self.wire_format = wire_format # Codificação dos PDUs
+		self.pending = {} # P -> futuro da resposta
+		self.partial = {} # P -> fragmentos recebidos de respostas incompletas
+		self.transport = None # Transporte UDP (definido em connection_made)
+
+	def connection_made(self, transport):
 
-		# Enviar o PDU para o agente usando comunicação UDP
-		with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as udp_socket:
+		"""Guarda o transporte UDP"""
 
-			udp_socket.settimeout(self.V) # Definir o tempo máximo de espera por uma resposta
+		self.transport = transport
 
-			pdu = pickle.dumps(pdu) # Serializar o PDU
-			udp_socket.sendto(pdu, (agent_ip, agent_port)) # Enviar o PDU para o agente
+	def datagram_received(self, data, addr):
 
+		"""Entrega a resposta ao pedido pendente com o mesmo P (respostas desconhecidas ou atrasadas são descartadas)"""
+
+		try:
+			response_pdu = SNMPKeySharePDU.deserialize(data, allow_pickle=self.wire_format == "pickle") # Deserializar a resposta
+		except ValueError: # Se a resposta for inválida
+			return
+		P = response_pdu.P # Identificação do pedido
+		if P not in self.pending: # Se não houver um pedido pendente com este P (resposta atrasada ou desconhecida)
+			return
+		try:
+			response_pdu = collect_fragment(self.partial, response_pdu) # Juntar os fragmentos da resposta
+		except ValueError: # Se os fragmentos forem inconsistentes
+			self.partial.pop(P, None) # Descartar os fragmentos recebidos (o pedido acaba por expirar)
+			return
+		if response_pdu is None: # Se ainda faltarem fragmentos
+			return
+		future = self.pending.pop(P) # Pedido pendente
+		if not future.done(): # Se o pedido ainda estiver à espera
+			future.set_result(response_pdu) # Entregar a resposta
+
+	def error_received(self, exc):
+
+		"""Falha os pedidos pendentes (p. ex. ICMP porta inalcançável: o agente não está a correr)"""
+
+		for future in self.pending.values(): # Para cada pedido pendente
+			if not future.done():
+				future.set_exception(exc) # Entregar o erro
+		self.pending.clear()
+		self.partial.clear()
+
+	def connection_lost(self, exc):
+
+		"""Cancela os pedidos pendentes quando o socket é fechado"""
+
+		for future in self.pending.values(): # Para cada pedido pendente
+			future.cancel()
+		self.pending.clear()
+		self.partial.clear()
+
+
+class AsyncSNMPKeyShareManager:
+
+	"""Gestor SNMPKeyShare assíncrono (asyncio) para interrogar muitos agentes em paralelo
+
+	Cada agente (ip, porta) tem um socket UDP persistente; vários pedidos podem estar pendentes no mesmo
+	socket e são associados às respostas pelo identificador P. Cada pedido tem um tempo limite e os gets
+	são repetidos até retries vezes, com o tempo limite multiplicado por backoff a cada tentativa. Como o
+	agente rejeita um P repetido dentro de V segundos, cada tentativa envia uma cópia do PDU com um novo
+	P (o PDU do chamador não é alterado; o P usado é o da resposta). Os sets não são
+	repetidos: uma repetição poderia gerar uma segunda chave se só a resposta se tivesse perdido.
+
+		manager = AsyncSNMPKeyShareManager(timeout=2)
+		responses = await asyncio.gather(*(manager.snmpkeyshare_get(None, 1, [("3.1.0", 0)], ip, 161) for ip in agents))
+		manager.close()
+	"""
+
+	def __init__(self, timeout=5, retries=2, backoff=2.0, wire_format="binary"):
+
+		"""Construtor da classe"""
+
+		if timeout <= 0 or retries < 0 or backoff < 1: # Se os parâmetros forem inválidos
+			raise ValueError(f"Parâmetros inválidos (timeout {timeout}, retries {retries}, backoff {backoff}).") # Lançar uma exceção
+		self.timeout = timeout # Tempo limite da primeira tentativa (segundos)
+		self.retries = retries # Número máximo de repetições de um get
+		self.backoff = backoff # Fator de crescimento do tempo limite entre tentativas
+		self.wire_format = wire_format # Codificação dos PDUs
+		self.endpoints = {} # (ip, porta) do agente -> (transporte, protocolo)
+		self.next_P = random.randrange(1, 1 << 30) # Próximo identificador de pedido atribuído pelo gestor
+
+	def new_request_id(self):
+
+		"""Retorna um novo identificador de pedido (P)"""
+
+		self.next_P += 1
+		return self.next_P
+
+	async def endpoint(self, agent_ip, agent_port):
+
+		"""Retorna o protocolo do socket ligado ao agente (ip, porta), criando-o no primeiro pedido"""
+
+		endpoint = self.endpoints.get((agent_ip, agent_port)) # Socket já criado
+		if endpoint is None: # Se for o primeiro pedido para o agente
+			endpoint = await asyncio.get_running_loop().create_datagram_endpoint(lambda: AgentEndpointProtocol(self.wire_format), remote_addr=(agent_ip, agent_port)) # Criar o socket
+			if (agent_ip, agent_port) in self.endpoints: # Se outro pedido o tiver criado entretanto
+				endpoint[0].close() # Fechar o socket duplicado
+			else:
+				self.endpoints[(agent_ip, agent_port)] = endpoint # Guardar o socket
+			endpoint = self.endpoints[(agent_ip, agent_port)]
+		return endpoint[1] # Retornar o protocolo
+
+	async def request(self, pdu, agent_ip, agent_port, timeout=None, retries=None):
+
+		"""Envia um PDU e retorna a resposta; lança asyncio.TimeoutError (ou o erro do socket) se todas as tentativas falharem"""
+
+		timeout = self.timeout if timeout is None else timeout # Tempo limite da primeira tentativa
+		retries = (self.retries if retries is None else retries) if pdu.Y == 1 else 0 # Só os gets são repetidos
+		protocol = await self.endpoint(agent_ip, agent_port) # Socket do agente
+		for attempt in range(retries + 1): # Para cada tentativa
+			if attempt or pdu.P is None: # Se for uma repetição ou o P não tiver sido indicado
+				pdu = copy.copy(pdu) # Cópia do PDU (o do chamador não é alterado)
+				pdu.P = self.new_request_id() # Novo P (o agente rejeita um P repetido)
+			if pdu.P in protocol.pending: # Se já houver um pedido pendente com este P
+				raise ValueError(f"Já existe um pedido pendente com P = {pdu.P}.") # Lançar uma exceção
+			future = protocol.pending[pdu.P] = asyncio.get_running_loop().create_future() # Futuro da resposta
+			protocol.transport.sendto(pdu.serialize(self.wire_format)) # Enviar o PDU para o agente
 			try:
-				response_data, _ = udp_socket.recvfrom(1024) # Esperar pela resposta do agente
+				return await asyncio.wait_for(future, timeout) # Esperar pela resposta
+			except (asyncio.TimeoutError, OSError): # Se a resposta não chegar ou o socket falhar
+				protocol.pending.pop(pdu.P, None) # Esquecer o pedido (uma resposta atrasada é descartada)
+				protocol.partial.pop(pdu.P, None) # Descartar os fragmentos recebidos
+				if attempt == retries: # Se for a última tentativa
+					raise
+			timeout *= self.backoff # Aumentar o tempo limite da tentativa seguinte
+
+	def snmpkeyshare_get(self, P, NL, L, agent_ip, agent_port, timeout=None):
+
+		"""Envia um pedido snmpkeyshare-get (P None = atribuído pelo gestor) e retorna uma corrotina com a resposta"""
+
+		pdu = SNMPKeySharePDU(S=0, NS=0, Q=[], P=P, Y=1, NL_or_NW=NL, L_or_W=L, NR=0, R=[]) # Criar o PDU
+		return self.request(pdu, agent_ip, agent_port, timeout) # Enviar o PDU
+
+	def snmpkeyshare_set(self, P, NW, W, agent_ip, agent_port, timeout=None):
+
+		"""Envia um pedido snmpkeyshare-set (P None = atribuído pelo gestor) e retorna uma corrotina com a resposta"""
+
+		pdu = SNMPKeySharePDU(S=0, NS=0, Q=[], P=P, Y=2, NL_or_NW=NW, L_or_W=W, NR=0, R=[]) # Criar o PDU
+		return self.request(pdu, agent_ip, agent_port, timeout) # Enviar o PDU
 
-				response_pdu = pickle.loads(response_data) # Deserializar a resposta
+	def close(self, agents=None):
 
-				return response_pdu # Retornar a resposta
+		"""Fecha os sockets dos agentes (ip, porta) indicados, ou de todos (os pedidos pendentes são cancelados)"""
 
-			except socket.timeout: # Se o tempo de espera for excedido
-				print(
-					f"O agente não respondeu no intervalo de tempo {self.V} segundos.") # Imprimir uma mensagem de erro
-				return None # Retornar None
+		for agent in list(self.endpoints) if agents is None else agents: # Para cada socket
+			endpoint = self.endpoints.pop(agent, None)
+			if endpoint is not None:
+				endpoint[0].close()
 
 
 def main():
@@ -90,7 +320,8 @@ def main():
 	config_parameters = read_config_file(file_path) # Ler o ficheiro de configuração
 	V = config_parameters['V'] # Intervalo de tempo para o qual o gestor espera por uma resposta
 	port = config_parameters['udp_port'] # Porta UDP para a comunicação com o agente
-	manager = SNMPKeyShareManager(V) # Instanciar o gestor
+	wire_format = config_parameters['wire_format'] # Codificação dos PDUs
+	manager = SNMPKeyShareManager(V, wire_format, config_parameters['retries']) # Instanciar o gestor
 
 	ip = "127.0.0.1" # Endereço IP do agente
 	try: 
@@ -142,6 +373,7 @@ def main():
 				print(e) # Imprimir uma mensagem de erro
 				continue # Voltar ao início do ciclo
 	except KeyboardInterrupt: # Se o utilizador terminar o programa
+		manager.close() # Fechar os sockets dos agentes
 		print("\nO gestor foi terminado pelo utilizador.") # Imprimir uma mensagem de erro
 
 
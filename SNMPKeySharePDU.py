@@ -1,11 +1,198 @@
 import pickle
 
 
+WIRE_MAGIC = 0xA5 # Primeiro byte de um PDU na codificação binária (um PDU pickle começa por 0x80)
+WIRE_VERSION = 1 # Versão da codificação binária
+WIRE_VERSION_FRAGMENT = 2 # Versão da codificação binária de um fragmento de uma resposta (com F e NF após a versão)
+PICKLE_MAGIC = 0x80 # Primeiro byte de um PDU serializado com pickle (protocolo 2 ou superior)
+
+TAG_NONE = 0 # Valor None
+TAG_INT = 1 # Inteiro (varint zigzag)
+TAG_STR = 2 # Texto UTF-8 (comprimento + bytes)
+TAG_OID = 3 # OID em texto codificado como arcos inteiros (número de arcos + varints)
+TAG_ERROR = 4 # Erro (mensagem UTF-8), descodificado como ValueError
+TAG_TUPLE = 5 # Tuplo (número de elementos + valores)
+
+FRAGMENT_SLACK = 8 # Bytes reservados para o crescimento dos quatro contadores de um fragmento (NL/NW, L/W, NR, R)
+FRAGMENT_MAX_INDEX = 0xFFFF # Valor usado para medir o espaço ocupado por F e NF
+TRUNCATED_RESPONSE = "Resposta truncada" # Início da mensagem do erro que assinala os pares omitidos por max_fragments
+
+
+def detect_wire_format(data):
+
+	"""Identifica a codificação de um datagrama: "binary", "pickle" ou None se for desconhecida"""
+
+	if not data: # Se o datagrama estiver vazio
+		return None # Codificação desconhecida
+	if data[0] == WIRE_MAGIC: # Se começar pelo byte mágico da codificação binária
+		return "binary" # Codificação binária
+	if data[0] == PICKLE_MAGIC: # Se começar pelo byte de um pickle
+		return "pickle" # Codificação pickle
+	return None # Codificação desconhecida
+
+
+def is_oid_text(value):
+
+	"""Verifica se um texto é um OID que pode ser codificado como arcos sem perder a forma original"""
+
+	arcs = value.split(".") # Componentes do texto
+	return len(arcs) > 1 and all(arc.isdigit() and arc.isascii() and (arc == "0" or arc[0] != "0") for arc in arcs) # Só dígitos, sem zeros à esquerda
+
+
+def encode_uint(out, number):
+
+	"""Acrescenta um inteiro não negativo a out como varint (7 bits por byte, menos significativos primeiro)"""
+
+	while number > 0x7F: # Enquanto não couber num byte
+		out.append((number & 0x7F) | 0x80) # 7 bits e bit de continuação
+		number >>= 7 # Bits seguintes
+	out.append(number) # Último byte
+
+
+def encode_int(out, number):
+
+	"""Acrescenta um inteiro (com sinal) a out como varint zigzag"""
+
+	encode_uint(out, number * 2 if number >= 0 else -number * 2 - 1) # 0, -1, 1, -2, ... -> 0, 1, 2, 3, ...
+
+
+def encode_text(out, text):
+
+	"""Acrescenta um texto a out como comprimento + UTF-8"""
+
+	data = text.encode("utf-8") # Texto em UTF-8
+	encode_uint(out, len(data)) # Comprimento
+	out += data # Bytes do texto
+
+
+def encode_value(out, value):
+
+	"""Acrescenta um valor etiquetado (None, int, str, OID, erro ou tuplo) a out"""
+
+	if value is None: # None
+		out.append(TAG_NONE)
+	elif isinstance(value, int): # Inteiro
+		out.append(TAG_INT)
+		encode_int(out, value)
+	elif isinstance(value, str): # Texto
+		if is_oid_text(value): # Se for um OID
+			arcs = value.split(".") # Arcos do OID
+			out.append(TAG_OID)
+			encode_uint(out, len(arcs)) # Número de arcos
+			for arc in arcs: # Para cada arco
+				encode_uint(out, int(arc)) # Arco como varint
+		else: # Texto genérico
+			out.append(TAG_STR)
+			encode_text(out, value)
+	elif isinstance(value, BaseException): # Erro
+		out.append(TAG_ERROR)
+		encode_text(out, str(value)) # Mensagem do erro
+	elif isinstance(value, (tuple, list)): # Tuplo (os pares das listas L/W e R)
+		out.append(TAG_TUPLE)
+		encode_uint(out, len(value)) # Número de elementos
+		for item in value: # Para cada elemento
+			encode_value(out, item)
+	else: # Tipo não suportado
+		raise ValueError(f"Não é possível codificar um valor do tipo {type(value).__name__} no PDU.") # Lançar uma exceção
+
+
+def encode_list(out, values):
+
+	"""Acrescenta uma lista de valores etiquetados a out (número de elementos + valores)"""
+
+	encode_uint(out, len(values)) # Número de elementos
+	for value in values: # Para cada valor
+		encode_value(out, value)
+
+
+def decode_uint(view, pos):
+
+	"""Lê um varint de view a partir de pos e retorna (inteiro, posição seguinte)"""
+
+	byte = view[pos] # Primeiro byte
+	if byte < 0x80: # Caso habitual: um só byte
+		return byte, pos + 1
+	number, shift = byte & 0x7F, 7 # Bits já lidos
+	while True:
+		pos += 1 # Byte seguinte
+		byte = view[pos]
+		number |= (byte & 0x7F) << shift # Acrescentar 7 bits
+		if byte < 0x80: # Se for o último byte
+			return number, pos + 1
+		shift += 7
+
+
+def decode_int(view, pos):
+
+	"""Lê um varint zigzag de view a partir de pos e retorna (inteiro, posição seguinte)"""
+
+	number, pos = decode_uint(view, pos) # Varint sem sinal
+	return (number >> 1) ^ -(number & 1), pos # Desfazer o zigzag
+
+
+def decode_text(view, pos):
+
+	"""Lê um texto (comprimento + UTF-8) de view a partir de pos e retorna (texto, posição seguinte)"""
+
+	length, pos = decode_uint(view, pos) # Comprimento
+	end = pos + length # Fim do texto
+	if end > len(view): # Se o texto exceder o datagrama
+		raise IndexError("texto truncado") # Lançar uma exceção
+	return str(view[pos:end], "utf-8"), end # Descodificar diretamente da memoryview
+
+
+def decode_value(view, pos):
+
+	"""Lê um valor etiquetado de view a partir de pos e retorna (valor, posição seguinte)"""
+
+	tag = view[pos] # Etiqueta do valor
+	pos += 1
+	if tag == TAG_INT: # Inteiro
+		return decode_int(view, pos)
+	if tag == TAG_OID: # OID
+		count, pos = decode_uint(view, pos) # Número de arcos
+		arcs = [] # Arcos do OID
+		for _ in range(count): # Para cada arco
+			arc, pos = decode_uint(view, pos)
+			arcs.append(str(arc))
+		return ".".join(arcs), pos
+	if tag == TAG_STR: # Texto
+		return decode_text(view, pos)
+	if tag == TAG_TUPLE: # Tuplo
+		count, pos = decode_uint(view, pos) # Número de elementos
+		items = [] # Elementos do tuplo
+		for _ in range(count): # Para cada elemento
+			item, pos = decode_value(view, pos)
+			items.append(item)
+		return tuple(items), pos
+	if tag == TAG_ERROR: # Erro
+		message, pos = decode_text(view, pos) # Mensagem do erro
+		return ValueError(message), pos
+	if tag == TAG_NONE: # None
+		return None, pos
+	raise ValueError(f"Etiqueta de valor desconhecida ({tag}) no PDU.") # Lançar uma exceção
+
+
+def decode_list(view, pos):
+
+	"""Lê uma lista de valores etiquetados de view a partir de pos e retorna (lista, posição seguinte)"""
+
+	count, pos = decode_uint(view, pos) # Número de elementos
+	values = [] # Valores da lista
+	for _ in range(count): # Para cada valor
+		value, pos = decode_value(view, pos)
+		values.append(value)
+	return values, pos
+
+
 class SNMPKeySharePDU:
 	
 	"""Classe que representa um PDU SNMPKeyShare"""
 
-	def __init__(self, S=0, NS=0, Q=None, P=0, Y=0, NL_or_NW=0, L_or_W=None, NR=0, R=None):
+	F = 0 # Índice e número de fragmentos por omissão (PDUs pickle de versões sem fragmentos não têm estes atributos)
+	NF = 1
+
+	def __init__(self, S=0, NS=0, Q=None, P=0, Y=0, NL_or_NW=0, L_or_W=None, NR=0, R=None, F=0, NF=1):
 
 		"""Construtor da classe"""
 
@@ -28,19 +215,154 @@ class SNMPKeySharePDU:
 		self.L_or_W = L_or_W
 		self.NR = NR  # Número de elementos da lista de erros
 		self.R = R  # Lista de erros e valores associados
+		self.F = F # Índice do fragmento (respostas divididas em vários datagramas)
+		self.NF = NF # Número de fragmentos da resposta (1 = resposta num só datagrama)
 
-	def serialize(self):
+	def serialize(self, wire_format="binary"):
 
-		"""Serializar o PDU para uma string usando pickle"""
+		"""Serializar o PDU para bytes, na codificação binária (por omissão) ou com pickle"""
 
-		return pickle.dumps(self) # Serializar o PDU
+		if wire_format == "pickle": # Se for pedida a codificação antiga (migração)
+			return pickle.dumps(self) # Serializar o PDU
+		if wire_format != "binary": # Se a codificação for desconhecida
+			raise ValueError(f"A codificação {wire_format} é inválida (binary ou pickle).") # Lançar uma exceção
+
+		if self.NF > 1: # Se o PDU for um fragmento de uma resposta
+			out = bytearray((WIRE_MAGIC, WIRE_VERSION_FRAGMENT)) # Cabeçalho: byte mágico e versão dos fragmentos
+			encode_int(out, self.F) # Índice do fragmento
+			encode_int(out, self.NF) # Número de fragmentos
+		else:
+			out = bytearray((WIRE_MAGIC, WIRE_VERSION)) # Cabeçalho: byte mágico e versão
+		encode_int(out, self.S) # Modelo de segurança
+		encode_int(out, self.NS) # Número de parâmetros de segurança
+		encode_list(out, self.Q) # Parâmetros de segurança
+		encode_int(out, self.P) # Identificação do pedido
+		encode_int(out, self.Y) # Tipo de primitiva
+		encode_int(out, self.NL_or_NW) # Número de instâncias
+		encode_list(out, self.L_or_W) # Lista de instâncias e valores
+		encode_int(out, self.NR) # Número de erros
+		encode_list(out, self.R) # Lista de erros
+		return bytes(out) # Retornar os bytes do PDU
+
+	def serialize_fragments(self, max_size, max_fragments=0):
+
+		"""Serializar o PDU (codificação binária) em datagramas de no máximo max_size bytes
+
+		Se o PDU não couber num datagrama, os pares de L/W e de R são repartidos, por esta ordem, por
+		fragmentos com o mesmo P, o índice F e o número de fragmentos NF, que o gestor junta com
+		reassemble. Com max_fragments > 0 os pares que não couberem nesse número de fragmentos são
+		omitidos, como num get-bulk, e o último fragmento termina com um erro (OID do primeiro par
+		omitido, mensagem iniciada por TRUNCATED_RESPONSE com o número de pares omitidos); o gestor
+		continua a partir do último OID recebido. Um par maior do que max_size vai sozinho num fragmento.
+		"""
+
+		data = self.serialize() # Resposta num só datagrama
+		if len(data) <= max_size: # Se couber
+			return [data]
+
+		overhead = len(SNMPKeySharePDU(S=self.S, NS=self.NS, Q=self.Q, P=self.P, Y=self.Y, F=FRAGMENT_MAX_INDEX, NF=FRAGMENT_MAX_INDEX).serialize()) + FRAGMENT_SLACK # Cabeçalho de um fragmento
+		items = [(False, item) for item in self.L_or_W] + [(True, item) for item in self.R] # Instâncias primeiro
+		fragments = [] # Fragmentos completos: (erros, pares)
+		errors, pairs, sizes, used = [], [], [], overhead # Fragmento atual, tamanhos dos seus pares e bytes ocupados
+		kept = len(items) # Número de pares incluídos na resposta
+		for index, (is_error, item) in enumerate(items):
+			out = bytearray() # Par codificado (para medir o tamanho)
+			encode_value(out, item)
+			if (errors or pairs) and used + len(out) > max_size: # Se o par não couber no fragmento atual
+				if max_fragments and len(fragments) + 1 >= max_fragments: # Se já não puder haver mais fragmentos
+					kept = index # Omitir os pares restantes
+					break
+				fragments.append((errors, pairs)) # Fechar o fragmento
+				errors, pairs, sizes, used = [], [], [], overhead # Começar um novo fragmento
+			(errors if is_error else pairs).append(item) # Juntar o par ao fragmento
+			sizes.append(len(out))
+			used += len(out)
+
+		while kept < len(items): # Se houver pares omitidos, assinalá-los com um erro no último fragmento
+			marker = (items[kept][1][0], ValueError(f"{TRUNCATED_RESPONSE}: {len(items) - kept} pares omitidos (máximo de {max_fragments} fragmentos).")) # OID do primeiro par omitido
+			out = bytearray() # Erro codificado (para medir o tamanho)
+			encode_value(out, marker)
+			if not sizes or used + len(out) <= max_size: # Se o erro couber (ou o fragmento só puder levar o erro)
+				errors.append(marker)
+				break
+			(errors if errors else pairs).pop() # Omitir também o último par do fragmento (os erros estão depois das instâncias)
+			used -= sizes.pop()
+			kept -= 1
+		fragments.append((errors, pairs)) # Último fragmento
+
+		return [SNMPKeySharePDU(S=self.S, NS=self.NS, Q=self.Q, P=self.P, Y=self.Y, NL_or_NW=len(pairs), L_or_W=pairs, NR=len(errors), R=errors, F=index, NF=len(fragments)).serialize() for index, (errors, pairs) in enumerate(fragments)] # Codificar os fragmentos
 
 	@staticmethod
-	def deserialize(data):
+	def reassemble(fragments):
+
+		"""Junta os fragmentos (PDUs com o mesmo P e NF, por qualquer ordem) numa única resposta"""
+
+		fragments = sorted(fragments, key=lambda pdu: pdu.F) # Ordenar pelo índice
+		first = fragments[0] # Primeiro fragmento
+		if [pdu.F for pdu in fragments] != list(range(first.NF)) or any(pdu.P != first.P or pdu.NF != first.NF for pdu in fragments): # Se faltarem ou sobrarem fragmentos
+			raise ValueError(f"Fragmentos inconsistentes da resposta ao pedido {first.P}.") # Lançar uma exceção
+		L_or_W = [pair for pdu in fragments for pair in pdu.L_or_W] # Pares de todos os fragmentos, pela ordem original
+		R = [error for pdu in fragments for error in pdu.R] # Erros de todos os fragmentos
+		return SNMPKeySharePDU(S=first.S, NS=first.NS, Q=first.Q, P=first.P, Y=first.Y, NL_or_NW=len(L_or_W), L_or_W=L_or_W, NR=sum(pdu.NR for pdu in fragments), R=R) # Retornar a resposta completa
+
+	@staticmethod
+	def deserialize(data, allow_pickle=False):
+
+		"""Deserializar bytes para um PDU, detetando a codificação; pickle só é aceite se allow_pickle for verdadeiro"""
+
+		wire_format = detect_wire_format(data) # Codificação do datagrama
+		if wire_format == "pickle": # Se o datagrama for um pickle
+			if not allow_pickle: # Se pickle não for aceite
+				raise ValueError("PDUs codificados com pickle não são aceites.") # Lançar uma exceção
+			pdu = pickle.loads(data) # Deserializar o PDU
+			if not isinstance(pdu, SNMPKeySharePDU): # Se o pickle não for um PDU
+				raise ValueError(f"O pickle contém um {type(pdu).__name__} e não um PDU.") # Lançar uma exceção
+			pdu.validate() # Verificar a forma dos campos
+			return pdu
+		if wire_format != "binary": # Se a codificação for desconhecida
+			raise ValueError("Codificação de PDU desconhecida.") # Lançar uma exceção
+
+		view = memoryview(data) # Ler os campos sem copiar o datagrama
+		if len(view) < 2 or view[1] not in (WIRE_VERSION, WIRE_VERSION_FRAGMENT): # Se a versão não for suportada
+			raise ValueError(f"Versão {view[1] if len(view) > 1 else '?'} da codificação de PDU não suportada.") # Lançar uma exceção
+		try:
+			F, NF, pos = 0, 1, 2 # PDU completo
+			if view[1] == WIRE_VERSION_FRAGMENT: # Se o PDU for um fragmento
+				F, pos = decode_int(view, pos) # Índice do fragmento
+				NF, pos = decode_int(view, pos) # Número de fragmentos
+			S, pos = decode_int(view, pos) # Modelo de segurança
+			NS, pos = decode_int(view, pos) # Número de parâmetros de segurança
+			Q, pos = decode_list(view, pos) # Parâmetros de segurança
+			P, pos = decode_int(view, pos) # Identificação do pedido
+			Y, pos = decode_int(view, pos) # Tipo de primitiva
+			NL_or_NW, pos = decode_int(view, pos) # Número de instâncias
+			L_or_W, pos = decode_list(view, pos) # Lista de instâncias e valores
+			NR, pos = decode_int(view, pos) # Número de erros
+			R, pos = decode_list(view, pos) # Lista de erros
+		except (IndexError, UnicodeDecodeError, RecursionError): # Se o datagrama estiver truncado ou corrompido
+			raise ValueError("PDU truncado ou corrompido.") # Lançar uma exceção
+		if pos != len(view): # Se sobrarem bytes
+			raise ValueError("PDU com bytes a mais.") # Lançar uma exceção
+		if not 0 <= F < NF: # Se o índice do fragmento for inválido
+			raise ValueError(f"Fragmento {F} de {NF} inválido.") # Lançar uma exceção
+		pdu = SNMPKeySharePDU(S=S, NS=NS, Q=Q, P=P, Y=Y, NL_or_NW=NL_or_NW, L_or_W=L_or_W, NR=NR, R=R, F=F, NF=NF) # PDU descodificado
+		pdu.validate() # Verificar a forma dos campos (a codificação aceita qualquer estrutura etiquetada)
+		return pdu # Retornar o PDU
+
+	def validate(self):
 
-		"""Deserializar uma string para um PDU usando pickle"""
+		"""Verifica que o PDU tem a forma esperada (P, Y e NL/NW inteiros, L/W uma lista de pares com OIDs em
+		texto e, num get, números de instâncias inteiros); lança ValueError se não tiver"""
 
-		return pickle.loads(data) # Deserializar o PDU
+		if not all(isinstance(field, int) for field in (self.P, self.Y, self.NL_or_NW, self.NR, self.F, self.NF)): # Se algum contador não for inteiro
+			raise ValueError("PDU com campos P, Y, NL/NW, NR, F ou NF não inteiros.") # Lançar uma exceção
+		if not isinstance(self.L_or_W, list) or not isinstance(self.R, list): # Se as listas não forem listas
+			raise ValueError("PDU com as listas L/W ou R inválidas.") # Lançar uma exceção
+		for pair in self.L_or_W: # Para cada par (OID, valor)
+			if not isinstance(pair, (tuple, list)) or len(pair) != 2 or not isinstance(pair[0], str): # Se não for um par com um OID
+				raise ValueError(f"Par inválido na lista L/W: {pair!r}.") # Lançar uma exceção
+			if self.Y == 1 and (not isinstance(pair[1], int) or isinstance(pair[1], bool)): # Num get o valor é o número de instâncias
+				raise ValueError(f"Número de instâncias inválido no get de {pair[0]}: {pair[1]!r}.") # Lançar uma exceção
 
 	def __str__(self):
 
@@ -0,0 +1,195 @@
+import threading
+import time
+from array import array
+
+
+SUB_BUCKET_BITS = 5 # Sub-baldes por potência de 2 (2^5 = 32: erro relativo máximo de 1/32, cerca de 3%)
+SUB_BUCKETS = 1 << SUB_BUCKET_BITS # Número de sub-baldes por potência de 2
+BUCKETS = (65 - SUB_BUCKET_BITS) << SUB_BUCKET_BITS # Baldes para valores até 2^64
+
+
+def bucket_index(value):
+
+	"""Retorna o balde de um valor: valores abaixo de 2 * SUB_BUCKETS têm um balde cada; acima disso cada
+	potência de 2 é dividida em SUB_BUCKETS baldes de igual largura (escala log-linear, como o HdrHistogram)"""
+
+	if value < 2 * SUB_BUCKETS: # Valores pequenos: balde exato
+		return value if value > 0 else 0
+	shift = value.bit_length() - SUB_BUCKET_BITS - 1 # Bits abaixo da precisão guardada
+	return (shift << SUB_BUCKET_BITS) + (value >> shift) # Potência de 2 e sub-balde
+
+
+def bucket_bounds(index):
+
+	"""Retorna o menor e o maior valor do balde index"""
+
+	if index < 2 * SUB_BUCKETS: # Balde exato
+		return index, index
+	shift = (index >> SUB_BUCKET_BITS) - 1 # Bits abaixo da precisão guardada
+	low = (index - (shift << SUB_BUCKET_BITS)) << shift # Primeiro valor do balde
+	return low, low + (1 << shift) - 1
+
+
+class LatencyHistogram:
+
+	"""Histograma de latências (nanossegundos) com baldes log-linear de tamanho fixo
+
+	No atendimento dos pedidos os valores são registados com add, que só os acrescenta a um array (uma
+	chamada em C, sem o custo de uma função Python); são agregados nos baldes por flush, chamado pela
+	atualização das chaves e antes de cada leitura. A contagem é a soma dos baldes. Os percentis são o
+	maior valor do balde onde caem, com um erro relativo máximo de 1/SUB_BUCKETS.
+	"""
+
+	def __init__(self):
+
+		"""Construtor da classe"""
+
+		self.counts = [0] * BUCKETS # Contagem de cada balde (lista: o incremento é mais rápido do que num array)
+		self.max = 0 # Maior valor registado
+		self.pending = array("q") # Valores registados com add ainda por agregar (8 bytes cada)
+		self.add = self.pending.append # Registo diferido de um valor (usado no atendimento dos pedidos)
+		self.flush_lock = threading.Lock() # Um valor pendente só é agregado uma vez
+
+	def record(self, value):
+
+		"""Regista um valor (nanossegundos)"""
+
+		if value >= 2 * SUB_BUCKETS: # Caso habitual (cálculo de bucket_index sem a chamada)
+			shift = value.bit_length() - SUB_BUCKET_BITS - 1
+			self.counts[(shift << SUB_BUCKET_BITS) + (value >> shift)] += 1
+		else:
+			self.counts[bucket_index(value)] += 1
+		if value > self.max: # Se for o maior valor
+			self.max = value
+
+	def flush(self):
+
+		"""Agrega nos baldes os valores registados com add
+
+		Só é removido do array o prefixo agregado (com o GIL, del é atómico), pelo que os valores
+		acrescentados entretanto por outras threads ficam para o próximo flush e add continua válido.
+		"""
+
+		with self.flush_lock:
+			pending = self.pending # Valores por agregar
+			length = len(pending) # Valores presentes neste momento
+			if not length: # Caso habitual entre leituras
+				return
+			values = pending[:length] # Cópia do prefixo
+			del pending[:length]
+			record = self.record # Referência local
+			for value in values: # Para cada valor
+				record(value)
+
+	@property
+	def count(self):
+
+		"""Número de valores registados"""
+
+		self.flush() # Incluir os valores pendentes
+		return sum(self.counts)
+
+	def percentile(self, q):
+
+		"""Retorna o valor abaixo do qual está a fração q (0 a 1) dos valores registados (0 se não houver valores)"""
+
+		count = self.count # Número de valores registados (inclui os pendentes)
+		if not count: # Se não houver valores
+			return 0
+		target = max(1, int(q * count + 0.999999)) # Posição do valor pedido (arredondada para cima)
+		seen = 0 # Valores contados até ao balde atual
+		for index, bucket_count in enumerate(self.counts): # Para cada balde
+			seen += bucket_count
+			if seen >= target: # Se o valor estiver neste balde
+				return min(bucket_bounds(index)[1], self.max) # Maior valor do balde
+		return self.max
+
+	def summary(self):
+
+		"""Retorna o resumo do histograma (contagem, percentis e máximo, em nanossegundos)"""
+
+		return {"count": self.count, "p50": self.percentile(0.5), "p99": self.percentile(0.99), "p999": self.percentile(0.999), "max": self.max}
+
+
+class MetricsRegistry:
+
+	"""Registo de contadores e histogramas de latência do agente
+
+	Com enabled falso os contadores continuam a ser mantidos (um incremento cada) mas o agente não mede
+	latências: os histogramas ficam vazios. Como nos histogramas, os incrementos dos contadores são só
+	acrescentados a um array (append, atómico com o GIL) e somados ao valor do contador por flush e antes
+	de cada leitura, pelo que nenhum incremento concorrente se perde e o atendimento não usa locks.
+	"""
+
+	def __init__(self, enabled=True):
+
+		"""Construtor da classe"""
+
+		self.enabled = enabled # Medir as latências
+		self.counters = {} # Nome -> valor (sem os incrementos pendentes)
+		self.pending_counts = {} # Nome -> incrementos ainda por somar
+		self.counters_lock = threading.Lock() # Criação dos contadores e soma dos incrementos pendentes
+		self.histograms = {} # Nome -> LatencyHistogram
+		self.started = time.time() # Início da contagem
+
+	def counter(self, name):
+
+		"""Cria (com zero) o contador name, se não existir, e retorna a função que lhe soma um incremento
+		(usada no atendimento dos pedidos)"""
+
+		pending = self.pending_counts.get(name) # Incrementos pendentes do contador
+		if pending is None: # Se o contador não existir
+			with self.counters_lock:
+				pending = self.pending_counts.get(name) # Criado entretanto por outra thread
+				if pending is None:
+					self.counters[name] = 0
+					pending = self.pending_counts[name] = array("q")
+		return pending.append
+
+	def count(self, name, delta=1):
+
+		"""Soma delta ao contador name"""
+
+		self.counter(name)(delta)
+
+	def value(self, name):
+
+		"""Retorna o valor do contador name (incluindo os incrementos pendentes)"""
+
+		self.flush_counters()
+		return self.counters.get(name, 0)
+
+	def flush_counters(self):
+
+		"""Soma aos contadores os incrementos pendentes (só o prefixo presente: os acrescentados entretanto ficam para a próxima vez)"""
+
+		with self.counters_lock:
+			for name, pending in self.pending_counts.items(): # Para cada contador
+				length = len(pending) # Incrementos presentes neste momento
+				if length: # Se houver incrementos
+					self.counters[name] += sum(pending[:length])
+					del pending[:length]
+
+	def histogram(self, name):
+
+		"""Retorna o histograma name (criado se não existir)"""
+
+		histogram = self.histograms.get(name) # Histograma existente
+		if histogram is None: # Se não existir
+			histogram = self.histograms[name] = LatencyHistogram()
+		return histogram
+
+	def flush(self):
+
+		"""Agrega os valores pendentes de todos os histogramas e contadores (chamado periodicamente, para limitar a memória)"""
+
+		for histogram in list(self.histograms.values()): # Para cada histograma
+			histogram.flush()
+		self.flush_counters()
+
+	def report(self, gauges=None):
+
+		"""Retorna um dicionário com os contadores, os valores instantâneos (gauges) e o resumo de cada histograma"""
+
+		self.flush_counters() # Incluir os incrementos pendentes
+		return {"time": time.time(), "uptime": time.time() - self.started, "counters": dict(self.counters), "gauges": dict(gauges or {}), "latency_ns": {name: histogram.summary() for name, histogram in self.histograms.items()}}
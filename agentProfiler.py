@@ -0,0 +1,231 @@
+import json
+import os
+import sys
+import threading
+import time
+from collections import deque
+from itertools import count
+
+from fileUtils import write_file_atomically
+
+
+class StackSampler:
+
+	"""Profiler por amostragem: uma thread lê a pilha de todas as outras threads a cada interval segundos
+	e conta cada pilha distinta
+
+	O ficheiro tem o formato collapsed-stack (uma pilha por linha, "thread;função (ficheiro:linha);...
+	contagem"), lido por ferramentas de flame graphs como o flamegraph.pl e o speedscope. As threads
+	bloqueadas (à espera de datagramas ou do próximo tick) também são amostradas, com as funções onde
+	esperam no topo da pilha. O ficheiro é reescrito a cada write_interval segundos e quando o
+	profiler para.
+	"""
+
+	def __init__(self, path, interval=0.005, write_interval=10):
+
+		"""Construtor da classe"""
+
+		if interval <= 0: # Se o intervalo for inválido
+			raise ValueError(f"O intervalo de amostragem tem de ser positivo (recebido {interval}).") # Lançar uma exceção
+		self.path = path # Ficheiro collapsed-stack
+		self.interval = interval # Intervalo entre amostras (segundos)
+		self.write_interval = write_interval # Intervalo entre escritas do ficheiro (segundos)
+		self.counts = {} # Pilha -> número de amostras
+		self.samples = 0 # Amostras recolhidas
+		self.stopping = threading.Event() # Pedido de paragem
+		self.thread = None # Thread de amostragem
+
+	def start(self):
+
+		"""Inicia a thread de amostragem"""
+
+		self.thread = threading.Thread(target=self.run, name="stack-sampler", daemon=True)
+		self.thread.start()
+
+	def stop(self):
+
+		"""Para a thread de amostragem e escreve o ficheiro"""
+
+		self.stopping.set()
+		if self.thread is not None: # Se a thread tiver sido iniciada
+			self.thread.join()
+		self.write()
+
+	def run(self):
+
+		"""Ciclo da thread de amostragem"""
+
+		own = threading.get_ident() # A thread do profiler não é amostrada
+		written_at = time.monotonic() # Última escrita do ficheiro
+		while not self.stopping.wait(self.interval): # Até ao pedido de paragem
+			names = {thread.ident: thread.name for thread in threading.enumerate()} # Nome de cada thread
+			for ident, frame in sys._current_frames().items(): # Para cada thread
+				if ident == own:
+					continue
+				stack = [] # Funções da pilha, do topo para a base
+				while frame is not None:
+					code = frame.f_code
+					stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+					frame = frame.f_back
+				stack.append(names.get(ident, str(ident))) # Base: nome da thread
+				key = ";".join(reversed(stack)) # Pilha da base para o topo
+				self.counts[key] = self.counts.get(key, 0) + 1
+			self.samples += 1
+			if time.monotonic() - written_at >= self.write_interval: # Se for altura de escrever o ficheiro
+				self.write()
+				written_at = time.monotonic()
+
+	def write(self):
+
+		"""Escreve as pilhas contadas no ficheiro collapsed-stack"""
+
+		lines = "".join(f"{stack} {samples}\n" for stack, samples in sorted(self.counts.items())) # Uma pilha por linha
+		write_file_atomically(self.path, lines.encode("utf-8"))
+
+
+class RequestTracer:
+
+	"""Rastreio de pedidos: cada datagrama descodificado recebe um identificador e o tempo de cada fase
+	do seu atendimento é registado numa linha JSON
+
+	As fases são decode, response (snmpkeyshare_response, que inclui replay_check, mib_lookup e
+	key_gen, disjuntas) e encode; total vai do início da descodificação ao fim da codificação e inclui as esperas
+	(fila de pedidos, lock da MIB, journal). Só são escritos os pedidos com total de pelo menos
+	threshold_ns. O rastreio é instalado substituindo, na instância do agente e da MIB, os métodos de
+	cada fase por versões medidas; ao desinstalar os atributos são removidos e o agente volta a usar os
+	métodos da classe, pelo que o rastreio desligado não tem qualquer custo.
+	"""
+
+	AGENT_PHASES = {"record_request": "replay_check", "generate_and_add_keys": "key_gen"} # Métodos do agente medidos como fases
+	MIB_PHASES = {"get": "mib_lookup", "get_next": "mib_lookup", "set": "mib_lookup"} # Métodos da MIB medidos como fases
+
+	def __init__(self, agent, path, threshold_ns=0):
+
+		"""Construtor da classe"""
+
+		self.agent = agent # Agente rastreado
+		self.path = path # Ficheiro das linhas JSON
+		self.threshold_ns = threshold_ns # Duração mínima dos pedidos escritos
+		self.ids = count(1) # Identificadores dos pedidos
+		self.local = threading.local() # Pedido em processamento em cada thread
+		self.lock = threading.Lock() # Escrita das linhas
+		self.file = None # Ficheiro aberto (None se o rastreio não estiver instalado)
+		self.installed = [] # (objeto, nome) dos métodos substituídos
+		self.written = 0 # Pedidos escritos
+
+	def install(self):
+
+		"""Abre o ficheiro e substitui os métodos do agente e da MIB pelas versões medidas"""
+
+		agent, mib = self.agent, self.agent.mib # Objetos rastreados
+		self.file = open(self.path, "a", encoding="utf-8")
+		wrappers = [(agent, "decode_datagram", self.traced_decode(agent.decode_datagram)), (agent, "respond_batch", self.traced_batch(agent.respond_batch)), (agent, "snmpkeyshare_response", self.traced_response(agent.snmpkeyshare_response)), (agent, "encode_response", self.traced_encode(agent.encode_response))] # Limites do pedido
+		wrappers += [(agent, name, self.traced_phase(phase, getattr(agent, name))) for name, phase in self.AGENT_PHASES.items()] # Fases do agente
+		wrappers += [(mib, name, self.traced_phase(phase, getattr(mib, name))) for name, phase in self.MIB_PHASES.items()] # Fases da MIB
+		for target, name, wrapper in wrappers: # Para cada método
+			setattr(target, name, wrapper) # O atributo da instância tem precedência sobre o método da classe
+			self.installed.append((target, name))
+
+	def uninstall(self):
+
+		"""Repõe os métodos da classe e fecha o ficheiro"""
+
+		for target, name in self.installed: # Para cada método substituído
+			target.__dict__.pop(name, None)
+		self.installed = []
+		with self.lock:
+			self.file.close()
+			self.file = None
+
+	def traced_decode(self, decode):
+
+		"""Descodificação: cria o registo do pedido e associa-o ao PDU"""
+
+		def wrapper(data, addr):
+			start = time.perf_counter_ns()
+			request = decode(data, addr)
+			end = time.perf_counter_ns()
+			if request is not None: # Se o datagrama for válido
+				request[0].trace = {"trace": next(self.ids), "addr": addr[0], "start": start, "phases": {"decode": end - start}} # Registo do pedido
+			return request
+		return wrapper
+
+	def traced_batch(self, respond_batch):
+
+		"""Lote: os registos dos pedidos, pela ordem em que snmpkeyshare_response os vai processar"""
+
+		def wrapper(requests, blocking=True):
+			self.local.pending = deque(getattr(pdu, "trace", None) for pdu, _, _ in requests)
+			return respond_batch(requests, blocking)
+		return wrapper
+
+	def traced_response(self, respond):
+
+		"""Processamento: o registo do pedido fica como o pedido atual da thread, para as fases internas"""
+
+		def wrapper(P, NL_or_NW, L_or_W, Y, addr=None):
+			pending = getattr(self.local, "pending", None) # Registos do lote
+			trace = pending.popleft() if pending else None # Registo deste pedido
+			self.local.current = trace
+			start = time.perf_counter_ns()
+			try:
+				return respond(P, NL_or_NW, L_or_W, Y, addr)
+			finally:
+				self.local.current = None
+				if trace is not None: # Se o pedido estiver a ser rastreado
+					trace["P"], trace["Y"] = P, Y
+					trace["phases"]["response"] = time.perf_counter_ns() - start
+		return wrapper
+
+	def traced_phase(self, phase, method):
+
+		"""Fase interna: o tempo é somado ao pedido atual da thread (chamadas fora de um pedido não são medidas)
+
+		Durante a fase o pedido deixa de ser o atual, pelo que as fases chamadas dentro de outra (ex.: as
+		leituras da MIB feitas pela geração das chaves) contam apenas para a fase exterior.
+		"""
+
+		local = self.local # Referência local
+		def wrapper(*args, **kwargs):
+			trace = getattr(local, "current", None) # Pedido atual
+			if trace is None: # Chamada fora de um pedido (ex.: atualização das chaves) ou dentro de outra fase
+				return method(*args, **kwargs)
+			local.current = None # As fases internas a esta não são medidas
+			start = time.perf_counter_ns()
+			try:
+				return method(*args, **kwargs)
+			finally:
+				local.current = trace
+				phases = trace["phases"]
+				phases[phase] = phases.get(phase, 0) + time.perf_counter_ns() - start
+		return wrapper
+
+	def traced_encode(self, encode):
+
+		"""Codificação: completa o registo do pedido e escreve-o"""
+
+		def wrapper(request_pdu, response_pdu, wire_format):
+			start = time.perf_counter_ns()
+			datagrams = encode(request_pdu, response_pdu, wire_format)
+			end = time.perf_counter_ns()
+			trace = getattr(request_pdu, "trace", None) # Registo do pedido
+			if trace is not None: # Se o pedido estiver a ser rastreado
+				trace["phases"]["encode"] = end - start
+				self.write(trace, end - trace.pop("start"))
+			return datagrams
+		return wrapper
+
+	def write(self, trace, total):
+
+		"""Escreve o registo de um pedido (tempos em microssegundos), se durar pelo menos threshold_ns"""
+
+		if total < self.threshold_ns: # Pedido rápido
+			return
+		trace["total_us"] = round(total / 1000, 1)
+		trace["phases"] = {phase: round(elapsed / 1000, 1) for phase, elapsed in trace["phases"].items()}
+		trace["time"] = time.time()
+		line = json.dumps(trace) + "\n" # Uma linha por pedido
+		with self.lock:
+			if self.file is not None: # Se o rastreio não tiver sido desinstalado entretanto
+				self.file.write(line)
+				self.written += 1
@@ -0,0 +1,114 @@
+"""Débito e latência do agente sob rajadas de pedidos: modo single (um recvfrom/sendto por PDU) e modo batch
+
+Para cada modo é lançado um agente num processo próprio; cada cliente envia rajadas de pedidos get sem
+esperar pelas respostas e depois recolhe-as, medindo a latência de cada pedido desde o envio da rajada.
+
+Execução (a partir da raiz do repositório):
+
+	python benchmarks/bench_batch_io.py
+	python benchmarks/bench_batch_io.py --burst 256 --batch-size 128 --clients 4
+"""
+
+import argparse
+import multiprocessing
+import os
+import socket
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__)))) # Permitir importar os módulos do repositório
+
+from SNMPKeyShareAgent import SNMPKeyShareAgent
+from SNMPKeySharePDU import SNMPKeySharePDU
+
+
+def run_agent(port, mode, batch_size):
+
+	"""Processo do agente: atende pedidos no modo indicado até ser terminado"""
+
+	os.chdir(tempfile.mkdtemp()) # Não usar o estado da MIB guardado no repositório
+	sys.stdout = open(os.devnull, "w") # Silenciar as mensagens do agente
+	agent = SNMPKeyShareAgent(10, "07994506586870582927", 10000, 60, 100, None) # Instanciar o agente
+	agent.running = True # Atender pedidos sem a thread de atualização das chaves
+	agent.serve("127.0.0.1", port, mode, batch_size=batch_size) # Iniciar o agente
+
+
+def run_client(client, port, duration, burst, results):
+
+	"""Processo cliente: envia rajadas de burst pedidos e recolhe as respostas durante duration segundos"""
+
+	latencies = [] # Latência de cada pedido respondido
+	lost = 0 # Pedidos sem resposta
+	pdu = SNMPKeySharePDU(Y=1, NL_or_NW=2, L_or_W=[("1.1.0", 0), ("1.3.0", 0)]) # Get simples
+	with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+		sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 20) # Espaço para as respostas de uma rajada
+		sock.settimeout(0.5) # Tempo máximo de espera por uma resposta
+		deadline = time.perf_counter() + duration # Fim da medição
+		sent = 0 # Número de pedidos enviados
+		while time.perf_counter() < deadline: # Até ao fim da medição
+			datagrams = [] # Pedidos da rajada
+			for _ in range(burst): # Para cada pedido da rajada
+				pdu.P = client * 10 ** 8 + sent # Identificador único do pedido
+				sent += 1
+				datagrams.append(pdu.serialize())
+			start = time.perf_counter()
+			for datagram in datagrams: # Enviar a rajada
+				sock.sendto(datagram, ("127.0.0.1", port))
+			for received in range(burst): # Recolher as respostas
+				try:
+					sock.recvfrom(65535)
+				except socket.timeout: # Se faltarem respostas
+					lost += burst - received
+					break
+				latencies.append(time.perf_counter() - start) # Latência desde o envio da rajada
+	results.put((latencies, lost)) # Entregar os resultados
+
+
+def measure(mode, args, port):
+
+	"""Mede o débito e as latências de um agente no modo indicado"""
+
+	agent = multiprocessing.Process(target=run_agent, args=(port, mode, args.batch_size), daemon=True) # Processo do agente
+	agent.start()
+	time.sleep(1) # Esperar que o agente esteja a ouvir
+
+	results = multiprocessing.Queue() # Resultados dos clientes
+	clients = [multiprocessing.Process(target=run_client, args=(client, port, args.duration, args.burst, results)) for client in range(args.clients)] # Clientes
+	for client in clients:
+		client.start()
+	latencies, lost = [], 0 # Resultados agregados
+	for _ in clients: # Para cada cliente
+		client_latencies, client_lost = results.get()
+		latencies += client_latencies
+		lost += client_lost
+	for client in clients:
+		client.join()
+	agent.terminate() # Terminar o agente
+	agent.join()
+
+	latencies.sort() # Ordenar as latências para os percentis
+	percentile = lambda q: latencies[min(len(latencies) - 1, int(q * len(latencies)))] * 1000 if latencies else float("nan") # Percentil em ms
+	print(f"{mode:>7} {len(latencies) / args.duration:>10.0f} {percentile(0.5):>8.2f} {percentile(0.99):>8.2f} {lost:>8}")
+
+
+def main():
+
+	"""Função principal"""
+
+	parser = argparse.ArgumentParser(description=__doc__.splitlines()[0]) # Argumentos da linha de comandos
+	parser.add_argument("--modes", nargs="+", default=["single", "batch"], help="modos de atendimento a comparar")
+	parser.add_argument("--clients", type=int, default=2, help="número de clientes em paralelo")
+	parser.add_argument("--burst", type=int, default=64, help="pedidos por rajada")
+	parser.add_argument("--batch-size", type=int, default=64, help="datagramas por lote do modo batch")
+	parser.add_argument("--duration", type=float, default=5, help="duração de cada medição (segundos)")
+	parser.add_argument("--port", type=int, default=17361, help="primeira porta UDP local a usar")
+	args = parser.parse_args()
+
+	print(f"{'modo':>7} {'pedidos/s':>10} {'p50 ms':>8} {'p99 ms':>8} {'perdidos':>8}")
+	for offset, mode in enumerate(args.modes): # Para cada modo
+		measure(mode, args, args.port + offset) # Medir o modo numa porta própria
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,47 @@
+"""Benchmark do motor de chaves (keyMaintenance): generate_matrices, process_Z e generate_key
+
+Execução (a partir da raiz do repositório):
+
+	python benchmarks/bench_key_maintenance.py
+"""
+
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__)))) # Permitir importar os módulos do repositório
+
+from keyMaintenance import generate_key, generate_matrices, numpy, process_Z, select_z_engine
+
+
+K_VALUES = [10, 64, 256, 1024] # Tamanhos de chave (K) a medir
+ENGINES = ["python"] + (["numpy"] if numpy is not None else []) # Motores da matriz Z disponíveis
+REPEAT = 5 # Número de repetições (é reportada a melhor)
+
+
+def best_of(function, number):
+
+	"""Retorna o tempo médio (segundos) de uma chamada de function, na melhor de REPEAT repetições"""
+
+	return min(timeit.repeat(function, number=number, repeat=REPEAT)) / number # Melhor tempo por chamada
+
+
+def main():
+
+	"""Função principal"""
+
+	print(f"{'K':>5} {'motor':>7} {'generate_matrices (ms)':>23} {'process_Z (ms)':>15} {'generate_key (µs)':>18}")
+	for K in K_VALUES: # Para cada tamanho de chave
+		M = [random.randint(0, 9) for _ in range(2 * K)] # Chave mestra com 2K dígitos
+		matrices = best_of(lambda: generate_matrices(M, K, use_zs=False), 3) # Custo de generate_matrices
+		for engine in ENGINES: # Para cada motor da matriz Z
+			Z = select_z_engine(generate_matrices(M, K, use_zs=False), engine) # Matriz Z inicial no motor
+			tick = best_of(lambda: process_Z(Z), 10) # Custo de um tick de process_Z
+			counter = iter(range(10 ** 9)) # Valores de N sempre diferentes (inclui N fora da tabela de sementes)
+			key = best_of(lambda: generate_key(Z, next(counter), 33, 94), 1000) # Custo de generate_key
+			print(f"{K:>5} {engine:>7} {matrices * 1e3:>23.2f} {tick * 1e3:>15.2f} {key * 1e6:>18.1f}") # Imprimir os resultados
+
+
+if __name__ == "__main__": # Se o script for executado diretamente
+	main() # Executar a função main
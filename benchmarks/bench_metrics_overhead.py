@@ -0,0 +1,105 @@
+"""Custo das métricas no atendimento dos pedidos: agente com e sem métricas (descodificação, resposta e codificação)
+
+São criados três agentes (sem journal) com --keys chaves, um com métricas e dois sem, e cada um atende
+os mesmos --requests datagramas já codificados, como no modo single (decode_datagram seguido de
+respond), sem sockets. Os agentes alternam a cada pedido, para que o ruído da máquina os afete por
+igual, e é reportada a mediana do tempo por pedido de cada um e a diferença relativa ao primeiro
+agente sem métricas; a diferença do segundo agente sem métricas (o mesmo código) dá o ruído da
+medição. É também reportado o custo de um registo num histograma e de uma leitura do relógio.
+
+Execução (a partir da raiz do repositório):
+
+	python benchmarks/bench_metrics_overhead.py
+	python benchmarks/bench_metrics_overhead.py --requests 50000 --mix set
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__)))) # Permitir importar os módulos do repositório
+
+from agentMetrics import LatencyHistogram
+from SNMPKeySharePDU import SNMPKeySharePDU
+
+
+def make_agent(metrics, keys):
+
+	"""Cria um agente (sem journal) com keys chaves visíveis a todos"""
+
+	from SNMPKeyShareAgent import SNMPKeyShareAgent
+	sys.stdout, stdout = open(os.devnull, "w"), sys.stdout # Silenciar as mensagens do agente
+	try:
+		agent = SNMPKeyShareAgent(10, "07994506586870582927", 10000, 60, keys + 1, None, metrics=metrics)
+	finally:
+		sys.stdout = stdout
+	agent.mib.set("1.6.0", 3600) # As chaves não expiram durante a medição
+	for batch in range(keys // 100): # Lotes de 100 chaves (P distintos: não são repetições)
+		agent.respond(SNMPKeySharePDU(P=batch + 1, Y=2, NL_or_NW=100, L_or_W=[("3.2.1.6.0", 2)] * 100), "binary", ("127.0.0.1", 1))
+	return agent
+
+
+def make_datagrams(args):
+
+	"""Retorna os datagramas dos pedidos, com identificadores P distintos (não são repetições)"""
+
+	datagrams = [] # Pedidos codificados
+	for offset in range(args.requests): # Para cada pedido
+		if args.mix == "set": # Set: gerar uma chave
+			L_or_W = [("3.2.1.6.0", 2)]
+		else: # Get: uma chave e um escalar
+			L_or_W = [(f"3.2.1.2.{offset % args.keys + 1}", 0), ("3.1.0", 0)]
+		datagrams.append(SNMPKeySharePDU(P=offset + 1, Y=2 if args.mix == "set" else 1, NL_or_NW=len(L_or_W), L_or_W=L_or_W).serialize())
+	return datagrams
+
+
+def serve(agent, data, addr):
+
+	"""Atende um datagrama e retorna o tempo em nanossegundos"""
+
+	start = time.perf_counter_ns()
+	request = agent.decode_datagram(data, addr) # Descodificar
+	agent.respond(*request, addr) # Processar e codificar a resposta
+	return time.perf_counter_ns() - start
+
+
+def main():
+
+	"""Função principal"""
+
+	parser = argparse.ArgumentParser(description=__doc__.splitlines()[0]) # Argumentos da linha de comandos
+	parser.add_argument("--keys", type=int, default=10000, help="número de chaves na tabela")
+	parser.add_argument("--requests", type=int, default=30000, help="pedidos atendidos por cada agente")
+	parser.add_argument("--mix", choices=("get", "set"), default="get", help="primitiva dos pedidos")
+	args = parser.parse_args()
+
+	os.chdir(tempfile.mkdtemp()) # O agente não encontra estado guardado
+	agents = {"sem métricas": make_agent(False, args.keys), "sem métricas (2)": make_agent(False, args.keys), "com métricas": make_agent(True, args.keys)} # Agentes medidos
+	times = {name: [] for name in agents} # Tempo de cada pedido
+	addr = ("127.0.0.1", 40000) # Endereço do gestor
+	for agent in agents.values(): # Cada set gera uma chave: aumentar o limite de chaves
+		agent.X += args.requests
+	for index, data in enumerate(make_datagrams(args)): # Para cada pedido
+		for name in (list(agents) if index % 2 else list(agents)[::-1]): # Alternar a ordem dos agentes
+			times[name].append(serve(agents[name], data, addr))
+	median = {name: statistics.median(values) / 1000 for name, values in times.items()} # Mediana por agente (µs)
+
+	histogram = LatencyHistogram() # Custo das operações de medição
+	record = timeit.timeit("record(23456)", globals={"record": histogram.record}, number=200000) / 200000 * 1e9
+	add = timeit.timeit("add(23456)", globals={"add": histogram.add}, number=200000) / 200000 * 1e9
+	clock = timeit.timeit(time.perf_counter_ns, number=200000) / 200000 * 1e9
+
+	print(f"{args.mix}s, {args.keys} chaves, {args.requests} pedidos por agente (mediana):")
+	for name, elapsed in median.items(): # Para cada agente
+		print(f"  {name:<16} {elapsed:8.2f} µs/pedido  ({(elapsed / median['sem métricas'] - 1) * 100:+.1f}%)")
+	print(f"  registo num histograma: {record:6.0f} ns;  registo diferido (add): {add:6.0f} ns;  leitura do relógio: {clock:6.0f} ns")
+	summary = agents["com métricas"].metrics.histogram(args.mix).summary() # Latências medidas pelo próprio agente
+	print(f"  latência do {args.mix} medida no agente: p50 {summary['p50'] / 1000:.1f} µs, p99 {summary['p99'] / 1000:.1f} µs, p999 {summary['p999'] / 1000:.1f} µs")
+
+
+if __name__ == "__main__":
+	main()
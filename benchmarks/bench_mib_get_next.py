@@ -0,0 +1,45 @@
+"""Micro-benchmark do SNMPKeyShareMIB.get_next com tabelas de chaves de tamanho crescente
+
+Execução (a partir da raiz do repositório):
+
+	python benchmarks/bench_mib_get_next.py
+"""
+
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__)))) # Permitir importar os módulos do repositório
+
+from MIB import SNMPKeyShareMIB, expiration_timestamp
+
+
+TABLE_SIZES = [1000, 10000, 100000] # Número de linhas da tabela dataTableGeneratedKeys
+LOOKUPS = 10000 # Número de get_next por medição
+
+
+def build_mib(rows):
+
+	"""Cria uma MIB com rows linhas na tabela dataTableGeneratedKeys"""
+
+	mib = SNMPKeyShareMIB() # Instanciar a MIB
+	for key_id in range(1, rows + 1): # Para cada linha
+		mib.add_entry_to_dataTableGeneratedKeys(key_id, "K" * 10, "127.0.0.1", expiration_timestamp(20300101, 120000), key_id % 3) # Adicionar a linha
+	return mib # Retornar a MIB
+
+
+def main():
+
+	"""Função principal"""
+
+	print(f"{'linhas':>8} {'µs/get_next':>12}")
+	for rows in TABLE_SIZES: # Para cada tamanho da tabela
+		mib = build_mib(rows) # Criar a MIB
+		oids = [f"3.2.1.{random.randint(1, 6)}.{random.randint(1, rows - 1)}" for _ in range(LOOKUPS)] # OIDs de partida aleatórios (exceto o último)
+		elapsed = min(timeit.repeat(lambda: [mib.get_next(oid) for oid in oids], number=1, repeat=5)) # Melhor de 5 repetições
+		print(f"{rows:>8} {elapsed / LOOKUPS * 1e6:>12.2f}") # Imprimir o custo médio por get_next
+
+
+if __name__ == "__main__": # Se o script for executado diretamente
+	main() # Executar a função main
@@ -0,0 +1,136 @@
+"""Persistência da MIB com 100k chaves: pickle da MIB inteira vs. snapshot + journal (write-ahead log)
+
+Mede, num diretório temporário:
+  - a amplificação de escrita para tornar durável cada inserção de uma chave: reescrever a MIB inteira
+    (esquema anterior) vs. acrescentar um registo ao journal;
+  - o débito de inserções registadas com fsync por registo e com commit em grupo;
+  - o tempo de arranque: carregar um snapshot com todas as chaves vs. um snapshot vazio e a repetição
+    do journal com todas as inserções.
+
+Execução (a partir da raiz do repositório):
+
+	python benchmarks/bench_mib_journal.py
+	python benchmarks/bench_mib_journal.py --keys 100000 --sync-ops 2000
+"""
+
+import argparse
+import os
+import pickle
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__)))) # Permitir importar os módulos do repositório
+
+from MIB import SNMPKeyShareMIB, expiration_timestamp
+from mibJournal import MIBJournal, OP_ADD
+
+
+KEY_EXPIRATION = expiration_timestamp(20300101, 120000) # Instante de expiração das chaves (no futuro)
+
+
+def make_key(key_id):
+
+	"""Gera um valor de chave distinto com 10 caracteres"""
+
+	return f"{key_id:010d}"
+
+
+def add_keys(mib, journal, first_key_id, count):
+
+	"""Insere count chaves, uma por registo (como sets com uma chave cada), registando-as no journal"""
+
+	for key_id in range(first_key_id, first_key_id + count): # Para cada chave
+		mib.table.insert(key_id, make_key(key_id), "127.0.0.1", KEY_EXPIRATION, 2)
+		journal.append(OP_ADD, key_id, (make_key(key_id),), "127.0.0.1", KEY_EXPIRATION, (2,))
+
+
+def snapshot_size(keys):
+
+	"""Retorna o tamanho do pickle de uma MIB com keys chaves"""
+
+	mib = SNMPKeyShareMIB()
+	for key_id in range(1, keys + 1):
+		mib.table.insert(key_id, make_key(key_id), "127.0.0.1", KEY_EXPIRATION, 2)
+	return len(pickle.dumps(mib))
+
+
+def write_amplification(args):
+
+	"""Bytes escritos para tornar durável cada uma das keys inserções"""
+
+	small, large = snapshot_size(1000), snapshot_size(args.keys) # O tamanho do pickle cresce linearmente
+	per_key = (large - small) / (args.keys - 1000) # Bytes por chave no pickle
+	base = small - 1000 * per_key # Bytes da MIB vazia
+	rewrite = args.keys * base + per_key * args.keys * (args.keys + 1) / 2 # Soma dos pickles após cada inserção
+
+	journal = MIBJournal("snapshot.pkl", "journal.wal", True, 0.01) # Commit em grupo
+	journal.start(SNMPKeyShareMIB())
+	before = journal.bytes_written # Bytes do snapshot inicial e do cabeçalho
+	add_keys(SNMPKeyShareMIB(), journal, 1, args.keys)
+	journal.flush()
+	appended = journal.bytes_written - before # Bytes do journal
+	journal.close()
+
+	print(f"amplificação de escrita ({args.keys} inserções, durável após cada uma):")
+	print(f"  pickle da MIB inteira: {rewrite / 2 ** 30:10.2f} GiB  ({rewrite / args.keys / 1024:8.1f} KiB por inserção)")
+	print(f"  journal:               {appended / 2 ** 20:10.2f} MiB  ({appended / args.keys:8.1f} B por inserção)")
+
+
+def commit_throughput(args):
+
+	"""Débito de inserções com fsync por registo e com commit em grupo"""
+
+	print("débito das inserções registadas:")
+	for name, interval, count in (("fsync por registo", 0, args.sync_ops), ("commit em grupo (10 ms)", 0.01, args.keys)): # Para cada política
+		journal = MIBJournal("snapshot.pkl", "journal.wal", True, interval)
+		journal.start(SNMPKeyShareMIB())
+		start = time.perf_counter()
+		add_keys(SNMPKeyShareMIB(), journal, 1, count)
+		journal.close() # Escrever os registos pendentes
+		elapsed = time.perf_counter() - start
+		print(f"  {name:<24} {count / elapsed:10.0f} inserções/s  ({journal.fsyncs} fsyncs)")
+
+
+def startup(args):
+
+	"""Tempo de arranque: snapshot com todas as chaves vs. snapshot vazio e repetição do journal"""
+
+	mib = SNMPKeyShareMIB()
+	journal = MIBJournal("snapshot.pkl", "journal.wal", True, 1) # Sem fsync durante a preparação
+	journal.start(mib)
+	add_keys(mib, journal, 1, args.keys)
+	journal.close()
+	start = time.perf_counter()
+	loaded = MIBJournal("snapshot.pkl", "journal.wal").load() # Snapshot vazio + journal
+	replay = time.perf_counter() - start
+	assert len(loaded.table) == args.keys
+
+	MIBJournal("snapshot.pkl", "journal.wal").compact(mib) # Snapshot com todas as chaves
+	start = time.perf_counter()
+	loaded = MIBJournal("snapshot.pkl", "journal.wal").load()
+	snapshot = time.perf_counter() - start
+	assert len(loaded.table) == args.keys
+
+	print(f"arranque com {args.keys} chaves:")
+	print(f"  snapshot compactado:            {snapshot * 1000:8.1f} ms")
+	print(f"  snapshot vazio + journal:       {replay * 1000:8.1f} ms  ({args.keys / replay:.0f} registos/s)")
+
+
+def main():
+
+	"""Função principal"""
+
+	parser = argparse.ArgumentParser(description=__doc__.splitlines()[0]) # Argumentos da linha de comandos
+	parser.add_argument("--keys", type=int, default=100000, help="número de chaves")
+	parser.add_argument("--sync-ops", type=int, default=2000, help="inserções medidas com fsync por registo")
+	args = parser.parse_args()
+
+	os.chdir(tempfile.mkdtemp()) # Ficheiros num diretório temporário
+	write_amplification(args)
+	commit_throughput(args)
+	startup(args)
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,78 @@
+"""Benchmark de memória da tabela dataTableGeneratedKeys: dicionário de InstanceData vs. armazenamento por colunas
+
+Execução (a partir da raiz do repositório):
+
+	python benchmarks/bench_mib_memory.py [número de chaves]
+"""
+
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__)))) # Permitir importar os módulos do repositório
+
+from MIB import InstanceData, SNMPKeyShareMIB, expiration_timestamp
+
+
+DEFAULT_ROWS = 100000 # Número de chaves por omissão
+KEY_SIZE = 10 # Tamanho das chaves (K)
+
+
+def make_key(key_id):
+
+	"""Gera um valor de chave distinto com KEY_SIZE caracteres"""
+
+	return f"{key_id:0{KEY_SIZE}d}" # Chave com KEY_SIZE dígitos
+
+
+def build_dict_layout(rows):
+
+	"""Constrói a tabela com o esquema anterior: seis InstanceData por chave num dicionário plano"""
+
+	mib = {} # Dicionário OID -> InstanceData
+	for key_id in range(1, rows + 1): # Para cada chave
+		mib[f"3.2.1.1.{key_id}"] = InstanceData("RO", "Int", key_id)
+		mib[f"3.2.1.2.{key_id}"] = InstanceData("RO", "Str", make_key(key_id))
+		mib[f"3.2.1.3.{key_id}"] = InstanceData("RO", "Str", "127.0.0.1")
+		mib[f"3.2.1.4.{key_id}"] = InstanceData("RO", "Int", 20300101)
+		mib[f"3.2.1.5.{key_id}"] = InstanceData("RO", "Int", 120000 + key_id % 60)
+		mib[f"3.2.1.6.{key_id}"] = InstanceData("RO", "Int", key_id % 3)
+	return mib # Retornar o dicionário
+
+
+def build_table_layout(rows):
+
+	"""Constrói a tabela com o armazenamento por colunas do SNMPKeyShareMIB"""
+
+	mib = SNMPKeyShareMIB() # Instanciar a MIB
+	expires_at = expiration_timestamp(20300101, 120000) # Instante de expiração da primeira chave
+	for key_id in range(1, rows + 1): # Para cada chave
+		mib.add_entry_to_dataTableGeneratedKeys(key_id, make_key(key_id), "127.0.0.1", expires_at + key_id % 60, key_id % 3)
+	return mib # Retornar a MIB
+
+
+def measure(builder, rows):
+
+	"""Retorna a memória (bytes) retida pela estrutura construída por builder"""
+
+	tracemalloc.start() # Iniciar a contagem de alocações
+	structure = builder(rows) # Construir a estrutura
+	current, _ = tracemalloc.get_traced_memory() # Memória atualmente alocada
+	tracemalloc.stop() # Parar a contagem de alocações
+	del structure # Libertar a estrutura
+	return current # Retornar a memória retida
+
+
+def main():
+
+	"""Função principal"""
+
+	rows = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_ROWS # Número de chaves
+	print(f"{'esquema':>10} {'chaves':>9} {'MiB':>9} {'bytes/chave':>12}")
+	for name, builder in (("dicionário", build_dict_layout), ("colunas", build_table_layout)): # Para cada esquema
+		used = measure(builder, rows) # Memória retida
+		print(f"{name:>10} {rows:>9} {used / 2 ** 20:>9.1f} {used / rows:>12.1f}") # Imprimir o resultado
+
+
+if __name__ == "__main__": # Se o script for executado diretamente
+	main() # Executar a função main
@@ -0,0 +1,79 @@
+"""Escalabilidade do agente com vários processos (SO_REUSEPORT e estado partilhado) em localhost
+
+Para cada número de processos é lançado um agente com serve_processes e medido o débito de pedidos get
+de vários clientes em ciclo fechado (os mesmos clientes do load_generator). O ganho só é visível com
+pelo menos tantos núcleos livres como processos do agente mais clientes.
+
+Execução (a partir da raiz do repositório):
+
+	python benchmarks/bench_multiprocess_scaling.py
+	python benchmarks/bench_multiprocess_scaling.py --processes 1 2 4 8 --clients 16
+"""
+
+import argparse
+import multiprocessing
+import os
+import signal
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__)))) # Permitir importar os módulos do repositório
+
+from SNMPKeyShareAgent import SNMPKeyShareAgent
+from load_generator import run_client
+
+
+def run_agent(port, processes):
+
+	"""Processo do agente: lança processes processos que partilham a porta"""
+
+	os.chdir(tempfile.mkdtemp()) # Estado partilhado e estado da MIB num diretório temporário
+	sys.stdout = open(os.devnull, "w") # Silenciar as mensagens do agente
+	os.setpgrp() # Grupo de processos próprio (para terminar o agente e os seus processos de uma vez)
+	agent = SNMPKeyShareAgent(10, "07994506586870582927", 10000, 60, 100, None) # Instanciar o agente
+	agent.serve_processes("127.0.0.1", port, processes, "shared.bin", 65536, 65536) # Iniciar os processos
+
+
+def measure(processes, args, port):
+
+	"""Retorna o débito (pedidos/s) de um agente com processes processos"""
+
+	agent = multiprocessing.Process(target=run_agent, args=(port, processes)) # Processo do agente
+	agent.start()
+	time.sleep(1 + 0.2 * processes) # Esperar que os processos estejam a ouvir
+
+	results = multiprocessing.Queue() # Resultados dos clientes
+	clients = [multiprocessing.Process(target=run_client, args=(client, port, args.duration, 0, results)) for client in range(args.clients)] # Clientes
+	for client in clients:
+		client.start()
+	answered = sum(len(results.get()[0]) for _ in clients) # Pedidos respondidos
+	for client in clients:
+		client.join()
+	os.killpg(agent.pid, signal.SIGINT) # Terminar o agente e os seus processos
+	agent.join()
+	return answered / args.duration # Pedidos por segundo
+
+
+def main():
+
+	"""Função principal"""
+
+	parser = argparse.ArgumentParser(description=__doc__.splitlines()[0]) # Argumentos da linha de comandos
+	parser.add_argument("--processes", type=int, nargs="+", default=[1, 2, 4], help="números de processos do agente a medir")
+	parser.add_argument("--clients", type=int, default=8, help="número de clientes em paralelo")
+	parser.add_argument("--duration", type=float, default=5, help="duração de cada medição (segundos)")
+	parser.add_argument("--port", type=int, default=17261, help="primeira porta UDP local a usar")
+	args = parser.parse_args()
+
+	print(f"núcleos disponíveis: {os.cpu_count()}")
+	print(f"{'processos':>9} {'pedidos/s':>10} {'ganho':>7}")
+	baseline = None # Débito com o primeiro número de processos
+	for offset, processes in enumerate(args.processes): # Para cada número de processos
+		throughput = measure(processes, args, args.port + offset) # Medir numa porta própria
+		baseline = baseline or throughput
+		print(f"{processes:>9} {throughput:>10.0f} {throughput / baseline:>6.2f}x")
+
+
+if __name__ == "__main__":
+	main()
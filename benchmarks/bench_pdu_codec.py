@@ -0,0 +1,51 @@
+"""Micro-benchmark da codificação binária do SNMPKeySharePDU comparada com pickle
+
+Execução (a partir da raiz do repositório):
+
+	python benchmarks/bench_pdu_codec.py
+"""
+
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__)))) # Permitir importar os módulos do repositório
+
+from SNMPKeySharePDU import SNMPKeySharePDU
+
+
+ITERATIONS = 20000 # Número de codificações/descodificações por medição
+
+
+def sample_pdus():
+
+	"""Retorna PDUs típicos: pedido get, pedido set e resposta com chaves"""
+
+	get_pdu = SNMPKeySharePDU(P=1234, Y=1, NL_or_NW=3, L_or_W=[("1.1.0", 0), ("3.2.1.2.1", 0), ("3.2.1.4.1", 0)]) # Pedido get
+	set_pdu = SNMPKeySharePDU(P=1235, Y=2, NL_or_NW=2, L_or_W=[("3.2.1.6.0", 2), ("3.2.1.6.0", 1)]) # Pedido set
+	response_pdu = SNMPKeySharePDU(P=1234, Y=0, NL_or_NW=3, L_or_W=[("1.1.0", 1700000000), ("3.2.1.2.1", "ABCDEFGHIJ"), ("3.2.1.4.1", 20300101)], NR=1, R=[("3.2.1.9.1", ValueError("OID inválido"))]) # Resposta
+	return [("get", get_pdu), ("set", set_pdu), ("resposta", response_pdu)] # Retornar os PDUs
+
+
+def measure(function):
+
+	"""Retorna o tempo médio, em µs, de uma chamada a function (melhor de 5 repetições)"""
+
+	return min(timeit.repeat(function, number=ITERATIONS, repeat=5)) / ITERATIONS * 1e6 # Tempo médio por chamada
+
+
+def main():
+
+	"""Função principal"""
+
+	print(f"{'PDU':>9} {'formato':>8} {'bytes':>6} {'µs/encode':>10} {'µs/decode':>10}")
+	for name, pdu in sample_pdus(): # Para cada PDU típico
+		for wire_format in ("binary", "pickle"): # Para cada codificação
+			data = pdu.serialize(wire_format) # Codificar uma vez para medir o tamanho
+			encode = measure(lambda: pdu.serialize(wire_format)) # Medir a codificação
+			decode = measure(lambda: SNMPKeySharePDU.deserialize(data, allow_pickle=True)) # Medir a descodificação
+			print(f"{name:>9} {wire_format:>8} {len(data):>6} {encode:>10.2f} {decode:>10.2f}")
+
+
+if __name__ == "__main__":
+	main()
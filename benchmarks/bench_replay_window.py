@@ -0,0 +1,104 @@
+"""Memória e custo por pedido da janela de repetições: dicionário P -> tempo sem remoção vs. ReplayWindow
+
+Simula um ritmo constante de pedidos (P distintos, vários gestores) durante um intervalo de tempo simulado
+e mede, para cada estrutura, o número de entradas guardadas, a memória alocada e o tempo por registo.
+
+Execução (a partir da raiz do repositório):
+
+	python benchmarks/bench_replay_window.py
+	python benchmarks/bench_replay_window.py --rate 20000 --seconds 300 --V 60
+"""
+
+import argparse
+import os
+import sys
+import threading
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__)))) # Permitir importar os módulos do repositório
+
+from SNMPKeyShareAgent import ReplayWindow
+
+
+MANAGERS = [f"10.0.0.{host}" for host in range(1, 9)] # Endereços dos gestores simulados
+
+
+def requests(rate, seconds):
+
+	"""Gera os pedidos (endereço, P, instante) de um ritmo constante de rate pedidos/s durante seconds segundos"""
+
+	for index in range(int(rate * seconds)): # Para cada pedido
+		yield MANAGERS[index % len(MANAGERS)], index, index / rate
+
+
+class LastRequestTimes:
+
+	"""Esquema anterior: dicionário P -> tempo do último pedido, protegido por um lock e nunca limpo"""
+
+	def __init__(self, V):
+		self.V = V
+		self.last_request_times = {} # P -> tempo do último pedido
+		self.request_lock = threading.Lock()
+
+	def record(self, addr, P, accept, now):
+		with self.request_lock:
+			last_request_time = self.last_request_times.get(P) # Tempo do último pedido P
+			if accept and (last_request_time is None or now - last_request_time >= self.V): # Se o pedido for aceite
+				self.last_request_times[P] = now # Registar o pedido
+		return last_request_time
+
+
+def run_dict(pedidos, V):
+
+	"""Regista os pedidos no esquema anterior"""
+
+	window = LastRequestTimes(V) # Dicionário sem remoção
+	for addr, P, now in pedidos: # Para cada pedido
+		window.record(addr, P, True, now)
+	return len(window.last_request_times) # Entradas guardadas
+
+
+def run_window(pedidos, V, capacity):
+
+	"""Janela (endereço, P) com remoção após V segundos"""
+
+	window = ReplayWindow(V, capacity) # Janela de repetições
+	for addr, P, now in pedidos: # Para cada pedido
+		window.record(addr, P, True, now)
+	return len(window) # Entradas guardadas
+
+
+def measure(name, run, args):
+
+	"""Mede as entradas finais, o pico de memória e o tempo por pedido de uma estrutura"""
+
+	pedidos = list(requests(args.rate, args.seconds)) # Pedidos gerados antes da medição
+	start = time.perf_counter()
+	entries = run(pedidos) # Registar os pedidos (sem tracemalloc, que distorce o tempo)
+	elapsed = time.perf_counter() - start
+	tracemalloc.start()
+	run(pedidos) # Repetir para medir a memória
+	_, peak = tracemalloc.get_traced_memory() # Pico de memória alocada
+	tracemalloc.stop()
+	print(f"{name:>8} {entries:>10} {peak / 2 ** 20:>10.1f} {elapsed / len(pedidos) * 1e9:>8.0f}")
+
+
+def main():
+
+	"""Função principal"""
+
+	parser = argparse.ArgumentParser(description=__doc__.splitlines()[0]) # Argumentos da linha de comandos
+	parser.add_argument("--rate", type=float, default=10000, help="pedidos por segundo (simulados)")
+	parser.add_argument("--seconds", type=float, default=120, help="duração simulada (segundos)")
+	parser.add_argument("--V", type=float, default=60, help="janela de repetições (segundos)")
+	parser.add_argument("--capacity", type=int, default=0, help="capacidade da janela (0 = sem limite)")
+	args = parser.parse_args()
+
+	print(f"{'estrutura':>8} {'entradas':>10} {'pico MiB':>10} {'ns/ped.':>8}")
+	measure("dict", lambda pedidos: run_dict(pedidos, args.V), args)
+	measure("janela", lambda pedidos: run_window(pedidos, args.V, args.capacity), args)
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,134 @@
+"""Tempo de reinício até à primeira resposta do agente com uma tabela grande: estado em pickle vs. snapshot binário (mmap)
+
+Para cada formato é preparado um diretório com o estado de uma MIB com --keys chaves e lançado um agente
+num processo novo; o processo do benchmark envia gets (a uma chave a meio da tabela) até receber a
+primeira resposta. São reportados o tempo desde o lançamento do processo até à primeira resposta, o
+tempo de carregamento do estado medido no agente e o pico de memória (RSS) do agente. A linha "vazio"
+(sem estado guardado) dá o custo do arranque do interpretador e do agente.
+
+Execução (a partir da raiz do repositório):
+
+	python benchmarks/bench_startup.py
+	python benchmarks/bench_startup.py --keys 1000000 --repeat 5
+"""
+
+import argparse
+import json
+import os
+import pickle
+import resource
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__))) # Raiz do repositório
+sys.path.insert(0, REPO) # Permitir importar os módulos do repositório
+
+from MIB import SNMPKeyShareMIB, expiration_timestamp
+from fileUtils import write_file_atomically
+from mibSnapshot import encode_snapshot
+from SNMPKeySharePDU import SNMPKeySharePDU
+
+
+def peak_rss():
+
+	"""Pico de memória residente do processo em KiB (VmHWM no Linux, que ao contrário de ru_maxrss não inclui o processo pai)"""
+
+	try:
+		with open("/proc/self/status") as f:
+			for line in f: # Para cada campo
+				if line.startswith("VmHWM:"):
+					return int(line.split()[1])
+	except OSError: # Se não houver /proc
+		pass
+	return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def run_agent(directory, port, result_path):
+
+	"""Processo do agente: carrega o estado do diretório, regista o tempo de carregamento e atende pedidos"""
+
+	os.chdir(directory) # Estado guardado pelo benchmark
+	sys.stdout = open(os.devnull, "w") # Silenciar as mensagens do agente
+	from SNMPKeyShareAgent import SNMPKeyShareAgent
+	start = time.perf_counter()
+	agent = SNMPKeyShareAgent(10, "07994506586870582927", 10000, 60, 100, None) # Carregar o estado (sem journal)
+	elapsed = time.perf_counter() - start
+	with open(result_path, "w") as f: # Entregar o tempo de carregamento e o pico de memória
+		json.dump({"load": elapsed, "maxrss": peak_rss()}, f)
+	agent.running = True # Atender pedidos sem a thread de atualização das chaves
+	agent.serve("127.0.0.1", port, "single")
+
+
+def prepare(keys):
+
+	"""Cria os diretórios com o estado de uma MIB com keys chaves em cada formato"""
+
+	mib = SNMPKeyShareMIB() # MIB com a tabela preenchida
+	expires_at = expiration_timestamp(20300101, 120000) # Instante de expiração do primeiro lote
+	for first_key_id in range(1, keys + 1, 1000): # Lotes de 1000 chaves
+		count = min(1000, keys + 1 - first_key_id)
+		mib.table.insert_batch(first_key_id, [f"{key_id:010d}" for key_id in range(first_key_id, first_key_id + count)], "127.0.0.1", expires_at + first_key_id // 1000 % 60, [2] * count)
+	directories = {name: tempfile.mkdtemp() for name in ("vazio", "pickle", "snapshot")} # Um diretório por formato
+	with open(os.path.join(directories["pickle"], "mib_state.pkl"), "wb") as f: # Estado guardado com pickle
+		pickle.dump(mib, f)
+	write_file_atomically(os.path.join(directories["snapshot"], "mib_state.snap"), encode_snapshot(mib, 1)) # Snapshot binário
+	return directories
+
+
+def measure(name, directory, args, port):
+
+	"""Lança o agente e mede o tempo até à primeira resposta; retorna (tempo, carregamento, pico de memória)"""
+
+	result_path = os.path.join(tempfile.mkdtemp(), "result.json") # Resultados do agente
+	pdu = SNMPKeySharePDU(Y=1, NL_or_NW=1, L_or_W=[(f"3.2.1.2.{max(1, args.keys // 2)}" if name != "vazio" else "1.1.0", 0)]) # Get a uma chave a meio da tabela
+	with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+		sock.settimeout(0.005) # Intervalo entre tentativas
+		start = time.perf_counter()
+		agent = subprocess.Popen([sys.executable, os.path.abspath(__file__), "--child", directory, str(port), result_path], cwd=REPO) # Reiniciar o agente
+		try:
+			while True: # Até à primeira resposta
+				pdu.P += 1 # Novo identificador de pedido
+				sock.sendto(pdu.serialize(), ("127.0.0.1", port))
+				try:
+					sock.recvfrom(65535)
+					break
+				except (socket.timeout, ConnectionRefusedError): # Se o agente ainda não estiver a atender
+					if agent.poll() is not None: # Se o agente tiver terminado
+						raise RuntimeError(f"O agente terminou com o código {agent.returncode}.")
+			elapsed = time.perf_counter() - start
+		finally:
+			agent.kill()
+			agent.wait()
+	with open(result_path) as f:
+		result = json.load(f)
+	return elapsed, result["load"], result["maxrss"]
+
+
+def main():
+
+	"""Função principal"""
+
+	if len(sys.argv) == 5 and sys.argv[1] == "--child": # Processo do agente
+		run_agent(sys.argv[2], int(sys.argv[3]), sys.argv[4])
+		return
+
+	parser = argparse.ArgumentParser(description=__doc__.splitlines()[0]) # Argumentos da linha de comandos
+	parser.add_argument("--keys", type=int, default=100000, help="número de chaves na tabela")
+	parser.add_argument("--repeat", type=int, default=3, help="reinícios medidos por formato (é reportado o melhor)")
+	parser.add_argument("--port", type=int, default=17461, help="porta UDP local do agente")
+	args = parser.parse_args()
+
+	directories = prepare(args.keys) # Estado em cada formato
+	print(f"{'formato':>9} {'1.ª resp. ms':>13} {'carregar ms':>12} {'pico MiB':>9} {'ficheiro MiB':>13}")
+	for name, directory in directories.items(): # Para cada formato
+		runs = [measure(name, directory, args, args.port) for _ in range(args.repeat)] # Reinícios
+		elapsed, load, maxrss = min(runs) # Melhor reinício
+		size = sum(os.path.getsize(os.path.join(directory, file)) for file in os.listdir(directory) if file.startswith("mib_state")) # Tamanho do estado
+		print(f"{name:>9} {elapsed * 1000:>13.1f} {load * 1000:>12.1f} {maxrss / 1024:>9.1f} {size / 2 ** 20:>13.1f}")
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,411 @@
+"""Suite de benchmarks reprodutível do agente: carga UDP local e micro-benchmarks, com os resultados em JSON
+
+Tem duas partes (--only escolhe uma):
+  - carga: para cada modo de --modes é lançado um agente num processo próprio (porta local, tabela com
+    --keys chaves, thread de atualização das chaves ativa); --clients clientes (processos) enviam pedidos
+    em ciclo fechado durante --duration segundos, com a mistura --mix de gets simples (uma chave e um
+    escalar), gets com N instâncias (walk de --walk-length chaves a partir de uma chave aleatória) e sets
+    que geram uma chave. O journal da MIB do agente é o de config.ini (--journal escolhe outro: off, async
+    ou sync, em que as respostas aos sets esperam pelo fsync). São reportados o débito, os percentis
+    p50/p99/p999 de cada tipo de pedido e a memória (RSS atual e pico) do agente no fim da medição;
+  - micro: generate_matrices, process_Z (em cada motor) e generate_key para cada K de --k-values; get
+    (escalar e chave), get_next e set da MIB para cada tamanho de tabela de --table-sizes; codificação e
+    descodificação de PDUs típicos. É reportada a melhor de --repeat repetições.
+
+Os pedidos e as chaves mestras são gerados a partir de --seed, para que duas execuções meçam o mesmo
+trabalho. Com --output os resultados (medidas, parâmetros, versão do Python, plataforma e commit) são
+escritos num ficheiro JSON; com --compare é impressa a variação de cada medida em relação a um ficheiro
+anterior, marcando as que pioraram mais do que --tolerance.
+
+Execução (a partir da raiz do repositório):
+
+	python benchmarks/bench_suite.py --output base.json
+	python benchmarks/bench_suite.py --output novo.json --compare base.json
+	python benchmarks/bench_suite.py --only micro --k-values 10 64 --table-sizes 1000 100000
+	python benchmarks/bench_suite.py --only load --modes single batch --mix get=70,walk=20,set=10
+	python benchmarks/bench_suite.py --only load --journal off --mix get=0,walk=0,set=1
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import timeit
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__))) # Raiz do repositório
+sys.path.insert(0, REPO) # Permitir importar os módulos do repositório
+
+from keyMaintenance import generate_key, generate_matrices, numpy, process_Z, select_z_engine
+from MIB import SNMPKeyShareMIB, expiration_timestamp
+from SNMPKeySharePDU import SNMPKeySharePDU
+
+
+MASTER_KEY = "07994506586870582927" # Chave mestra do agente da carga (K = 10)
+KEY_EXPIRATION = expiration_timestamp(20300101, 120000) # Instante de expiração das chaves pré-carregadas (no futuro)
+REQUEST_KINDS = ("get", "walk", "set") # Tipos de pedido da carga
+ENGINES = ["python"] + (["numpy"] if numpy is not None else []) # Motores da matriz Z disponíveis
+
+
+def parse_mix(text):
+
+	"""Converte uma mistura "get=80,walk=15,set=5" num dicionário tipo -> peso"""
+
+	mix = {} # Peso de cada tipo de pedido
+	for item in text.split(","): # Para cada tipo
+		kind, _, weight = item.partition("=")
+		if kind.strip() not in REQUEST_KINDS or not weight.strip().isdigit(): # Se o item for inválido
+			raise ValueError(f"Mistura inválida: {item!r} (esperado tipo=peso, com tipo em {', '.join(REQUEST_KINDS)}).") # Lançar uma exceção
+		mix[kind.strip()] = int(weight)
+	if not sum(mix.values()): # Se nenhum tipo tiver peso
+		raise ValueError("A mistura não tem nenhum tipo de pedido com peso positivo.") # Lançar uma exceção
+	return mix
+
+
+def percentile(values, q):
+
+	"""Retorna o percentil q (0 a 1) de uma lista ordenada (None se estiver vazia)"""
+
+	return values[min(len(values) - 1, int(q * len(values)))] if values else None
+
+
+def process_memory(pid):
+
+	"""Retorna a memória residente atual e o pico (KiB) de um processo, a partir de /proc (None se não houver /proc)"""
+
+	memory = {"rss_kib": None, "peak_rss_kib": None} # Campos VmRSS e VmHWM
+	try:
+		with open(f"/proc/{pid}/status") as f:
+			for line in f: # Para cada campo
+				if line.startswith("VmRSS:"):
+					memory["rss_kib"] = int(line.split()[1])
+				elif line.startswith("VmHWM:"):
+					memory["peak_rss_kib"] = int(line.split()[1])
+	except OSError: # Se não houver /proc (ou o processo já tiver terminado)
+		pass
+	return memory
+
+
+def git_commit():
+
+	"""Retorna o commit atual do repositório (None se não for possível obtê-lo)"""
+
+	try:
+		result = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO, capture_output=True, text=True, timeout=10)
+	except (OSError, subprocess.SubprocessError): # Se o git não estiver disponível
+		return None
+	return result.stdout.strip() or None
+
+
+def best_of(function, repeat):
+
+	"""Retorna o tempo médio (segundos) de uma chamada de function, na melhor de repeat repetições
+	(o número de chamadas por repetição é escolhido pelo timeit para durar pelo menos 0,2 s)"""
+
+	timer = timeit.Timer(function)
+	number, _ = timer.autorange() # Chamadas por repetição
+	return min(timer.repeat(repeat, number)) / number
+
+
+def config_journal():
+
+	"""Retorna o modo do journal configurado em config.ini (off, async ou sync)"""
+
+	from SNMPKeyShareAgent import read_config_file
+	config = read_config_file(os.path.join(REPO, "config.ini")) # Configuração distribuída com o agente
+	if not config["journal"]: # Se as alterações não forem registadas
+		return "off"
+	return "sync" if config["journal_sync_sets"] else "async"
+
+
+def run_agent(port, mode, args):
+
+	"""Processo do agente: pré-carrega a tabela com args.keys chaves e atende pedidos no modo indicado até ser terminado"""
+
+	os.chdir(tempfile.mkdtemp()) # Não usar o estado da MIB guardado no repositório
+	sys.stdout = open(os.devnull, "w") # Silenciar as mensagens do agente
+	from SNMPKeyShareAgent import SNMPKeyShareAgent
+	agent = SNMPKeyShareAgent(10, MASTER_KEY, args.interval, 60, args.keys + 10 ** 7, None, journal=args.journal != "off", journal_sync_sets=args.journal == "sync") # Limite de chaves acima das geradas pelos sets
+	for first_key_id in range(1, args.keys + 1, 1000): # Lotes de 1000 chaves visíveis a todos
+		count = min(1000, args.keys + 1 - first_key_id)
+		agent.mib.table.insert_batch(first_key_id, [f"{key_id:010d}" for key_id in range(first_key_id, first_key_id + count)], "127.0.0.1", KEY_EXPIRATION, [2] * count)
+	agent.current_key_id = args.keys + 1 # As chaves geradas continuam a numeração
+	agent.update_number_valid_keys()
+	if mode == "asyncio": # No modo asyncio as chaves são atualizadas por uma corrotina
+		agent.running = True
+	else:
+		agent.start_key_update_thread() # Iniciar a thread que atualiza as chaves
+	agent.serve("127.0.0.1", port, mode, args.workers) # Atender pedidos
+
+
+def wait_for_agent(port, process):
+
+	"""Envia gets ao agente até receber uma resposta (o agente está a atender)"""
+
+	with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+		sock.settimeout(0.05) # Intervalo entre tentativas
+		deadline = time.perf_counter() + 60 # Tempo máximo de arranque
+		for P in range(1, 10 ** 6): # Identificadores distintos dos pedidos dos clientes
+			sock.sendto(SNMPKeySharePDU(P=P, Y=1, NL_or_NW=1, L_or_W=[("1.1.0", 0)]).serialize(), ("127.0.0.1", port))
+			try:
+				sock.recvfrom(65535)
+				return
+			except (socket.timeout, ConnectionRefusedError): # Se o agente ainda não estiver a atender
+				if not process.is_alive() or time.perf_counter() > deadline: # Se o agente tiver terminado ou não arrancar
+					raise RuntimeError(f"O agente na porta {port} não respondeu.")
+
+
+def make_request(kind, rng, args):
+
+	"""Retorna a lista de pares (OID, N) de um pedido do tipo kind"""
+
+	key_id = rng.randint(1, args.keys) # Chave pré-carregada aleatória
+	if kind == "get": # Uma chave e um escalar
+		return [(f"3.2.1.2.{key_id}", 0), ("1.1.0", 0)]
+	if kind == "walk": # walk_length chaves a partir de key_id
+		return [(f"3.2.1.2.{key_id}", args.walk_length)]
+	return [("3.2.1.6.0", 2)] # Set: gerar uma chave visível a todos
+
+
+def run_client(client, port, args, results):
+
+	"""Processo cliente: envia pedidos da mistura em ciclo fechado e entrega as latências (segundos) de cada tipo
+
+	Os pedidos do período de aquecimento (--warmup) não são registados. Uma resposta fragmentada só
+	conta quando chegam todos os fragmentos; datagramas de pedidos anteriores (ex.: fragmentos depois de
+	um timeout) são ignorados.
+	"""
+
+	rng = random.Random(args.seed * 1000 + client) # Sequência de pedidos reprodutível
+	mix = parse_mix(args.mix) # Pesos dos tipos de pedido
+	kinds, weights = list(mix), list(mix.values())
+	latencies = {kind: [] for kind in kinds} # Latência de cada pedido respondido, por tipo
+	counters = {"timeouts": 0, "errors": 0} # Pedidos sem resposta e respostas com erros
+	with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+		sock.settimeout(1) # Tempo máximo de espera por uma resposta
+		now = time.perf_counter()
+		measure_from, deadline = now + args.warmup, now + args.warmup + args.duration # Início e fim da medição
+		P = (client + 1) * 10 ** 8 # Identificadores distintos entre clientes (e do pedido de arranque)
+		while True:
+			kind = rng.choices(kinds, weights)[0] # Tipo do pedido
+			L_or_W = make_request(kind, rng, args)
+			P += 1
+			data = SNMPKeySharePDU(P=P, Y=2 if kind == "set" else 1, NL_or_NW=len(L_or_W), L_or_W=L_or_W).serialize()
+			start = time.perf_counter()
+			if start >= deadline: # Fim da medição
+				break
+			sock.sendto(data, ("127.0.0.1", port)) # Enviar o pedido
+			fragments, NR = 0, 0 # Fragmentos recebidos e erros da resposta
+			try:
+				while True: # Até à resposta completa
+					response = SNMPKeySharePDU.deserialize(sock.recvfrom(65535)[0])
+					if response.P != P: # Datagrama de um pedido anterior
+						continue
+					fragments += 1
+					NR += sum(1 for error in response.R if tuple(error) != (0, 0)) # Um set bem-sucedido responde com R = [(0, 0)]
+					if fragments >= response.NF: # Todos os fragmentos
+						break
+			except socket.timeout: # Se o agente não responder
+				counters["timeouts"] += 1
+				continue
+			if start >= measure_from: # Fora do aquecimento
+				latencies[kind].append(time.perf_counter() - start)
+				counters["errors"] += NR > 0
+	results.put((latencies, counters)) # Entregar os resultados
+
+
+def load_test(args, metrics):
+
+	"""Mede o débito, as latências e a memória do agente em cada modo"""
+
+	print(f"carga: {args.clients} clientes, mistura {args.mix}, {args.keys} chaves, journal {args.journal}, {args.duration:g} s por modo")
+	print(f"{'modo':>9} {'pedidos/s':>10} {'tipo':>5} {'p50 µs':>9} {'p99 µs':>9} {'p999 µs':>9} {'erros':>6} {'timeouts':>9} {'RSS MiB':>8} {'pico MiB':>9}")
+	for offset, mode in enumerate(args.modes): # Para cada modo (numa porta própria)
+		port = args.port + offset
+		agent = multiprocessing.Process(target=run_agent, args=(port, mode, args), daemon=True) # Processo do agente
+		agent.start()
+		try:
+			wait_for_agent(port, agent)
+			results = multiprocessing.Queue() # Resultados dos clientes
+			clients = [multiprocessing.Process(target=run_client, args=(client, port, args, results)) for client in range(args.clients)] # Clientes
+			for client in clients:
+				client.start()
+			latencies, counters = {}, {"timeouts": 0, "errors": 0} # Resultados agregados
+			for _ in clients: # Para cada cliente
+				client_latencies, client_counters = results.get()
+				for kind, values in client_latencies.items():
+					latencies.setdefault(kind, []).extend(values)
+				for name, value in client_counters.items():
+					counters[name] += value
+			for client in clients:
+				client.join()
+			memory = process_memory(agent.pid) # Memória do agente no fim da medição
+		finally:
+			agent.terminate() # Terminar o agente
+			agent.join()
+
+		prefix = f"load.{mode}" # Prefixo das medidas do modo
+		total = sum(len(values) for values in latencies.values()) # Pedidos respondidos
+		metrics[f"{prefix}.throughput_rps"] = total / args.duration
+		metrics[f"{prefix}.timeouts"] = counters["timeouts"]
+		metrics[f"{prefix}.errors"] = counters["errors"]
+		metrics[f"{prefix}.agent_rss_kib"] = memory["rss_kib"]
+		metrics[f"{prefix}.agent_peak_rss_kib"] = memory["peak_rss_kib"]
+		rows = [("todos", sorted(value for values in latencies.values() for value in values))] + [(kind, sorted(values)) for kind, values in latencies.items()] # Latências de todos os pedidos e de cada tipo
+		for index, (kind, values) in enumerate(rows): # Para cada linha da tabela
+			for name, q in (("p50", 0.5), ("p99", 0.99), ("p999", 0.999)): # Para cada percentil
+				value = percentile(values, q)
+				metrics[f"{prefix}.{kind if kind != 'todos' else 'all'}.{name}_us"] = value * 1e6 if value is not None else None
+			p50, p99, p999 = (percentile(values, q) for q in (0.5, 0.99, 0.999))
+			cells = " ".join(f"{value * 1e6:>9.0f}" if value is not None else f"{'-':>9}" for value in (p50, p99, p999))
+			if index == 0: # Primeira linha do modo: débito, erros e memória
+				rss, peak = (f"{value / 1024:.1f}" if value is not None else "-" for value in (memory["rss_kib"], memory["peak_rss_kib"]))
+				print(f"{mode:>9} {total / args.duration:>10.0f} {kind:>5} {cells} {counters['errors']:>6} {counters['timeouts']:>9} {rss:>8} {peak:>9}")
+			else:
+				print(f"{'':>9} {'':>10} {kind:>5} {cells}")
+
+
+def micro_key_engine(args, metrics, rng):
+
+	"""generate_matrices, process_Z e generate_key para cada K"""
+
+	print(f"{'K':>5} {'motor':>7} {'generate_matrices ms':>21} {'process_Z ms':>13} {'generate_key µs':>16}")
+	for K in args.k_values: # Para cada tamanho de chave
+		M = [rng.randint(0, 9) for _ in range(2 * K)] # Chave mestra com 2K dígitos
+		matrices = best_of(lambda: generate_matrices(M, K, use_zs=False), args.repeat) # Custo de generate_matrices
+		metrics[f"micro.generate_matrices.K{K}.ms"] = matrices * 1e3
+		for engine in ENGINES: # Para cada motor da matriz Z
+			Z = select_z_engine(generate_matrices(M, K, use_zs=False), engine) # Matriz Z inicial no motor
+			tick = best_of(lambda: process_Z(Z), args.repeat) # Custo de um tick de process_Z
+			counter = iter(range(10 ** 12)) # Valores de N sempre diferentes
+			key = best_of(lambda: generate_key(Z, next(counter), 33, 94), args.repeat) # Custo de generate_key
+			metrics[f"micro.process_Z.K{K}.{engine}.ms"] = tick * 1e3
+			metrics[f"micro.generate_key.K{K}.{engine}.us"] = key * 1e6
+			print(f"{K:>5} {engine:>7} {matrices * 1e3:>21.3f} {tick * 1e3:>13.3f} {key * 1e6:>16.2f}")
+
+
+def micro_mib(args, metrics, rng):
+
+	"""get, get_next e set da MIB para cada tamanho da tabela"""
+
+	print(f"{'linhas':>8} {'get µs':>8} {'get chave µs':>13} {'get_next µs':>12} {'set µs':>8}")
+	for rows in args.table_sizes: # Para cada tamanho da tabela
+		mib = SNMPKeyShareMIB() # MIB com a tabela preenchida
+		for first_key_id in range(1, rows + 1, 1000): # Lotes de 1000 chaves
+			count = min(1000, rows + 1 - first_key_id)
+			mib.table.insert_batch(first_key_id, [f"{key_id:010d}" for key_id in range(first_key_id, first_key_id + count)], "127.0.0.1", KEY_EXPIRATION, [key_id % 3 for key_id in range(first_key_id, first_key_id + count)])
+		key_oids = [f"3.2.1.{rng.randint(2, 6)}.{rng.randint(1, rows)}" for _ in range(1000)] # Colunas e chaves aleatórias
+		next_oids = [f"3.2.1.{rng.randint(1, 6)}.{rng.randint(1, rows - 1)}" for _ in range(1000)] # Pontos de partida (exceto o último)
+		get = best_of(lambda: mib.get("1.4.0"), args.repeat) # Escalar
+		get_key = best_of(lambda: [mib.get(oid) for oid in key_oids], args.repeat) / len(key_oids) # Coluna da tabela
+		get_next = best_of(lambda: [mib.get_next(oid) for oid in next_oids], args.repeat) / len(next_oids)
+		value = iter(range(1000, 10 ** 12)) # Valores sempre diferentes
+		set_ = best_of(lambda: mib.set("1.4.0", next(value)), args.repeat) # Escalar RW
+		for name, elapsed in (("mib_get", get), ("mib_get_key", get_key), ("mib_get_next", get_next), ("mib_set", set_)): # Para cada operação
+			metrics[f"micro.{name}.rows{rows}.us"] = elapsed * 1e6
+		print(f"{rows:>8} {get * 1e6:>8.2f} {get_key * 1e6:>13.2f} {get_next * 1e6:>12.2f} {set_ * 1e6:>8.2f}")
+
+
+def micro_pdu(args, metrics):
+
+	"""Codificação e descodificação de PDUs típicos (binário)"""
+
+	keys = [(f"3.2.1.2.{key_id}", f"{key_id:010d}") for key_id in range(1, 201)] # Resposta a um walk de 200 chaves
+	pdus = {
+		"get": SNMPKeySharePDU(P=1234, Y=1, NL_or_NW=3, L_or_W=[("1.1.0", 0), ("3.2.1.2.1", 0), ("3.2.1.4.1", 0)]),
+		"set": SNMPKeySharePDU(P=1235, Y=2, NL_or_NW=2, L_or_W=[("3.2.1.6.0", 2), ("3.2.1.6.0", 1)]),
+		"response": SNMPKeySharePDU(P=1234, Y=0, NL_or_NW=3, L_or_W=[("1.1.0", 1700000000), ("3.2.1.2.1", "ABCDEFGHIJ"), ("3.2.1.4.1", 20300101)], NR=1, R=[("3.2.1.9.1", ValueError("OID inválido"))]),
+		"walk200": SNMPKeySharePDU(P=1236, Y=0, NL_or_NW=len(keys), L_or_W=keys),
+	} # PDUs medidos
+	print(f"{'PDU':>9} {'bytes':>6} {'encode µs':>10} {'decode µs':>10} {'fragmentos µs':>14}")
+	for name, pdu in pdus.items(): # Para cada PDU
+		data = pdu.serialize()
+		encode = best_of(pdu.serialize, args.repeat)
+		decode = best_of(lambda: SNMPKeySharePDU.deserialize(data), args.repeat)
+		fragments = best_of(lambda: pdu.serialize_fragments(1400, 64), args.repeat) # Codificação usada nas respostas do agente
+		metrics[f"micro.pdu_encode.{name}.us"] = encode * 1e6
+		metrics[f"micro.pdu_decode.{name}.us"] = decode * 1e6
+		metrics[f"micro.pdu_encode_fragments.{name}.us"] = fragments * 1e6
+		print(f"{name:>9} {len(data):>6} {encode * 1e6:>10.2f} {decode * 1e6:>10.2f} {fragments * 1e6:>14.2f}")
+
+
+def compare(metrics, path, tolerance):
+
+	"""Imprime a variação de cada medida em relação ao ficheiro path; retorna o número de medidas que pioraram mais do que tolerance (%)"""
+
+	with open(path) as f:
+		baseline = json.load(f)
+	print(f"comparação com {path} (commit {baseline.get('commit')}):")
+	worse = 0 # Medidas que pioraram além da tolerância
+	for name, value in metrics.items(): # Para cada medida atual
+		old = baseline.get("metrics", {}).get(name)
+		if not old or value is None: # Medida nova, nula ou sem valor
+			continue
+		change = (value / old - 1) * 100 # Variação (%)
+		higher_is_better = name.endswith("_rps") # Débitos: mais é melhor; tempos, memória e erros: menos é melhor
+		regression = change < -tolerance if higher_is_better else change > tolerance
+		worse += regression
+		print(f"  {name:<48} {old:>12.2f} {value:>12.2f} {change:>+8.1f}%{'  pior' if regression else ''}")
+	return worse
+
+
+def main():
+
+	"""Função principal"""
+
+	parser = argparse.ArgumentParser(description=__doc__.splitlines()[0]) # Argumentos da linha de comandos
+	parser.add_argument("--only", choices=("load", "micro"), help="executar só uma das partes")
+	parser.add_argument("--output", help="ficheiro JSON com os resultados")
+	parser.add_argument("--compare", help="ficheiro JSON de uma execução anterior")
+	parser.add_argument("--tolerance", type=float, default=10, help="variação (%%) a partir da qual uma medida é marcada como pior")
+	parser.add_argument("--seed", type=int, default=1, help="semente dos pedidos e das chaves mestras")
+	parser.add_argument("--modes", nargs="+", default=["single", "batch"], help="modos de atendimento do agente (carga)")
+	parser.add_argument("--clients", type=int, default=4, help="número de clientes em paralelo (carga)")
+	parser.add_argument("--duration", type=float, default=5, help="duração da medição de cada modo em segundos (carga)")
+	parser.add_argument("--warmup", type=float, default=1, help="aquecimento antes da medição em segundos (carga)")
+	parser.add_argument("--mix", default="get=80,walk=15,set=5", help="pesos dos tipos de pedido (carga)")
+	parser.add_argument("--walk-length", type=int, default=16, help="instâncias de cada get com N (carga)")
+	parser.add_argument("--keys", type=int, default=10000, help="chaves pré-carregadas no agente (carga)")
+	parser.add_argument("--journal", choices=("off", "async", "sync"), default=config_journal(), help="journal da MIB do agente, por omissão o de config.ini (carga)")
+	parser.add_argument("--interval", type=int, default=1000, help="intervalo entre atualizações das chaves do agente em ms (carga)")
+	parser.add_argument("--workers", type=int, default=4, help="workers dos modos threaded e asyncio (carga)")
+	parser.add_argument("--port", type=int, default=17361, help="primeira porta UDP local a usar (carga)")
+	parser.add_argument("--k-values", type=int, nargs="+", default=[10, 64, 256], help="tamanhos de chave (micro)")
+	parser.add_argument("--table-sizes", type=int, nargs="+", default=[1000, 10000, 100000], help="linhas da tabela de chaves (micro)")
+	parser.add_argument("--repeat", type=int, default=5, help="repetições de cada micro-benchmark (é reportada a melhor)")
+	args = parser.parse_args()
+	try:
+		parse_mix(args.mix) # Validar a mistura antes de lançar processos
+	except ValueError as e:
+		parser.error(str(e))
+	if min(args.table_sizes) < 2 or args.keys < 1: # get_next precisa de pelo menos duas linhas
+		parser.error("As tabelas têm de ter pelo menos 2 linhas e o agente pelo menos 1 chave.")
+
+	metrics = {} # Nome -> valor de cada medida
+	started = time.time() # Início da execução
+	if args.only != "micro": # Carga
+		load_test(args, metrics)
+	if args.only != "load": # Micro-benchmarks
+		rng = random.Random(args.seed) # Chaves mestras e OIDs reprodutíveis
+		micro_key_engine(args, metrics, rng)
+		micro_mib(args, metrics, rng)
+		micro_pdu(args, metrics)
+
+	if args.output: # Escrever os resultados
+		results = {"suite": 1, "time": started, "commit": git_commit(), "python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count(), "numpy": numpy.__version__ if numpy is not None else None, "args": vars(args), "metrics": metrics}
+		with open(args.output, "w") as f:
+			json.dump(results, f, indent=1, sort_keys=True)
+		print(f"resultados escritos em {args.output}")
+	if args.compare: # Comparar com uma execução anterior
+		worse = compare(metrics, args.compare, args.tolerance)
+		print(f"{worse} medidas pioraram mais de {args.tolerance:g}%")
+
+
+if __name__ == "__main__":
+	main()
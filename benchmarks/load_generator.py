@@ -0,0 +1,113 @@
+"""Gerador de carga local para comparar os modos de atendimento do agente (single e threaded)
+
+Para cada modo é lançado um agente num processo próprio numa porta local; vários clientes (processos)
+enviam pedidos get em ciclo fechado durante alguns segundos e são reportados o débito e as latências.
+Uma fração dos pedidos pode ser um get com muitas instâncias (get_next), mais lento, para mostrar o
+efeito de um pedido demorado sobre os restantes.
+
+Execução (a partir da raiz do repositório):
+
+	python benchmarks/load_generator.py
+	python benchmarks/load_generator.py --clients 16 --workers 8 --duration 10 --slow-every 10
+"""
+
+import argparse
+import multiprocessing
+import os
+import socket
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__)))) # Permitir importar os módulos do repositório
+
+from SNMPKeyShareAgent import SNMPKeyShareAgent
+from SNMPKeySharePDU import SNMPKeySharePDU
+
+
+def run_agent(port, mode, workers, queue_size):
+
+	"""Processo do agente: atende pedidos no modo indicado até ser terminado"""
+
+	os.chdir(tempfile.mkdtemp()) # Não usar o estado da MIB guardado no repositório
+	sys.stdout = open(os.devnull, "w") # Silenciar as mensagens do agente
+	agent = SNMPKeyShareAgent(10, "07994506586870582927", 10000, 60, 100, None) # Instanciar o agente
+	agent.running = True # Atender pedidos sem a thread de atualização das chaves
+	agent.serve("127.0.0.1", port, mode, workers, queue_size) # Iniciar o agente
+
+
+def run_client(client, port, duration, slow_every, results):
+
+	"""Processo cliente: envia pedidos get em ciclo fechado durante duration segundos"""
+
+	latencies = [] # Latência de cada pedido respondido
+	timeouts = 0 # Pedidos sem resposta
+	fast = SNMPKeySharePDU(Y=1, NL_or_NW=2, L_or_W=[("1.1.0", 0), ("1.3.0", 0)]) # Get simples
+	slow = SNMPKeySharePDU(Y=1, NL_or_NW=1, L_or_W=[("1.1.0", 200)]) # Get com muitas instâncias (percorre a MIB)
+	with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+		sock.settimeout(1) # Tempo máximo de espera por uma resposta
+		deadline = time.perf_counter() + duration # Fim da medição
+		sent = 0 # Número de pedidos enviados
+		while time.perf_counter() < deadline: # Até ao fim da medição
+			pdu = slow if slow_every and sent % slow_every == 0 else fast # Escolher o pedido
+			pdu.P = client * 10 ** 8 + sent # Identificador único do pedido
+			sent += 1
+			start = time.perf_counter()
+			sock.sendto(pdu.serialize(), ("127.0.0.1", port)) # Enviar o pedido
+			try:
+				sock.recvfrom(65535) # Esperar pela resposta
+			except socket.timeout: # Se o agente não responder
+				timeouts += 1
+				continue
+			latencies.append(time.perf_counter() - start) # Registar a latência
+	results.put((latencies, timeouts)) # Entregar os resultados
+
+
+def measure(mode, args, port):
+
+	"""Mede o débito e as latências de um agente no modo indicado"""
+
+	agent = multiprocessing.Process(target=run_agent, args=(port, mode, args.workers, args.queue_size), daemon=True) # Processo do agente
+	agent.start()
+	time.sleep(1) # Esperar que o agente esteja a ouvir
+
+	results = multiprocessing.Queue() # Resultados dos clientes
+	clients = [multiprocessing.Process(target=run_client, args=(client, port, args.duration, args.slow_every, results)) for client in range(args.clients)] # Clientes
+	for client in clients:
+		client.start()
+	latencies, timeouts = [], 0 # Resultados agregados
+	for _ in clients: # Para cada cliente
+		client_latencies, client_timeouts = results.get()
+		latencies += client_latencies
+		timeouts += client_timeouts
+	for client in clients:
+		client.join()
+	agent.terminate() # Terminar o agente
+	agent.join()
+
+	latencies.sort() # Ordenar as latências para os percentis
+	percentile = lambda q: latencies[min(len(latencies) - 1, int(q * len(latencies)))] * 1000 if latencies else float("nan") # Percentil em ms
+	print(f"{mode:>9} {len(latencies) / args.duration:>10.0f} {percentile(0.5):>8.2f} {percentile(0.99):>8.2f} {timeouts:>9}")
+
+
+def main():
+
+	"""Função principal"""
+
+	parser = argparse.ArgumentParser(description=__doc__.splitlines()[0]) # Argumentos da linha de comandos
+	parser.add_argument("--modes", nargs="+", default=["single", "threaded"], help="modos de atendimento a comparar")
+	parser.add_argument("--clients", type=int, default=8, help="número de clientes em paralelo")
+	parser.add_argument("--duration", type=float, default=5, help="duração de cada medição (segundos)")
+	parser.add_argument("--workers", type=int, default=4, help="workers do modo threaded")
+	parser.add_argument("--queue-size", type=int, default=1024, help="capacidade da fila do modo threaded")
+	parser.add_argument("--slow-every", type=int, default=0, help="um em cada N pedidos é um get lento (0 = nenhum)")
+	parser.add_argument("--port", type=int, default=17161, help="primeira porta UDP local a usar")
+	args = parser.parse_args()
+
+	print(f"{'modo':>9} {'pedidos/s':>10} {'p50 ms':>8} {'p99 ms':>8} {'timeouts':>9}")
+	for offset, mode in enumerate(args.modes): # Para cada modo
+		measure(mode, args, args.port + offset) # Medir o modo numa porta própria
+
+
+if __name__ == "__main__":
+	main()
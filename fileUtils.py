@@ -0,0 +1,46 @@
+import os
+import tempfile
+
+
+def write_file_atomically(path, data):
+
+	"""Escreve data (bytes ou lista de partes) num ficheiro temporário acessível só ao utilizador, sincroniza-o e substitui path
+
+	O ficheiro temporário tem um nome único no diretório de path (mkstemp), pelo que várias escritas
+	concorrentes no mesmo ficheiro não partilham o temporário; a última substituição prevalece.
+	"""
+
+	fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(path) + ".", suffix=".tmp", dir=os.path.dirname(os.path.abspath(path))) # Criado com permissões 0o600 (o estado contém os valores das chaves)
+	try:
+		try:
+			for part in data if isinstance(data, list) else [data]: # Para cada parte
+				view = memoryview(part).cast("B") # Escrever sem copiar
+				while view: # Até escrever a parte
+					view = view[os.write(fd, view):]
+			os.fsync(fd) # Garantir que os dados estão no disco antes da substituição
+		finally:
+			os.close(fd)
+		os.replace(tmp_path, path) # Substituição atómica
+	except BaseException: # Se a escrita falhar
+		try:
+			os.unlink(tmp_path) # Não deixar o ficheiro temporário para trás
+		except OSError:
+			pass
+		raise
+	fsync_directory(path) # Tornar a substituição durável
+
+
+def fsync_directory(path):
+
+	"""Sincroniza o diretório de path (a entrada do ficheiro); ignorado nas plataformas que não o permitem"""
+
+	try:
+		fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY) # Abrir o diretório
+	except OSError: # Se a plataforma não permitir abrir diretórios (Windows)
+		return
+	try:
+		os.fsync(fd)
+	except OSError: # Se o sistema de ficheiros não suportar
+		pass
+	finally:
+		os.close(fd)
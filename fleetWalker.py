@@ -0,0 +1,215 @@
+import asyncio
+import queue
+import threading
+import time
+
+from MIB import TABLE_ARCS, oid_to_tuple
+from SNMPKeyShareManager import AsyncSNMPKeyShareManager
+from SNMPKeySharePDU import TRUNCATED_RESPONSE
+
+
+class FleetWalker:
+
+	"""Percorre subárvores de OIDs em muitos agentes em paralelo, entregando os resultados à medida que chegam
+
+	Cada passo de um percurso é um get com N instâncias a partir do último OID recebido (o agente
+	responde com esse OID e os N seguintes), pelo que uma subárvore é percorrida em poucos pedidos. O
+	percurso começa na primeira instância da subárvore encontrada com um só get (a própria subárvore,
+	subárvore.0 ou subárvore.1.0); só se nenhuma existir começa em start_oid. Os
+	pedidos em curso são limitados por max_concurrency e os pedidos a cada agente por max_rate (pedidos
+	por segundo, 0 = sem limite); os identificadores P são atribuídos pelo AsyncSNMPKeyShareManager e
+	um pedido rejeitado por repetir P é repetido com um novo P.
+
+	As chaves invisíveis da tabela 3.2.1 bloqueiam o get_next no agente; o percurso salta-as testando
+	até max_skip keyIds seguintes na mesma coluna e, se não encontrar nenhuma chave visível, passa para
+	a coluna seguinte a partir da primeira linha vista.
+
+	Os resultados são tuplos ((ip, porta), OID, valor); se um percurso falhar (p. ex. o agente não
+	responder), o valor é a exceção e o OID é o da subárvore. No fim de walk o gestor criado pelo
+	percurso é fechado; de um gestor passado ao construtor só são fechados os sockets abertos nesse
+	walk (pertencem ao seu ciclo de eventos), e o chamador fecha o gestor.
+	"""
+
+	def __init__(self, manager=None, max_concurrency=64, max_rate=0, repetitions=16, max_skip=16, start_oid="1.1.0"):
+
+		"""Construtor da classe"""
+
+		if max_concurrency < 1 or max_rate < 0 or repetitions < 1 or max_skip < 1: # Se os parâmetros forem inválidos
+			raise ValueError(f"Parâmetros inválidos (concorrência {max_concurrency}, ritmo {max_rate}, N {repetitions}, saltos {max_skip}).") # Lançar uma exceção
+		self.manager = manager if manager is not None else AsyncSNMPKeyShareManager() # Gestor assíncrono usado nos pedidos
+		self.owns_manager = manager is None # O gestor foi criado pelo percurso (e é fechado por ele)
+		self.max_concurrency = max_concurrency # Número máximo de pedidos em curso
+		self.min_interval = 1 / max_rate if max_rate else 0 # Intervalo mínimo entre pedidos ao mesmo agente (segundos)
+		self.repetitions = repetitions # Número de instâncias seguintes pedidas em cada get (N)
+		self.max_skip = max_skip # Número de keyIds testados para saltar uma chave invisível
+		self.start_oid = start_oid # OID existente a partir do qual os percursos começam (o primeiro da MIB)
+		self.semaphore = None # Limite de pedidos em curso (criado no ciclo de eventos)
+		self.next_send = {} # Agente -> instante a partir do qual pode ser enviado o pedido seguinte
+
+	async def throttle(self, agent):
+
+		"""Espera até que possa ser enviado um novo pedido ao agente (limite max_rate)"""
+
+		if not self.min_interval: # Se não houver limite
+			return
+		now = time.monotonic() # Instante atual
+		send_at = max(now, self.next_send.get(agent, now)) # Instante reservado para este pedido
+		self.next_send[agent] = send_at + self.min_interval # Reservar o instante seguinte
+		if send_at > now: # Se for preciso esperar
+			await asyncio.sleep(send_at - now)
+
+	async def request(self, agent, L):
+
+		"""Envia um get com a lista L ao agente e retorna a resposta (repete com um novo P se o agente o rejeitar)"""
+
+		for _ in range(3): # No máximo três tentativas
+			await self.throttle(agent) # Respeitar o ritmo do agente
+			async with self.semaphore: # Respeitar o limite de pedidos em curso
+				response = await self.manager.snmpkeyshare_get(None, len(L), L, *agent) # Enviar o pedido
+			if not any(oid == 0 for oid, _ in response.R): # Se o pedido não tiver sido rejeitado (erro global com OID 0)
+				return response # Retornar a resposta
+		raise ValueError(f"O agente {agent[0]}:{agent[1]} rejeitou o pedido: {response.R[0][1]}") # Lançar uma exceção
+
+	async def probe(self, agent, column, first_key_id):
+
+		"""Retorna o primeiro par (OID, valor) visível da coluna entre os keyIds first_key_id e first_key_id + max_skip - 1, ou None"""
+
+		response = await self.request(agent, [(f"3.2.1.{column}.{key_id}", 0) for key_id in range(first_key_id, first_key_id + self.max_skip)]) # Um get por keyId (só os visíveis respondem)
+		return response.L_or_W[0] if response.L_or_W else None # Primeiro keyId visível
+
+	async def first_instance(self, agent, subtree):
+
+		"""Retorna o primeiro par (OID, valor) existente entre a subárvore, subárvore.0 e subárvore.1.0 (um só get), ou None"""
+
+		candidates = [subtree, f"{subtree}.0", f"{subtree}.1.0"] # Instâncias possíveis no início da subárvore
+		response = await self.request(agent, [(oid, 0) for oid in candidates]) # As que não existem respondem com um erro
+		found = dict(response.L_or_W) # OID -> valor das instâncias existentes
+		for oid in candidates: # Pela ordem da MIB
+			if oid in found:
+				return oid, found[oid]
+		return None
+
+	async def walk_subtree(self, agent, subtree, emit):
+
+		"""Percorre a subárvore no agente, entregando cada (agente, OID, valor) a emit"""
+
+		prefix = oid_to_tuple(subtree) # Prefixo da subárvore
+		start = await self.first_instance(agent, subtree) # Primeira instância da subárvore
+		cursor = self.start_oid if start is None else start[0] # OID a partir do qual é pedido o passo seguinte
+		last = None # Último OID processado (como tuplo)
+		first_key_id = None # Primeira linha da tabela vista no percurso
+
+		async def advance(pairs):
+
+			"""Processa os pares recebidos; retorna False se o percurso tiver passado a subárvore"""
+
+			nonlocal cursor, last, first_key_id
+			for oid, value in pairs: # Para cada par recebido
+				key = oid_to_tuple(oid) # OID como tuplo
+				if last is not None and key <= last: # Se o OID já tiver sido processado (o agente repete o OID de partida)
+					continue
+				if key[:len(prefix)] == prefix: # Se o OID pertencer à subárvore
+					await emit((agent, oid, value)) # Entregar o resultado
+				elif key > prefix: # Se o percurso já tiver passado a subárvore
+					return False
+				if key[:3] == TABLE_ARCS and first_key_id is None: # Primeira linha da tabela
+					first_key_id = key[4]
+				last, cursor = key, oid # Avançar
+			return True
+
+		if start is not None and not await advance([start]): # Entregar a primeira instância
+			return
+		while True:
+			response = await self.request(agent, [(cursor, self.repetitions)]) # Passo do percurso
+			if not await advance(response.L_or_W): # Se o percurso tiver passado a subárvore
+				return
+			if all(str(error).startswith(TRUNCATED_RESPONSE) for _, error in response.R): # Se o passo não tiver erros (uma resposta truncada continua no último OID recebido)
+				continue
+
+			location = parse_cursor(cursor) # Coluna e keyId onde o percurso parou
+			if location is None: # Se o agente não tiver OIDs seguintes (último OID da MIB)
+				return
+			column, key_id = location # O percurso parou numa chave invisível (ou na última da tabela)
+			found = await self.probe(agent, column, key_id + 1) # Procurar a chave visível seguinte na coluna
+			while found is None and column < 6 and first_key_id is not None: # Se não houver, passar às colunas seguintes
+				column += 1
+				found = await self.probe(agent, column, first_key_id)
+			if found is None or not await advance([found]): # Se não houver mais chaves visíveis na subárvore
+				return
+
+	async def walk_agent(self, agent, subtrees, emit):
+
+		"""Percorre as subárvores num agente, entregando as falhas como resultados"""
+
+		for subtree in subtrees: # Para cada subárvore
+			try:
+				await self.walk_subtree(agent, subtree, emit) # Percorrer a subárvore
+			except (asyncio.TimeoutError, OSError, ValueError) as e: # Se o agente não responder ou rejeitar os pedidos
+				await emit((agent, subtree, e)) # Entregar a falha
+
+	async def awalk(self, agents, subtrees):
+
+		"""Gerador assíncrono dos resultados dos percursos das subárvores em todos os agentes ((ip, porta))"""
+
+		self.semaphore = asyncio.Semaphore(self.max_concurrency) # Limite de pedidos em curso
+		results = asyncio.Queue() # Resultados por entregar
+		tasks = [asyncio.ensure_future(self.walk_agent(tuple(agent), subtrees, results.put)) for agent in agents] # Um percurso por agente
+		done = asyncio.ensure_future(asyncio.gather(*tasks)) # Fim de todos os percursos
+		done.add_done_callback(lambda _: results.put_nowait(None)) # Marcar o fim dos resultados
+		try:
+			while True:
+				result = await results.get() # Próximo resultado
+				if result is None: # Se todos os percursos tiverem terminado
+					break
+				yield result
+			await done # Propagar erros inesperados
+		finally:
+			for task in tasks: # Se o consumidor parar antes do fim
+				task.cancel() # Cancelar os percursos
+
+	def walk(self, agents, subtrees):
+
+		"""Gerador (síncrono) dos resultados dos percursos; os pedidos correm num ciclo de eventos numa thread própria"""
+
+		results = queue.Queue() # Resultados por entregar
+		stop = threading.Event() # Pedido de paragem do consumidor
+		done = object() # Marca de fim
+
+		async def produce():
+			existing = set(self.manager.endpoints) # Sockets que já existiam (de outro ciclo de eventos)
+			try:
+				async for result in self.awalk(agents, subtrees): # Para cada resultado
+					results.put(result)
+					if stop.is_set(): # Se o consumidor tiver parado
+						break
+			except Exception as e: # Erro inesperado: entregar ao consumidor
+				results.put(e)
+			finally:
+				if self.owns_manager: # Gestor criado pelo percurso
+					self.manager.close() # Fechar o gestor
+				else: # Gestor do chamador (é fechado por ele)
+					self.manager.close([agent for agent in self.manager.endpoints if agent not in existing]) # Fechar só os sockets deste ciclo de eventos
+				results.put(done)
+
+		thread = threading.Thread(target=asyncio.run, args=(produce(),), daemon=True) # Thread do ciclo de eventos
+		thread.start()
+		try:
+			while True:
+				result = results.get() # Próximo resultado
+				if result is done: # Se os percursos tiverem terminado
+					break
+				if isinstance(result, Exception): # Se tiver ocorrido um erro inesperado
+					raise result
+				yield result
+		finally:
+			stop.set() # Parar os percursos se o consumidor parar antes do fim
+
+
+def parse_cursor(oid):
+
+	"""Retorna (coluna, keyId) se o OID for uma instância da tabela 3.2.1, ou None"""
+
+	key = oid_to_tuple(oid) # OID como tuplo
+	if len(key) == 5 and key[:3] == TABLE_ARCS: # Se o OID for uma instância da tabela
+		return key[3], key[4]
+	return None
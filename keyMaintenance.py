@@ -1,13 +1,88 @@
 import random
 from collections import deque
 
+try:
+	import numpy # Motor vetorizado opcional para a matriz Z
+except ImportError: # Se o NumPy não estiver instalado
+	numpy = None # Usar apenas a implementação em Python puro
+
+
+SEED_TABLE_SIZE = 256 # Sementes tabeladas (os elementos das matrizes são bytes)
+NUMPY_MIN_K = 32 # Tamanho a partir do qual o motor "auto" usa o NumPy (abaixo disso as listas são mais rápidas)
+
+seed_tables = {} # (min_val, max_val) -> [random(seed, min_val, max_val) para seed em 0..255]
+next_seed_table = [] # seed -> segundo número gerado com a semente seed (cadeia de sementes da matriz ZS)
+
+
+def seeded_randint(seed, min_val, max_val):
+
+	"""Calcula random(seed, min_val, max_val) com um gerador próprio, sem alterar o estado global do módulo random"""
+
+	return random.Random(seed).randint(min_val, max_val) # Mesmo algoritmo e sequência que random.seed + random.randint
+
+
+def seed_table(min_val, max_val):
+
+	"""Retorna a tabela random(seed, min_val, max_val) para todas as sementes de 0 a 255 (calculada uma vez por intervalo)"""
+
+	table = seed_tables.get((min_val, max_val)) # Tabela já calculada
+	if table is None: # Se a tabela ainda não existir
+		table = [seeded_randint(seed, min_val, max_val) for seed in range(SEED_TABLE_SIZE)] # Calcular a tabela
+		seed_tables[(min_val, max_val)] = table # Guardar a tabela
+	return table # Retornar a tabela
+
 
 def random_with_seed(seed, min_val, max_val):
 
 	"""Função que retorna um número aleatório entre min_val e max_val usando a semente seed"""
 
-	random.seed(seed) # Definir a semente
-	return random.randint(min_val, max_val) # Retornar um número aleatório
+	if 0 <= seed < SEED_TABLE_SIZE: # Se a semente estiver tabelada
+		return seed_table(min_val, max_val)[seed] # Consultar a tabela
+	return seeded_randint(seed, min_val, max_val) # Calcular com um gerador próprio
+
+
+def random_zs_sequence(count):
+
+	"""Gera os count valores da matriz ZS pela mesma ordem e com os mesmos valores que
+	random_with_seed(random.randint(0, 255), 0, 255) aplicado célula a célula, em que cada semente
+	era o segundo número gerado pela semente anterior (estado global deixado pela chamada anterior)"""
+
+	if not next_seed_table: # Se a cadeia de sementes ainda não estiver calculada
+		for seed in range(SEED_TABLE_SIZE): # Para cada semente
+			generator = random.Random(seed) # Gerador com a semente
+			generator.randint(0, 255) # Primeiro número (valor da célula)
+			next_seed_table.append(generator.randint(0, 255)) # Segundo número (semente da célula seguinte)
+	values = seed_table(0, 255) # Valores das células por semente
+	seed = random.randint(0, 255) # Primeira semente, obtida do estado global (como antes)
+	sequence = [] # Valores gerados
+	for _ in range(count): # Para cada célula
+		sequence.append(values[seed]) # Valor da célula
+		seed = next_seed_table[seed] # Semente da célula seguinte
+	return sequence # Retornar os valores
+
+
+def numpy_seed_table(min_val, max_val):
+
+	"""Retorna a tabela de sementes de seed_table como um array NumPy de índices"""
+
+	table = seed_tables.get(("numpy", min_val, max_val)) # Tabela já convertida
+	if table is None: # Se a tabela ainda não tiver sido convertida
+		table = seed_tables[("numpy", min_val, max_val)] = numpy.array(seed_table(min_val, max_val), dtype=numpy.intp) # Converter a tabela
+	return table # Retornar a tabela
+
+
+def select_z_engine(Z, engine="auto"):
+
+	"""Retorna a matriz Z na representação do motor pedido: "python" (listas), "numpy" (array uint8 K x K)
+	ou "auto" (NumPy se estiver instalado e K >= NUMPY_MIN_K); process_Z e generate_key aceitam ambas"""
+
+	if engine not in ("auto", "python", "numpy"): # Se o motor for desconhecido
+		raise ValueError(f"O motor {engine} da matriz Z é inválido (auto, python ou numpy).") # Lançar uma exceção
+	if engine == "numpy" and numpy is None: # Se o NumPy for pedido mas não estiver instalado
+		raise ValueError("O motor numpy da matriz Z requer o NumPy instalado.") # Lançar uma exceção
+	if engine == "python" or numpy is None or (engine == "auto" and len(Z) < NUMPY_MIN_K): # Se for para usar listas
+		return Z.tolist() if numpy is not None and isinstance(Z, numpy.ndarray) else Z # Matriz como listas
+	return numpy.array(Z, dtype=numpy.uint8) # Matriz como array NumPy
 
 
 def print_matrix(matrix):
@@ -81,7 +156,8 @@ def generate_matrices(M, K, use_zs=True):
 	criar uma matriz ZD de K x K bytes em que ZD[i,j] = random(ZB[i,j],0,255); em alternativa pode
 	ser criada apenas uma matriz ZS de K x K bytes em que ZS[i,j] = random(S,0,255);"""
 	if use_zs: # Se for para usar a matriz ZS
-		ZS = [[random_with_seed(random.randint(0, 255), 0, 255) for _ in range(K)] for _ in range(K)] # Matriz ZS
+		sequence = random_zs_sequence(K * K) # Valores de ZS, linha a linha
+		ZS = [sequence[i * K:(i + 1) * K] for i in range(K)] # Matriz ZS
 	else: # Se for para usar as matrizes ZC e ZD
 		ZC = [[random_with_seed(ZA[i][j], 0, 255) for j in range(K)] for i in range(K)] # Matriz ZC
 		ZD = [[random_with_seed(ZB[i][j], 0, 255) for j in range(K)] for i in range(K)] # Matriz ZD
@@ -108,24 +184,58 @@ def process_Z(Z):
 
 	"""Função para processar a matriz Z"""
 
+	if numpy is not None and isinstance(Z, numpy.ndarray): # Se a matriz estiver no motor NumPy
+		return process_Z_numpy(Z) # Processar de forma vetorizada
+
 	K = len(Z) # Número de linhas da matriz Z
+	shifts = seed_table(0, K - 1) # random(seed,0,K-1) para todas as sementes possíveis (bytes)
 	for i in range(K): # Para cada linha da matriz Z
 		# 1. Atualizar a matriz Z de acordo com Zi* = rotate(Zi*,random(Z[i,0],0,K-1));
-		Z[i] = rotate(Z[i], random_with_seed(Z[i][0], 0, K - 1))
+		Z[i] = rotate(Z[i], shifts[Z[i][0]])
 
 	for j in range(K): # Para cada coluna da matriz Z
 		# 2. Atualizar a matriz Z de acordo com Z*j = rotate_vertical(Z*j,random(Z[0,j],0,K-1))
-		rotate_vertical(Z, j, random_with_seed(Z[0][j], 0, K - 1)) 
+		rotate_vertical(Z, j, shifts[Z[0][j]]) 
 
 
-def generate_key(Z, N, first_char, cardinality):
+def process_Z_numpy(Z):
 
-	"""Função para gerar uma chave"""
+	"""Versão vetorizada de process_Z para uma matriz uint8 K x K (resultado idêntico ao das listas)"""
 
-	K = len(Z) # Número de linhas da matriz Z
+	K = Z.shape[0] # Número de linhas da matriz Z
+	shifts = numpy_seed_table(0, K - 1) # random(seed,0,K-1) para todas as sementes possíveis (bytes)
+	positions = numpy.arange(K) # Índices 0..K-1
 
-	# 2. Escolhe-se uma linha Zi* de Z, de tal forma que i = random(N+Z[0,0],0,K-1);
-	i = random_with_seed(N + Z[0][0], 0, K - 1)
+	# 1. Zi* = rotate(Zi*,random(Z[i,0],0,K-1)), para todas as linhas de uma vez: novo Z[i,k] = Z[i,(k - n_i) mod K]
+	row_shifts = shifts[Z[:, 0]] # Rotação de cada linha
+	Z[:] = Z[positions[:, None], (positions[None, :] - row_shifts[:, None]) % K]
+
+	# 2. Z*j = rotate_vertical(Z*j,random(Z[0,j],0,K-1)); rodar a coluna j só altera a coluna j, pelo que
+	# todas as rotações dependem da linha 0 obtida no passo 1: novo Z[i,j] = Z[(i - n_j) mod K,j]
+	column_shifts = shifts[Z[0]] # Rotação de cada coluna
+	Z[:] = Z[(positions[:, None] - column_shifts[None, :]) % K, positions[None, :]]
+
+
+def key_from_row_numpy(Z, i, first_char, cardinality):
+
+	"""Versão vetorizada de key_from_row para uma matriz uint8 K x K (resultado idêntico ao das listas)"""
+
+	K = Z.shape[0] # Número de linhas da matriz Z
+	j = random_with_seed(int(Z[i, 0]), 0, K - 1) # Coluna Z*j
+	C = numpy.bitwise_xor(Z[i], Z[:, j]).astype(numpy.int64) # C = xor(Zi*,transpose(Z*j))
+	if cardinality == 0: # Mesma exceção que a implementação em listas
+		raise ZeroDivisionError("integer modulo by zero") # Lançar uma exceção
+	return "".join(map(chr, (C % cardinality + first_char).tolist())) # Converter os valores em caracteres
+
+
+def key_from_row(Z, i, first_char, cardinality):
+
+	"""Calcula a chave a partir da linha Zi* escolhida (a chave depende apenas de Z e de i)"""
+
+	if numpy is not None and isinstance(Z, numpy.ndarray): # Se a matriz estiver no motor NumPy
+		return key_from_row_numpy(Z, i, first_char, cardinality) # Calcular de forma vetorizada
+
+	K = len(Z) # Número de linhas da matriz Z
 	Zi_star = Z[i]
 
 	# 3. Escolhe-se uma coluna Z*j de Z, de tal forma que j = random(Z[i,0],0,K-1);
@@ -141,6 +251,36 @@ def generate_key(Z, N, first_char, cardinality):
 	return C_ascii # Retornar a chave
 
 
+def generate_key(Z, N, first_char, cardinality):
+
+	"""Função para gerar uma chave"""
+
+	K = len(Z) # Número de linhas da matriz Z
+
+	# 2. Escolhe-se uma linha Zi* de Z, de tal forma que i = random(N+Z[0,0],0,K-1);
+	i = random_with_seed(N + int(Z[0][0]), 0, K - 1)
+
+	return key_from_row(Z, i, first_char, cardinality) # Passos 3 e 4
+
+
+def generate_keys(Z, N, count, first_char, cardinality):
+
+	"""Gera count chaves para os valores consecutivos N, N+1, ..., N+count-1 a partir do mesmo estado de Z
+	(resultado idêntico a chamar generate_key para cada valor; cada linha Zi* só é processada uma vez)"""
+
+	K = len(Z) # Número de linhas da matriz Z
+	Z00 = int(Z[0][0]) # Parte fixa da semente da linha
+	keys_by_row = {} # Linha i -> chave (a chave depende apenas de i)
+	keys = [] # Chaves geradas
+	for n in range(N, N + count): # Para cada valor de N
+		i = random_with_seed(n + Z00, 0, K - 1) # Linha Zi*
+		key = keys_by_row.get(i) # Chave já calculada para esta linha
+		if key is None: # Se a linha ainda não tiver sido processada
+			key = keys_by_row[i] = key_from_row(Z, i, first_char, cardinality) # Calcular a chave
+		keys.append(key) # Guardar a chave
+	return keys # Retornar as chaves
+
+
 def generate_random_K(min_val=5, max_val=15):
 
 	"""Função para gerar um valor aleatório para K"""
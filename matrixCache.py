@@ -0,0 +1,96 @@
+import hashlib
+import os
+import struct
+import zlib
+
+from keyMaintenance import generate_matrices
+from fileUtils import write_file_atomically
+
+
+CACHE_MAGIC = b"SKZ1" # Identificação e versão dos ficheiros da cache
+CACHE_HEADER = struct.Struct("<4sI") # Cabeçalho: identificação e K (seguidos de K x K bytes e do CRC32)
+
+memory_cache = {} # Digest de (M, K, use_zs) -> matriz Z inicial (K x K bytes, linha a linha), partilhada pelos agentes do processo
+
+
+def matrices_digest(M, K, use_zs=False):
+
+	"""Retorna o digest (SHA-256, hexadecimal) que identifica a matriz Z inicial de (M, K, use_zs)"""
+
+	return hashlib.sha256(f"{CACHE_MAGIC.decode()}|{K}|{int(use_zs)}|{','.join(map(str, M))}".encode()).hexdigest()
+
+
+def cache_path(directory, digest):
+
+	"""Retorna o caminho do ficheiro da cache com o digest indicado"""
+
+	return os.path.join(directory, f"{digest}.z")
+
+
+def encode_matrix(Z):
+
+	"""Codifica a matriz Z (listas de bytes) num ficheiro da cache"""
+
+	cells = bytes(value for row in Z for value in row) # K x K bytes, linha a linha
+	return CACHE_HEADER.pack(CACHE_MAGIC, len(Z)) + cells + struct.pack("<I", zlib.crc32(cells))
+
+
+def decode_matrix(data, K):
+
+	"""Retorna as K x K células de um ficheiro da cache, ou None se o ficheiro estiver corrompido ou não for de K"""
+
+	if len(data) != CACHE_HEADER.size + K * K + 4: # Tamanho inesperado (ex.: ficheiro de outra versão)
+		return None
+	magic, size = CACHE_HEADER.unpack_from(data)
+	cells = data[CACHE_HEADER.size:-4] # Células da matriz
+	if magic != CACHE_MAGIC or size != K or struct.unpack("<I", data[-4:])[0] != zlib.crc32(cells): # Se o ficheiro não for válido
+		return None
+	return cells
+
+
+def cached_matrices(M, K, use_zs=False, directory=""):
+
+	"""Retorna a matriz Z inicial de generate_matrices(M, K, use_zs), calculada uma vez por (M, K, use_zs)
+
+	A matriz é guardada no processo (partilhada por todos os agentes) e, com directory, num ficheiro com
+	o nome do digest de (M, K, use_zs) acessível só ao utilizador (a matriz permite gerar as chaves), que
+	os arranques seguintes e os outros processos leem em vez de a recalcular. Cada chamada retorna uma
+	cópia nova, que process_Z pode alterar. Com use_zs a matriz ZS depende do estado global do módulo
+	random (não só de M e K) e é sempre calculada.
+	"""
+
+	if use_zs: # ZS não é determinada por (M, K)
+		return generate_matrices(M, K, use_zs=True)
+	digest = matrices_digest(M, K, use_zs) # Identificação da matriz
+	cells = memory_cache.get(digest) # Matriz já calculada no processo
+	if cells is None and directory: # Se houver uma cache em disco
+		try:
+			with open(cache_path(directory, digest), "rb") as f:
+				cells = decode_matrix(f.read(), K)
+		except OSError: # Ficheiro inexistente ou ilegível
+			cells = None
+	if cells is None: # Se a matriz não estiver em nenhuma cache
+		Z = generate_matrices(M, K, use_zs=False) # Calcular a matriz
+		data = encode_matrix(Z)
+		cells = data[CACHE_HEADER.size:-4]
+		if directory: # Guardar para os próximos arranques
+			try:
+				os.makedirs(directory, mode=0o700, exist_ok=True)
+				write_file_atomically(cache_path(directory, digest), data)
+			except OSError as e: # A cache em disco é opcional
+				print(f"Não foi possível guardar a matriz Z em {directory}: {e}") # Imprimir uma mensagem de erro
+	memory_cache[digest] = cells
+	return [list(cells[i * K:(i + 1) * K]) for i in range(K)] # Cópia da matriz (listas)
+
+
+def invalidate_matrices(M, K, use_zs=False, directory=""):
+
+	"""Remove a matriz Z inicial de (M, K, use_zs) das caches (ex.: quando a chave mestra M deixa de ser usada)"""
+
+	digest = matrices_digest(M, K, use_zs) # Identificação da matriz
+	memory_cache.pop(digest, None)
+	if directory: # Se houver uma cache em disco
+		try:
+			os.remove(cache_path(directory, digest))
+		except FileNotFoundError: # A matriz não estava em disco
+			pass
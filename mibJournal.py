@@ -0,0 +1,283 @@
+import os
+import pickle
+import struct
+import threading
+import time
+import zlib
+
+from MIB import expiration_timestamp
+from fileUtils import write_file_atomically
+from SNMPKeySharePDU import encode_value, decode_value
+from mibSnapshot import encode_snapshot, load_snapshot
+
+
+JOURNAL_MAGIC = b"SNMPKSWL" # Identificação do ficheiro do journal
+JOURNAL_HEADER = struct.Struct("<8sQ") # Cabeçalho do journal: magic e geração
+RECORD_HEADER = struct.Struct("<II") # Cabeçalho de um registo: comprimento e CRC32 do conteúdo
+
+OP_ADD = 1 # Lote de chaves inseridas: (keyId inicial, chaves, requerente, instante de expiração, visibilidades)
+OP_REMOVE = 2 # Chaves removidas: (keyIds,)
+OP_SET = 3 # Instância alterada: (OID, valor)
+
+
+def apply_record(mib, record):
+
+	"""Aplica um registo do journal à MIB (a repetição de um registo já aplicado não altera o estado)"""
+
+	op = record[0] # Operação
+	if op == OP_ADD: # Lote de chaves inseridas
+		if len(record) == 7: # Registo de uma versão anterior (data e hora de expiração)
+			record = record[:4] + (expiration_timestamp(record[4], record[5]),) + record[6:]
+		first_key_id, keys, requester, expires_at, visibilities = record[1:]
+		mib.table.insert_batch(first_key_id, list(keys), requester, expires_at, list(visibilities)) # Substitui chaves com os mesmos keyIds
+	elif op == OP_REMOVE: # Chaves removidas
+		for key_id in record[1]: # Para cada chave
+			if key_id in mib.table: # Se a chave ainda existir
+				mib.table.remove(key_id)
+	elif op == OP_SET: # Instância alterada
+		mib.setAdmin(record[1], record[2])
+	else: # Operação desconhecida
+		raise ValueError(f"Operação {op} desconhecida no journal.") # Lançar uma exceção
+
+
+class MIBJournal:
+
+	"""Persistência incremental da MIB: snapshot compactado e journal (write-ahead log) das alterações
+
+	O snapshot (formato binário de mibSnapshot, com um número de geração) é escrito de forma atómica e
+	carregado com mmap; o estado guardado por versões anteriores (pickle da MIB em legacy_path) continua a
+	ser carregado e é convertido no primeiro snapshot. O journal começa com
+	a geração do snapshot a que se aplica e contém um registo por inserção de chaves, remoção de chaves ou
+	alteração de uma instância (com comprimento e CRC32, codificado como os valores dos PDUs). No
+	arranque o snapshot é carregado e o journal da mesma geração é repetido até ao primeiro registo
+	incompleto (escrita interrompida) e depois continua a ser escrito, sem reescrever o snapshot. A compactação escreve um novo snapshot com a geração seguinte e só
+	depois recomeça o journal, pelo que uma interrupção a meio nunca perde alterações.
+
+	Os registos são acumulados num buffer e escritos com um único fsync por grupo (group commit): por uma
+	thread a cada commit_interval segundos ou, com commit_interval 0, em cada registo. wait_durable
+	permite esperar que um registo esteja no disco: se não houver uma escrita em curso quem espera
+	escreve o buffer de imediato (sem esperar pelo intervalo da thread) e os registos que chegarem
+	durante o fsync formam o grupo seguinte. Com enabled falso não é escrito journal e o estado só
+	é guardado nos snapshots (comportamento anterior).
+	"""
+
+	def __init__(self, snapshot_path="mib_state.snap", journal_path="mib_state.wal", enabled=True, commit_interval=0.01, compact_size=16 * 1024 * 1024, legacy_path=None):
+
+		"""Construtor da classe"""
+
+		if commit_interval < 0 or compact_size < 1: # Se os parâmetros forem inválidos
+			raise ValueError(f"Parâmetros do journal inválidos (intervalo {commit_interval}, compactação {compact_size}).") # Lançar uma exceção
+		self.snapshot_path = snapshot_path # Caminho do snapshot
+		self.journal_path = journal_path # Caminho do journal
+		self.legacy_path = legacy_path # Caminho do estado guardado com pickle (versões anteriores)
+		self.enabled = enabled # Escrever o journal
+		self.commit_interval = commit_interval # Intervalo entre commits em grupo (segundos, 0 = commit em cada registo)
+		self.compact_size = compact_size # Tamanho do journal a partir do qual é feita uma compactação
+		self.generation = 0 # Geração do snapshot atual
+		self.fd = None # Descritor do journal (aberto em start)
+		self.buffer = bytearray() # Registos ainda não escritos
+		self.condition = threading.Condition() # Protege o buffer e os números de sequência
+		self.flush_lock = threading.Lock() # Exclusão entre escritas do journal e compactações
+		self.flushing = False # Escrita do journal em curso (quem espera por um registo aguarda pelo seu fim)
+		self.appended = 0 # Número de sequência do último registo acrescentado
+		self.durable = 0 # Número de sequência do último registo no disco
+		self.journal_size = 0 # Bytes do journal atual
+		self.bytes_written = 0 # Bytes escritos (journal e snapshots)
+		self.fsyncs = 0 # Número de fsyncs do journal
+		self.snapshots = 0 # Número de snapshots escritos
+		self.replayed = 0 # Registos repetidos no último carregamento
+		self.resumable = False # O journal carregado pode continuar a ser escrito (snapshot binário da mesma geração)
+		self.running = False # Thread de commit ativa
+		self.thread = None # Thread de commit
+
+	def load(self):
+
+		"""Carrega o snapshot e repete o journal da mesma geração; retorna a MIB (None se não houver estado)"""
+
+		try:
+			self.generation, mib = load_snapshot(self.snapshot_path) # Snapshot binário (colunas servidas a partir do ficheiro)
+			legacy = False
+		except FileNotFoundError: # Se não houver um snapshot binário
+			if self.legacy_path is None or not os.path.exists(self.legacy_path): # Se também não houver estado guardado com pickle
+				return None
+			with open(self.legacy_path, "rb") as f: # Abrir o estado guardado com pickle
+				state = pickle.load(f) # Deserializar o estado
+			if isinstance(state, dict): # Snapshot com geração
+				self.generation, mib = state["generation"], state["mib"]
+			else: # MIB guardada por uma versão sem journal
+				self.generation, mib = 0, state
+			legacy = True
+		self.replayed = self.replay(mib) # Repetir as alterações posteriores ao snapshot
+		self.resumable = self.resumable and not legacy # O estado com pickle é convertido num snapshot binário no início
+		return mib # Retornar a MIB
+
+	def replay(self, mib):
+
+		"""Repete na MIB os registos do journal da geração atual e retorna o número de registos aplicados;
+		o journal é truncado no primeiro registo incompleto ou corrompido"""
+
+		try:
+			with open(self.journal_path, "rb") as f: # Abrir o journal
+				data = f.read() # Ler o journal inteiro
+		except FileNotFoundError: # Se não houver journal
+			return 0
+		if len(data) < JOURNAL_HEADER.size: # Se o cabeçalho estiver incompleto
+			return 0
+		magic, generation = JOURNAL_HEADER.unpack_from(data) # Cabeçalho
+		if magic != JOURNAL_MAGIC or generation != self.generation: # Se o journal não for da geração do snapshot (já incluído nele)
+			return 0
+		self.resumable = True # O journal é da geração do snapshot
+
+		view = memoryview(data) # Ler os registos sem copiar
+		pos, applied = JOURNAL_HEADER.size, 0 # Posição do registo atual e registos aplicados
+		while pos + RECORD_HEADER.size <= len(view): # Enquanto houver um cabeçalho de registo completo
+			length, crc = RECORD_HEADER.unpack_from(view, pos) # Comprimento e CRC32
+			start, end = pos + RECORD_HEADER.size, pos + RECORD_HEADER.size + length # Conteúdo do registo
+			if end > len(view) or zlib.crc32(view[start:end]) != crc: # Se o registo estiver incompleto ou corrompido
+				break
+			try:
+				record, _ = decode_value(view, start) # Descodificar o registo
+				apply_record(mib, record) # Aplicar o registo
+				applied += 1
+			except (ValueError, IndexError, TypeError) as e: # Se o registo não puder ser aplicado
+				print(f"Registo do journal ignorado na posição {pos}: {e}") # Imprimir uma mensagem de erro
+			pos = end # Registo seguinte
+		if pos < len(view): # Se o journal terminar num registo incompleto
+			print(f"Journal truncado na posição {pos} (registo incompleto).") # Imprimir uma mensagem de erro
+			with open(self.journal_path, "r+b") as f: # Descartar o registo incompleto
+				f.truncate(pos)
+		return applied # Retornar o número de registos aplicados
+
+	def start(self, mib):
+
+		"""Continua o journal carregado ou, se não for possível, escreve um snapshot da MIB e recomeça o journal;
+		inicia a thread de commit"""
+
+		if self.enabled and self.resumable: # Se o journal for da geração do snapshot carregado
+			self.fd = os.open(self.journal_path, os.O_WRONLY | os.O_APPEND) # Continuar a acrescentar registos
+			self.journal_size = os.fstat(self.fd).st_size
+			self.resumable = False
+		else:
+			self.compact(mib) # Snapshot e journal vazio da nova geração
+		if self.enabled and self.commit_interval > 0 and not self.running: # Se os commits forem periódicos
+			self.running = True
+			self.thread = threading.Thread(target=self.commit_loop, daemon=True) # Thread de commit
+			self.thread.start()
+
+	def close(self):
+
+		"""Escreve os registos pendentes, para a thread de commit e fecha o journal"""
+
+		with self.condition:
+			self.running = False
+			self.condition.notify_all() # Acordar a thread de commit
+		if self.thread is not None: # Se a thread tiver sido iniciada
+			self.thread.join()
+			self.thread = None
+		self.flush() # Registos pendentes
+		if self.fd is not None: # Se o journal estiver aberto
+			os.close(self.fd)
+			self.fd = None
+		self.resumable = False # A MIB pode ser alterada sem journal até ao próximo start
+
+	def append(self, op, *fields):
+
+		"""Acrescenta um registo ao journal e retorna o seu número de sequência (0 se o journal estiver desativado)"""
+
+		if not self.enabled or self.fd is None: # Se o journal não estiver a ser escrito
+			return 0
+		payload = bytearray() # Conteúdo do registo
+		encode_value(payload, (op,) + fields)
+		with self.condition:
+			self.buffer += RECORD_HEADER.pack(len(payload), zlib.crc32(payload)) # Cabeçalho do registo
+			self.buffer += payload
+			self.appended += 1
+			sequence = self.appended # Número de sequência do registo
+			self.condition.notify_all() # Acordar a thread de commit
+		if not self.commit_interval: # Se cada registo for escrito de imediato
+			self.flush()
+		return sequence # Retornar o número de sequência
+
+	def wait_durable(self, sequence):
+
+		"""Espera que o registo com o número de sequência indicado esteja no disco, escrevendo-o de imediato
+		se não houver outra escrita em curso (o fsync dessa escrita já junta os registos seguintes)"""
+
+		with self.condition:
+			while self.durable < sequence and self.flushing: # Enquanto outra escrita estiver em curso
+				self.condition.wait()
+			if self.durable >= sequence: # Se o registo tiver ficado no disco
+				return
+		self.flush() # Escrever o grupo sem esperar pela thread de commit
+
+	def flush(self):
+
+		"""Escreve os registos acumulados no journal com um único fsync (group commit)"""
+
+		with self.flush_lock: # Uma escrita de cada vez
+			with self.condition:
+				data, self.buffer = self.buffer, bytearray() # Registos a escrever
+				sequence = self.appended # Último registo incluído
+				self.flushing = True
+			try:
+				if data and self.fd is not None: # Se houver registos
+					view = memoryview(data) # Escrever sem copiar
+					while view: # Até escrever tudo
+						view = view[os.write(self.fd, view):]
+					os.fsync(self.fd) # Um fsync para todo o grupo
+					self.journal_size += len(data)
+					self.bytes_written += len(data)
+					self.fsyncs += 1
+				with self.condition:
+					self.durable = max(self.durable, sequence) # Registos no disco
+			finally:
+				with self.condition:
+					self.flushing = False
+					self.condition.notify_all() # Acordar quem espera pelos registos
+
+	def commit_loop(self):
+
+		"""Thread de commit: escreve os registos acumulados a cada commit_interval segundos"""
+
+		while True:
+			with self.condition:
+				while self.running and not self.buffer: # Esperar por registos
+					self.condition.wait()
+				if not self.running: # Se o journal tiver sido fechado (close escreve os restantes)
+					return
+			time.sleep(self.commit_interval) # Juntar os registos que chegarem entretanto
+			self.flush() # Escrever o grupo
+
+	def needs_compaction(self):
+
+		"""Verifica se o journal atingiu o tamanho de compactação"""
+
+		return self.journal_size >= self.compact_size
+
+	def compact(self, mib):
+
+		"""Escreve um snapshot da MIB com a geração seguinte e recomeça o journal (chamado sem alterações
+		concorrentes à MIB, p. ex. com o lock da MIB exclusivo)"""
+
+		with self.flush_lock: # Sem escritas do journal durante a compactação
+			parts = encode_snapshot(mib, self.generation + 1) # Snapshot da nova geração (vistas sobre as colunas)
+			write_file_atomically(self.snapshot_path, parts) # O snapshot passa a incluir todos os registos
+			self.generation += 1
+			self.bytes_written += sum(len(part) for part in parts)
+			self.snapshots += 1
+			with self.condition:
+				self.buffer = bytearray() # Os registos pendentes já estão no snapshot
+				self.durable = self.appended
+				self.condition.notify_all()
+			if self.enabled: # Se o journal for escrito
+				if self.fd is not None: # Fechar o journal da geração anterior
+					os.close(self.fd)
+				write_file_atomically(self.journal_path, JOURNAL_HEADER.pack(JOURNAL_MAGIC, self.generation)) # Journal vazio da nova geração
+				self.fd = os.open(self.journal_path, os.O_WRONLY | os.O_APPEND) # Abrir para acrescentar
+				self.journal_size = JOURNAL_HEADER.size
+
+	def metrics(self):
+
+		"""Retorna as métricas do journal"""
+
+		return {"generation": self.generation, "journal_size": self.journal_size, "bytes_written": self.bytes_written, "fsyncs": self.fsyncs, "snapshots": self.snapshots, "replayed": self.replayed}
@@ -0,0 +1,141 @@
+import mmap
+import struct
+import sys
+from array import array
+
+from MIB import GeneratedKeysTable, InstanceData, KeyExpiryWheel, SNMPKeyShareMIB
+from SNMPKeySharePDU import encode_value, decode_value
+
+
+SNAPSHOT_MAGIC = b"SNMPKSSN" # Identificação do ficheiro do snapshot
+SNAPSHOT_VERSION = 2 # Versão do formato (2: expiração como instante único)
+SNAPSHOT_HEADER = struct.Struct("<8sIIQ") # Cabeçalho: magic, versão, número de regiões e geração
+TABLE_HEADER = struct.Struct("<7I") # Parâmetros da tabela: key_size, live, dead, order_start e contadores das visibilidades 0, 1 e 2
+REGION_ENTRY = struct.Struct("<QQ") # Entrada do diretório de regiões: posição e comprimento
+REGION_ALIGNMENT = 8 # Alinhamento do início de cada região
+
+TABLE_REGIONS = (("ids", "I"), ("requesters", "I"), ("expires", "q"), ("visibilities", "B"), ("values", "B"), ("free_slots", "I"), ("order_ids", "I"), ("order_slots", "I")) # Colunas da tabela (atributo, tipo)
+TABLE_REGIONS_V1 = (("ids", "I"), ("requesters", "I"), ("dates", "I"), ("times", "I"), ("visibilities", "B"), ("values", "B"), ("free_slots", "I"), ("order_ids", "I"), ("order_slots", "I")) # Colunas da versão 1 (data e hora de expiração)
+WHEEL_REGIONS = (("ticks", "q"), ("counts", "I"), ("ids", "I")) # Roda temporal: segundos ordenados, chaves por segundo e keyIds
+
+
+def is_snapshot(data):
+
+	"""Verifica se os primeiros bytes de um ficheiro são os de um snapshot binário"""
+
+	return data[:len(SNAPSHOT_MAGIC)] == SNAPSHOT_MAGIC
+
+
+def column_bytes(column, typecode):
+
+	"""Retorna os bytes de uma coluna (array, bytearray ou memoryview) em little-endian"""
+
+	if sys.byteorder == "little": # Caso habitual: a ordem nativa é a do ficheiro
+		return memoryview(column).cast("B") # Sem cópia
+	converted = array(typecode) # Cópia com a ordem dos bytes trocada
+	converted.frombytes(memoryview(column).cast("B"))
+	converted.byteswap()
+	return converted.tobytes()
+
+
+def encode_snapshot(mib, generation):
+
+	"""Codifica a MIB num snapshot binário com a geração indicada e retorna a lista de partes a escrever
+
+	O snapshot tem um cabeçalho, os parâmetros da tabela, um diretório de regiões (posição e comprimento)
+	e as regiões, alinhadas a 8 bytes: os metadados (instâncias escalares e requerentes, codificados como
+	os valores dos PDUs), as colunas da tabela e a arena dos valores das chaves tal como estão em memória,
+	e a roda temporal das expirações; as instâncias calculadas (métricas) não são guardadas. As colunas não são copiadas: as partes referem os arrays da MIB,
+	pelo que devem ser escritas antes de qualquer alteração (com o lock da MIB exclusivo).
+	"""
+
+	table, wheel = mib.table, mib.table.expiry_wheel # Tabela e roda temporal
+	metadata = bytearray() # Instâncias escalares e requerentes
+	encode_value(metadata, (tuple((oid, instance.access_type, instance.instance_type, instance.value) for oid, instance in mib.mib.items() if instance.persistent), tuple(table.requester_names)))
+
+	ticks = sorted(wheel.buckets) # Segundos com chaves a expirar
+	wheel_ids = array("I") # keyIds pela ordem dos segundos
+	for tick in ticks: # Para cada segundo
+		wheel_ids.frombytes(memoryview(wheel.buckets[tick]).cast("B"))
+	regions = [metadata] # Conteúdo de cada região
+	regions += [column_bytes(getattr(table, name), typecode) for name, typecode in TABLE_REGIONS]
+	regions += [column_bytes(array("q", ticks), "q"), column_bytes(array("I", [len(wheel.buckets[tick]) for tick in ticks]), "I"), column_bytes(wheel_ids, "I")]
+
+	pos = SNAPSHOT_HEADER.size + TABLE_HEADER.size + REGION_ENTRY.size * len(regions) # Início da primeira região
+	directory, parts = bytearray(), [] # Diretório de regiões e partes do ficheiro
+	for region in regions: # Para cada região
+		padding = -pos % REGION_ALIGNMENT # Bytes até ao alinhamento
+		parts.append(bytes(padding))
+		pos += padding
+		directory += REGION_ENTRY.pack(pos, len(region))
+		parts.append(region)
+		pos += len(region)
+	counts = table.visibility_counts # Contadores das visibilidades
+	header = SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, len(regions), generation) + TABLE_HEADER.pack(table.key_size, table.live, table.dead, table.order_start, counts[0], counts[1], counts[2])
+	return [header, directory] + parts # Partes do ficheiro
+
+
+def map_column(region, typecode):
+
+	"""Retorna a coluna de uma região do snapshot: uma vista sobre o ficheiro ou, numa plataforma big-endian, uma cópia"""
+
+	if sys.byteorder == "little": # Caso habitual: servir diretamente do ficheiro
+		return region.cast(typecode)
+	if typecode == "B": # Bytes (sem ordem)
+		return bytearray(region)
+	column = array(typecode) # Cópia com a ordem dos bytes trocada
+	column.frombytes(region)
+	column.byteswap()
+	return column
+
+
+def load_snapshot(path):
+
+	"""Carrega um snapshot binário com mmap e retorna (geração, MIB)
+
+	Só os metadados são descodificados; as colunas da tabela e os baldes da roda temporal ficam como
+	vistas só de leitura sobre o ficheiro (as páginas são lidas quando acedidas) até à primeira
+	alteração da tabela, que os copia para arrays (GeneratedKeysTable.materialize).
+	"""
+
+	with open(path, "rb") as f: # Abrir o snapshot
+		mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) # O mapeamento mantém-se depois de fechar o ficheiro
+	view = memoryview(mapping) # Vista sobre o ficheiro
+	if len(view) < SNAPSHOT_HEADER.size + TABLE_HEADER.size: # Se o cabeçalho estiver incompleto
+		raise ValueError(f"O snapshot {path} está incompleto.") # Lançar uma exceção
+	magic, version, region_count, generation = SNAPSHOT_HEADER.unpack_from(view) # Cabeçalho
+	table_regions = TABLE_REGIONS if version == SNAPSHOT_VERSION else TABLE_REGIONS_V1 # Colunas da versão do ficheiro
+	if magic != SNAPSHOT_MAGIC or version not in (1, SNAPSHOT_VERSION) or region_count != 1 + len(table_regions) + len(WHEEL_REGIONS): # Se o formato não for conhecido
+		raise ValueError(f"O snapshot {path} tem um formato desconhecido (versão {version}).") # Lançar uma exceção
+	key_size, live, dead, order_start, *counts = TABLE_HEADER.unpack_from(view, SNAPSHOT_HEADER.size) # Parâmetros da tabela
+	regions = [] # Vista de cada região
+	for index in range(region_count): # Para cada entrada do diretório
+		pos, length = REGION_ENTRY.unpack_from(view, SNAPSHOT_HEADER.size + TABLE_HEADER.size + index * REGION_ENTRY.size)
+		if pos + length > len(view): # Se a região estiver fora do ficheiro
+			raise ValueError(f"O snapshot {path} está incompleto.") # Lançar uma exceção
+		regions.append(view[pos:pos + length])
+
+	scalars, requester_names = decode_value(regions[0], 0)[0] # Metadados
+	mib = SNMPKeyShareMIB.__new__(SNMPKeyShareMIB) # MIB sem os valores iniciais
+	mib.mib = {oid: InstanceData(access_type, instance_type, value) for oid, access_type, instance_type, value in scalars} # Instâncias escalares
+	table = mib.table = GeneratedKeysTable(key_size) # Tabela servida a partir do ficheiro
+	for (name, typecode), region in zip(table_regions, regions[1:]): # Para cada coluna
+		setattr(table, name, map_column(region, typecode))
+	if version == 1: # Se a expiração estiver guardada como data e hora
+		table.convert_expiration_columns() # Calcular a coluna dos instantes
+	table.requester_names = list(requester_names)
+	table.requester_index = {requester: idx for idx, requester in enumerate(table.requester_names)}
+	table.live, table.dead, table.order_start = live, dead, order_start
+	table.visibility_counts = dict(enumerate(counts))
+	table.mapping = mapping # O mapeamento é mantido enquanto houver colunas por copiar
+
+	ticks, bucket_counts, wheel_ids = (map_column(region, typecode) for (_, typecode), region in zip(WHEEL_REGIONS, regions[1 + len(table_regions):])) # Roda temporal
+	wheel = table.expiry_wheel = KeyExpiryWheel()
+	pos = 0 # Primeiro keyId do balde atual
+	for tick, count in zip(ticks, bucket_counts): # Para cada segundo (a lista ordenada é uma heap válida)
+		wheel.buckets[tick] = wheel_ids[pos:pos + count] # Balde servido a partir do ficheiro
+		pos += count
+	wheel.ticks = list(ticks)
+	wheel.live = live # Uma entrada atual por chave
+	mib.rebuild_oid_index() # Índice ordenado dos OIDs escalares
+	return generation, mib # Retornar a geração e a MIB
@@ -0,0 +1,667 @@
+import json
+import mmap
+import os
+import threading
+import zlib
+
+try:
+	import fcntl # Locks POSIX (opcional: só existe em sistemas Unix)
+except ImportError:
+	fcntl = None
+
+from MIB import GeneratedKeysTable, ReadWriteLock, expiration_fields, expiration_timestamp
+
+
+STORE_MAGIC = b"SNMPKSv3" # Identificação do ficheiro do estado partilhado (v3: heap partilhada das expirações)
+HEADER_SIZE = 128 # Bytes reservados para o cabeçalho
+SCALARS_SIZE = 4096 # Bytes reservados para os valores escalares RW (JSON)
+REQUESTER_SIZE = 46 # Bytes por requerente: comprimento + endereço (INET6_ADDRSTRLEN)
+REPLAY_WAYS = 4 # Entradas por conjunto na janela de pedidos (associatividade)
+
+INT_FIELDS = ("capacity", "key_size", "replay_sets", "scalars_length") # Campos de 32 bits do cabeçalho (a seguir ao magic)
+COUNTER_FIELDS = ("next_key_id", "next_update", "live", "visible_0", "visible_1", "visible_2", "scalars_version", "replay_rejected", "replay_expired", "replay_evicted", "expiry_heap") # Campos de 64 bits do cabeçalho
+
+LOCK_MIB = 0 # Byte do ficheiro usado como lock de leitores/escritor da MIB
+LOCK_REQUESTS = 1 # Byte do ficheiro usado como lock da janela de pedidos
+LOCK_COUNTERS = 2 # Byte do ficheiro usado como lock dos contadores (keyIds e valores de N)
+
+
+def replay_key(addr, P):
+
+	"""Retorna a chave de 64 bits do pedido P do gestor addr na janela partilhada"""
+
+	return ((zlib.crc32(addr.encode("utf-8")) << 32) ^ P) & 0xFFFFFFFFFFFFFFFF # Endereço nos 32 bits superiores
+
+
+def align(offset):
+
+	"""Arredonda offset para o múltiplo de 8 seguinte"""
+
+	return (offset + 7) & ~7
+
+
+class InterProcessLock:
+
+	"""Lock exclusivo entre threads e entre processos (lock POSIX sobre um byte do ficheiro partilhado)
+
+	Os locks POSIX pertencem ao processo, pelo que as threads do mesmo processo são excluídas entre si
+	por um lock local antes de pedirem o lock do ficheiro.
+	"""
+
+	def __init__(self, fd, byte):
+
+		"""Construtor da classe"""
+
+		self.fd = fd # Descritor do ficheiro partilhado
+		self.byte = byte # Byte do ficheiro que serve de lock
+		self.local = threading.Lock() # Exclusão entre as threads do processo
+
+	def __enter__(self):
+		self.local.acquire()
+		fcntl.lockf(self.fd, fcntl.LOCK_EX, 1, self.byte) # Exclusão entre processos
+		return self
+
+	def __exit__(self, *exc_info):
+		fcntl.lockf(self.fd, fcntl.LOCK_UN, 1, self.byte)
+		self.local.release()
+
+
+class InterProcessReadWriteLock(ReadWriteLock):
+
+	"""Lock de leitores/escritor entre threads e entre processos
+
+	Dentro do processo comporta-se como o ReadWriteLock; o primeiro leitor do processo pede o lock
+	partilhado do ficheiro e o último liberta-o, e um escritor pede o lock exclusivo do ficheiro.
+	"""
+
+	def __init__(self, fd, byte):
+
+		"""Construtor da classe"""
+
+		super().__init__()
+		self.fd = fd # Descritor do ficheiro partilhado
+		self.byte = byte # Byte do ficheiro que serve de lock
+		self.file_guard = threading.Lock() # Protege o número de leitores que usam o lock partilhado
+		self.file_readers = 0 # Leitores do processo que usam o lock partilhado do ficheiro
+
+	def acquire_read(self):
+
+		"""Entra na secção crítica como leitor"""
+
+		super().acquire_read()
+		with self.file_guard:
+			if self.file_readers == 0: # Se for o primeiro leitor do processo
+				fcntl.lockf(self.fd, fcntl.LOCK_SH, 1, self.byte) # Lock partilhado entre processos
+			self.file_readers += 1
+
+	def try_acquire_read(self):
+
+		"""Entra na secção crítica como leitor se puder fazê-lo sem esperar; retorna se entrou"""
+
+		if not super().try_acquire_read(): # Se houver um escritor no processo
+			return False
+		if not self.file_guard.acquire(blocking=False): # Se outro leitor do processo estiver à espera do lock do ficheiro
+			super().release_read()
+			return False
+		try:
+			if self.file_readers == 0: # Se for o primeiro leitor do processo
+				try:
+					fcntl.lockf(self.fd, fcntl.LOCK_SH | fcntl.LOCK_NB, 1, self.byte) # Lock partilhado entre processos, sem esperar
+				except OSError: # Se outro processo tiver o lock exclusivo
+					super().release_read()
+					return False
+			self.file_readers += 1
+			return True
+		finally:
+			self.file_guard.release()
+
+	def release_read(self):
+
+		"""Sai da secção crítica como leitor"""
+
+		with self.file_guard:
+			self.file_readers -= 1
+			if self.file_readers == 0: # Se for o último leitor do processo
+				fcntl.lockf(self.fd, fcntl.LOCK_UN, 1, self.byte) # Libertar o lock do ficheiro
+		super().release_read()
+
+	def acquire_write(self):
+
+		"""Entra na secção crítica como escritor"""
+
+		super().acquire_write()
+		fcntl.lockf(self.fd, fcntl.LOCK_EX, 1, self.byte) # Lock exclusivo entre processos
+
+	def release_write(self):
+
+		"""Sai da secção crítica como escritor"""
+
+		fcntl.lockf(self.fd, fcntl.LOCK_UN, 1, self.byte) # Libertar o lock do ficheiro
+		super().release_write()
+
+
+class SharedKeyStore:
+
+	"""Estado partilhado pelos processos do agente num ficheiro mapeado em memória
+
+	O ficheiro contém um cabeçalho com os contadores comuns (próximo keyId, próximo valor de N, número
+	de chaves e contadores de visibilidade), os valores escalares RW da MIB (JSON, com um número de
+	versão), as colunas da tabela de chaves com capacidade fixa, a heap das expirações (slots ordenados
+	pelo instante de expiração e a posição de cada slot na heap) e a janela de pedidos recentes
+	(endereço do gestor, P).
+	Os processos criados por fork herdam o mapeamento; os locks POSIX sobre bytes do ficheiro
+	sincronizam-nos (LOCK_MIB, LOCK_REQUESTS e LOCK_COUNTERS).
+	"""
+
+	def __init__(self, path):
+
+		"""Abre o estado partilhado guardado em path (criado com SharedKeyStore.create)"""
+
+		self.path = path # Caminho do ficheiro
+		self.fd = os.open(path, os.O_RDWR) # Descritor do ficheiro (mantido aberto: fechá-lo liberta os locks POSIX)
+		self.mm = mmap.mmap(self.fd, 0) # Mapeamento partilhado do ficheiro
+		if self.mm[:len(STORE_MAGIC)] != STORE_MAGIC: # Se o ficheiro não for um estado partilhado
+			raise ValueError(f"O ficheiro {path} não contém um estado partilhado do agente.") # Lançar uma exceção
+		view = memoryview(self.mm) # Vista sobre o mapeamento
+		self.ints = view[8:8 + 4 * len(INT_FIELDS)].cast("I") # Campos de 32 bits do cabeçalho
+		self.counters = view[24:24 + 8 * len(COUNTER_FIELDS)].cast("Q") # Campos de 64 bits do cabeçalho
+		self.capacity, self.key_size, self.replay_sets = self.ints[0], self.ints[1], self.ints[2] # Dimensões
+		offset = HEADER_SIZE # Início da zona dos escalares
+		self.scalars = view[offset:offset + SCALARS_SIZE] # Valores escalares RW (JSON)
+		offset = align(offset + SCALARS_SIZE)
+		self.ids = view[offset:offset + 4 * self.capacity].cast("I") # slot -> keyId (0 = slot livre)
+		offset = align(offset + 4 * self.capacity)
+		self.expires = view[offset:offset + 8 * self.capacity].cast("q") # slot -> instante de expiração (segundos desde a época)
+		offset = align(offset + 8 * self.capacity)
+		self.heap = view[offset:offset + 4 * self.capacity].cast("I") # Posição na heap das expirações -> slot
+		offset = align(offset + 4 * self.capacity)
+		self.heap_positions = view[offset:offset + 4 * self.capacity].cast("I") # slot -> posição na heap das expirações
+		offset = align(offset + 4 * self.capacity)
+		self.visibilities = view[offset:offset + self.capacity] # slot -> keyVisibility
+		offset = align(offset + self.capacity)
+		self.requesters = view[offset:offset + REQUESTER_SIZE * self.capacity] # slot -> comprimento + requerente
+		offset = align(offset + REQUESTER_SIZE * self.capacity)
+		self.values = view[offset:offset + self.key_size * self.capacity] # slot -> valor da chave
+		offset = align(offset + self.key_size * self.capacity)
+		entries = self.replay_sets * REPLAY_WAYS # Entradas da janela de pedidos
+		self.replay_keys = view[offset:offset + 8 * entries].cast("Q") # Entrada -> chave do pedido (endereço, P)
+		offset += 8 * entries
+		self.replay_times = view[offset:offset + 8 * entries].cast("d") # Entrada -> tempo do pedido (0 = livre)
+		self.mib_lock = InterProcessReadWriteLock(self.fd, LOCK_MIB) # Lock da MIB (tabela, escalares e contadores de chaves)
+		self.requests_lock = InterProcessLock(self.fd, LOCK_REQUESTS) # Lock da janela de pedidos
+		self.counters_lock = InterProcessLock(self.fd, LOCK_COUNTERS) # Lock dos contadores de keyIds e de N
+		self.scalars_version = 0 # Versão dos escalares aplicada à MIB local
+
+	@staticmethod
+	def size(capacity, key_size, replay_sets):
+
+		"""Retorna o tamanho do ficheiro para as dimensões indicadas"""
+
+		offset = align(HEADER_SIZE + SCALARS_SIZE) # Cabeçalho e escalares
+		for width in (4, 8, 4, 4, 1, REQUESTER_SIZE, key_size): # Colunas da tabela e heap das expirações
+			offset = align(offset + width * capacity)
+		return offset + 16 * replay_sets * REPLAY_WAYS # Janela de pedidos
+
+	@staticmethod
+	def create(path, capacity, key_size, replay_sets):
+
+		"""Cria (ou reinicia) o ficheiro do estado partilhado, acessível só ao utilizador, e abre-o"""
+
+		if fcntl is None: # Se a plataforma não tiver locks POSIX
+			raise ValueError("O estado partilhado precisa de locks POSIX (fcntl), que não existem nesta plataforma.") # Lançar uma exceção
+		if capacity < 1 or key_size < 1 or replay_sets < 1: # Se as dimensões forem inválidas
+			raise ValueError(f"Dimensões do estado partilhado inválidas (capacidade {capacity}, chave {key_size}, janela {replay_sets}).") # Lançar uma exceção
+		fd = os.open(path, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o600) # Criar o ficheiro vazio
+		try:
+			os.ftruncate(fd, SharedKeyStore.size(capacity, key_size, replay_sets)) # Reservar o espaço (preenchido com zeros)
+			header = bytearray(HEADER_SIZE) # Cabeçalho
+			header[:8] = STORE_MAGIC
+			ints = memoryview(header)[8:8 + 4 * len(INT_FIELDS)].cast("I") # Campos de 32 bits
+			ints[0], ints[1], ints[2] = capacity, key_size, replay_sets # Dimensões
+			memoryview(header)[24:24 + 8 * len(COUNTER_FIELDS)].cast("Q")[COUNTER_FIELDS.index("next_key_id")] = 1 # Os keyIds começam em 1
+			os.pwrite(fd, bytes(header), 0) # Escrever o cabeçalho
+		finally:
+			os.close(fd)
+		return SharedKeyStore(path) # Abrir o estado partilhado
+
+	def close(self):
+
+		"""Liberta o mapeamento e fecha o ficheiro"""
+
+		for name in ("ints", "counters", "scalars", "ids", "expires", "heap", "heap_positions", "visibilities", "requesters", "values", "replay_keys", "replay_times"): # Vistas sobre o mapeamento
+			getattr(self, name).release()
+		self.mm.close()
+		os.close(self.fd)
+
+	def counter(self, name):
+
+		"""Retorna o valor de um contador do cabeçalho"""
+
+		return self.counters[COUNTER_FIELDS.index(name)]
+
+	def set_counter(self, name, value):
+
+		"""Altera o valor de um contador do cabeçalho"""
+
+		self.counters[COUNTER_FIELDS.index(name)] = value
+
+	def allocate(self, name, count):
+
+		"""Reserva count valores consecutivos do contador name (next_key_id ou next_update) e retorna o primeiro"""
+
+		with self.counters_lock: # Exclusão entre threads e processos
+			first = self.counter(name) # Primeiro valor reservado
+			self.set_counter(name, first + count) # Avançar o contador
+		return first # Retornar o primeiro valor
+
+	def record_request(self, addr, P, accept, now, V):
+
+		"""Retorna o tempo do último pedido P do gestor addr na janela (None se não existir) e, se accept for
+		verdadeiro e o pedido não for uma repetição dentro de V segundos, regista-o; quando o conjunto do
+		pedido está cheio é substituída a entrada mais antiga"""
+
+		key = replay_key(addr, P) # Chave do pedido
+		base = key % self.replay_sets * REPLAY_WAYS # Primeira entrada do conjunto do pedido
+		keys, times = self.replay_keys, self.replay_times # Referências locais
+		with self.requests_lock: # Exclusão entre threads e processos
+			found = None # Entrada com o pedido, se existir
+			for entry in range(base, base + REPLAY_WAYS): # Para cada entrada do conjunto
+				if times[entry] and keys[entry] == key: # Se a entrada guardar o pedido
+					found = entry
+					break
+			last_request_time = times[found] if found is not None else None # Tempo do último pedido
+			if not accept: # Se o pedido não for registado
+				return last_request_time
+			if last_request_time is not None and now - last_request_time < V: # Se for uma repetição
+				self.increment_counter("replay_rejected")
+				return last_request_time
+			if found is None: # Se o pedido não estiver na janela
+				found = min(range(base, base + REPLAY_WAYS), key=times.__getitem__) # Entrada livre ou mais antiga
+			if times[found]: # Se a entrada estiver ocupada
+				self.increment_counter("replay_expired" if now - times[found] >= V else "replay_evicted") # Entrada fora da janela ou substituída antes de V segundos
+			keys[found], times[found] = key, now # Registar o pedido
+		return last_request_time # Retornar o tempo do último pedido
+
+	def increment_counter(self, name):
+
+		"""Incrementa um contador de métricas do cabeçalho (chamado com o lock que o protege)"""
+
+		self.counters[COUNTER_FIELDS.index(name)] += 1
+
+	def replay_metrics(self):
+
+		"""Retorna as métricas da janela de pedidos partilhada"""
+
+		return {"rejected": self.counter("replay_rejected"), "expired": self.counter("replay_expired"), "evicted": self.counter("replay_evicted")}
+
+	def publish_scalars(self, mib):
+
+		"""Publica os valores escalares RW da MIB local para os outros processos (chamado com o lock da MIB exclusivo)"""
+
+		values = {oid: instance.value for oid, instance in mib.mib.items() if instance.access_type == "RW"} # Escalares RW
+		data = json.dumps(values).encode("utf-8") # Codificar em JSON
+		if len(data) > SCALARS_SIZE: # Se os valores não couberem na zona reservada
+			raise ValueError(f"Os valores escalares da MIB excedem {SCALARS_SIZE} bytes.") # Lançar uma exceção
+		self.scalars[:len(data)] = data # Escrever os valores
+		self.ints[INT_FIELDS.index("scalars_length")] = len(data) # Comprimento dos valores
+		self.scalars_version = self.counter("scalars_version") + 1 # Nova versão (já aplicada à MIB local)
+		self.set_counter("scalars_version", self.scalars_version)
+
+	def sync_scalars(self, mib):
+
+		"""Aplica à MIB local os valores escalares publicados por outro processo, se houver uma versão nova
+		(chamado com o lock da MIB)"""
+
+		version = self.counter("scalars_version") # Versão publicada
+		if version == self.scalars_version: # Caso habitual: nada mudou
+			return
+		length = self.ints[INT_FIELDS.index("scalars_length")] # Comprimento dos valores
+		for oid, value in json.loads(bytes(self.scalars[:length])).items(): # Para cada escalar publicado
+			mib.mib[oid].value = value # Atualizar a instância local
+		self.scalars_version = version # Versão aplicada
+
+
+class SharedExpiryHeap:
+
+	"""Min-heap indexada dos slots da tabela partilhada, ordenada pelo instante de expiração, guardada no SharedKeyStore
+
+	Cada chave presente tem exatamente uma entrada; a posição de cada slot na heap permite remover uma
+	chave ou alterar a sua expiração em O(log n), pelo que a remoção das chaves expiradas só visita as
+	que já venceram, seja qual for o processo que as inseriu ou reagendou. Todas as operações são feitas
+	com o lock da MIB exclusivo.
+	"""
+
+	def __init__(self, store):
+
+		"""Construtor da classe"""
+
+		self.store = store # Estado partilhado
+		self.heap, self.positions, self.expires = store.heap, store.heap_positions, store.expires # Colunas da heap e expirações
+
+	def __len__(self):
+
+		"""Número de chaves agendadas para expirar (em todos os processos)"""
+
+		return self.store.counter("expiry_heap")
+
+	def first(self):
+
+		"""Retorna o slot com a expiração mais próxima (a heap não pode estar vazia)"""
+
+		return self.heap[0]
+
+	def push(self, slot):
+
+		"""Agenda a expiração da chave do slot"""
+
+		size = len(self) # Posição da nova entrada
+		self.heap[size] = slot
+		self.positions[slot] = size
+		self.store.set_counter("expiry_heap", size + 1)
+		self.sift_up(size)
+
+	def remove(self, slot):
+
+		"""Descarta a entrada do slot (chave removida)"""
+
+		pos, last = self.positions[slot], len(self) - 1 # Posição da entrada e da última entrada
+		self.store.set_counter("expiry_heap", last)
+		if pos != last: # Mover a última entrada para o lugar da removida
+			moved = self.heap[last]
+			self.heap[pos] = moved
+			self.positions[moved] = pos
+			self.update(moved)
+
+	def update(self, slot):
+
+		"""Repõe a ordem da heap depois de a expiração do slot ter sido alterada"""
+
+		self.sift_up(self.positions[slot])
+		self.sift_down(self.positions[slot])
+
+	def sift_up(self, pos):
+
+		"""Sobe a entrada na posição pos enquanto expirar antes do seu pai"""
+
+		heap, positions, expires = self.heap, self.positions, self.expires # Referências locais
+		slot = heap[pos] # Entrada a mover
+		expires_at = expires[slot]
+		while pos: # Até à raiz
+			parent = (pos - 1) >> 1
+			if expires[heap[parent]] <= expires_at: # Se o pai expirar antes (ou ao mesmo tempo)
+				break
+			heap[pos] = heap[parent] # Descer o pai
+			positions[heap[pos]] = pos
+			pos = parent
+		heap[pos] = slot
+		positions[slot] = pos
+
+	def sift_down(self, pos):
+
+		"""Desce a entrada na posição pos enquanto algum filho expirar antes dela"""
+
+		heap, positions, expires = self.heap, self.positions, self.expires # Referências locais
+		size = len(self) # Entradas da heap
+		slot = heap[pos] # Entrada a mover
+		expires_at = expires[slot]
+		while True:
+			child = 2 * pos + 1 # Filho da esquerda
+			if child >= size: # Se a entrada for uma folha
+				break
+			if child + 1 < size and expires[heap[child + 1]] < expires[heap[child]]: # Filho que expira primeiro
+				child += 1
+			if expires_at <= expires[heap[child]]: # Se a entrada expirar antes dos filhos
+				break
+			heap[pos] = heap[child] # Subir o filho
+			positions[heap[pos]] = pos
+			pos = child
+		heap[pos] = slot
+		positions[slot] = pos
+
+
+class SharedKeysTable:
+
+	"""Tabela dataTableGeneratedKeys (3.2.1) guardada num SharedKeyStore, com a mesma interface que a GeneratedKeysTable
+
+	A capacidade é fixa e cada keyId ocupa o slot keyId % capacidade; como os keyIds são atribuídos em
+	sequência por todos os processos, as chaves presentes estão sempre entre next_key_id - capacidade e
+	next_key_id. A ordem das expirações é uma SharedExpiryHeap guardada no mesmo ficheiro, pelo que
+	qualquer processo remove as chaves vencidas de toda a tabela. A heap tem o nome da roda temporal
+	da GeneratedKeysTable (expiry_wheel), cujo len usa nas métricas.
+	"""
+
+	def __init__(self, store):
+
+		"""Construtor da classe"""
+
+		self.store = store # Estado partilhado
+		self.key_size = store.key_size # Bytes reservados por chave
+		self.capacity = store.capacity # Número de slots
+		self.expiry_wheel = SharedExpiryHeap(store) # Ordem das expirações (partilhada)
+
+	def __len__(self):
+
+		"""Número de chaves na tabela"""
+
+		return self.store.counter("live") # Contador partilhado
+
+	def __contains__(self, key_id):
+
+		"""Verifica se existe uma chave com o keyId indicado"""
+
+		return self.slot_of(key_id) is not None # Existe se tiver um slot
+
+	@property
+	def visibility_counts(self):
+
+		"""Contadores de chaves por visibilidade (partilhados)"""
+
+		return {visibility: self.store.counter(f"visible_{visibility}") for visibility in (0, 1, 2)}
+
+	@visibility_counts.setter
+	def visibility_counts(self, counts):
+		for visibility in (0, 1, 2): # Para cada visibilidade
+			self.store.set_counter(f"visible_{visibility}", counts[visibility])
+
+	def slot_of(self, key_id):
+
+		"""Retorna o slot da chave key_id, ou None se a chave não existir"""
+
+		slot = key_id % self.capacity # Slot do keyId
+		if key_id > 0 and self.store.ids[slot] == key_id: # Se o slot guardar a chave
+			return slot # Retornar o slot
+		return None # A chave não existe
+
+	def id_range(self, key_id):
+
+		"""Retorna o intervalo de keyIds maiores do que key_id onde podem existir chaves"""
+
+		end = self.store.counter("next_key_id") # Próximo keyId a atribuir
+		return range(max(key_id + 1, end - self.capacity, 1), end) # Janela de keyIds possíveis
+
+	def next_id(self, key_id):
+
+		"""Retorna o menor keyId presente na tabela que seja maior do que key_id, ou None"""
+
+		ids, capacity = self.store.ids, self.capacity # Referências locais (ciclo crítico)
+		for candidate in self.id_range(key_id): # Para cada keyId possível
+			if ids[candidate % capacity] == candidate: # Se a chave existir
+				return candidate # Retornar o keyId
+		return None # Não há keyIds seguintes
+
+	def rows(self):
+
+		"""Itera os pares (keyId, slot) das chaves presentes, por ordem crescente de keyId"""
+
+		ids, capacity = self.store.ids, self.capacity # Referências locais
+		for key_id in self.id_range(0): # Para cada keyId possível
+			if ids[key_id % capacity] == key_id: # Se a chave existir
+				yield key_id, key_id % capacity # Retornar o keyId e o slot
+
+	def encode_key(self, key):
+
+		"""Codifica o valor de uma chave com key_size bytes (completado com bytes nulos)"""
+
+		data = key.encode("latin-1") # Um byte por carácter (lança ValueError se não for possível)
+		if len(data) > self.key_size: # Se a chave não couber no slot (a largura é fixa)
+			raise ValueError(f"A chave tem {len(data)} bytes e a tabela partilhada só guarda {self.key_size}.") # Lançar uma exceção
+		return data.ljust(self.key_size, b"\0") # Completar com bytes nulos
+
+	def encode_requester(self, requester):
+
+		"""Codifica o requerente como comprimento + texto em REQUESTER_SIZE bytes"""
+
+		data = str(requester).encode("utf-8") # Requerente em UTF-8
+		if len(data) >= REQUESTER_SIZE: # Se o requerente não couber
+			raise ValueError(f"O requerente {requester} é demasiado longo para a tabela partilhada.") # Lançar uma exceção
+		return bytes((len(data),)) + data.ljust(REQUESTER_SIZE - 1, b"\0") # Comprimento e texto
+
+	def value(self, column, slot):
+
+		"""Retorna o valor da coluna column no slot"""
+
+		store = self.store
+		if column == 1: # keyId
+			return store.ids[slot]
+		if column == 2: # keyValue
+			return bytes(store.values[slot * self.key_size:(slot + 1) * self.key_size]).rstrip(b"\0").decode("latin-1")
+		if column == 3: # KeyRequester
+			start = slot * REQUESTER_SIZE # Início do requerente
+			return str(store.requesters[start + 1:start + 1 + store.requesters[start]], "utf-8")
+		if column == 4 or column == 5: # keyExpirationDate ou keyExpirationTime (calculadas a partir do instante)
+			return expiration_fields(store.expires[slot])[column - 4]
+		return store.visibilities[slot] # keyVisibility
+
+	def row(self, slot):
+
+		"""Retorna os campos (chave, requerente, instante de expiração, visibilidade) do slot, pela ordem de insert"""
+
+		return self.value(2, slot), self.value(3, slot), self.store.expires[slot], self.store.visibilities[slot]
+
+	def set_value(self, column, slot, value):
+
+		"""Altera o valor da coluna column no slot (o keyId não pode ser alterado)"""
+
+		store = self.store
+		if column == 1: # keyId
+			raise ValueError("O keyId de uma chave não pode ser alterado.") # Lançar uma exceção
+		if column == 2: # keyValue
+			store.values[slot * self.key_size:(slot + 1) * self.key_size] = self.encode_key(value) # Escrever o valor
+		elif column == 3: # KeyRequester
+			store.requesters[slot * REQUESTER_SIZE:(slot + 1) * REQUESTER_SIZE] = self.encode_requester(value) # Escrever o requerente
+		elif column == 6: # keyVisibility
+			if value not in (0, 1, 2): # Se a visibilidade for inválida
+				raise ValueError(f"A visibilidade da chave tem de ser 0, 1 ou 2 (recebido {value}).") # Lançar uma exceção
+			self.count_visibility(store.visibilities[slot], -1) # Descontar a visibilidade anterior
+			store.visibilities[slot] = value # Guardar a nova visibilidade
+			self.count_visibility(value, 1) # Contar a nova visibilidade
+		else: # keyExpirationDate ou keyExpirationTime
+			date, time = expiration_fields(store.expires[slot]) # Data e hora atuais
+			expires_at = expiration_timestamp(*((value, time) if column == 4 else (date, value))) # Validar e converter a nova expiração
+			store.expires[slot] = expires_at # Guardar o instante
+			self.expiry_wheel.update(slot) # Reposicionar a chave na heap das expirações
+
+	def count_visibility(self, visibility, delta):
+
+		"""Soma delta ao contador partilhado da visibilidade indicada"""
+
+		name = f"visible_{visibility}" # Contador da visibilidade
+		self.store.set_counter(name, self.store.counter(name) + delta)
+
+	def insert(self, key_id, key, requester, expires_at, key_visibility):
+
+		"""Insere uma chave que expira no instante expires_at (substituindo a chave com o mesmo keyId, se existir)"""
+
+		self.insert_batch(key_id, [key], requester, expires_at, [key_visibility]) # Lote com uma chave
+
+	def insert_batch(self, first_key_id, keys, requester, expires_at, visibilities):
+
+		"""Insere chaves com keyIds consecutivos a partir de first_key_id, com o mesmo requerente e o mesmo instante
+		de expiração (substituindo as chaves com os mesmos keyIds, se existirem); o lote é validado antes de qualquer inserção"""
+
+		store = self.store
+		if not (0 < first_key_id and first_key_id + len(keys) - 1 <= 0xFFFFFFFF): # Se algum keyId não couber na coluna
+			raise ValueError(f"O keyId {first_key_id} é inválido.") # Lançar uma exceção
+		for key_visibility in visibilities: # Para cada visibilidade
+			if key_visibility not in (0, 1, 2): # Se a visibilidade for inválida
+				raise ValueError(f"A visibilidade da chave tem de ser 0, 1 ou 2 (recebido {key_visibility}).") # Lançar uma exceção
+		for key_id in range(first_key_id, first_key_id + len(keys)): # Para cada keyId do lote
+			if store.ids[key_id % self.capacity] not in (0, key_id): # Se o slot estiver ocupado por uma chave mais antiga
+				raise ValueError(f"A tabela partilhada está cheia ({self.capacity} chaves).") # Lançar uma exceção
+		encoded = [self.encode_key(key) for key in keys] # Valores das chaves
+		requester_data = self.encode_requester(requester) # Requerente (comum ao lote)
+		expires_at = int(expires_at) # Instante de expiração (comum ao lote)
+
+		for offset, (data, key_visibility) in enumerate(zip(encoded, visibilities)): # Para cada chave do lote
+			key_id = first_key_id + offset # keyId da chave
+			slot = key_id % self.capacity # Slot da chave
+			if store.ids[slot] == key_id: # Se já existir uma chave com este keyId
+				self.remove(key_id) # Remover a chave anterior
+			store.values[slot * self.key_size:(slot + 1) * self.key_size] = data
+			store.requesters[slot * REQUESTER_SIZE:(slot + 1) * REQUESTER_SIZE] = requester_data
+			store.expires[slot] = expires_at
+			store.visibilities[slot] = key_visibility
+			store.ids[slot] = key_id # Publicar a linha
+			store.set_counter("live", store.counter("live") + 1) # Contar a chave
+			self.count_visibility(key_visibility, 1) # Contar a visibilidade
+			self.expiry_wheel.push(slot) # Agendar a expiração
+
+	def remove(self, key_id):
+
+		"""Remove a chave key_id da tabela"""
+
+		store = self.store
+		slot = self.slot_of(key_id) # Slot da chave
+		if slot is None: # Se a chave não existir
+			raise ValueError(f"A chave {key_id} não existe.") # Lançar uma exceção
+		self.count_visibility(store.visibilities[slot], -1) # Descontar a visibilidade
+		self.expiry_wheel.remove(slot) # Descartar a expiração
+		store.ids[slot] = 0 # Libertar o slot
+		store.values[slot * self.key_size:(slot + 1) * self.key_size] = bytes(self.key_size) # Apagar o valor da chave
+		store.set_counter("live", store.counter("live") - 1) # Descontar a chave
+
+	def remove_expired(self, now):
+
+		"""Remove as chaves de toda a tabela partilhada cujo instante de expiração é anterior a now e retorna os seus keyIds"""
+
+		heap, store = self.expiry_wheel, self.store # Referências locais
+		expired = [] # keyIds das chaves removidas
+		while len(heap) and store.expires[heap.first()] < now: # Enquanto a expiração mais próxima já tiver passado
+			key_id = store.ids[heap.first()] # Chave vencida
+			self.remove(key_id) # Remover a chave (e a entrada da heap)
+			expired.append(key_id) # Registar a chave removida
+		return expired # Retornar os keyIds das chaves removidas
+
+	def count_visibilities(self):
+
+		"""Conta as chaves por visibilidade percorrendo todos os slots (usado para verificação)"""
+
+		counts = {0: 0, 1: 0, 2: 0} # Contadores por visibilidade
+		for key_id, visibility in zip(self.store.ids, self.store.visibilities): # Para cada slot
+			if key_id: # Se o slot estiver ocupado
+				counts[visibility] += 1 # Incrementar o contador
+		return counts # Retornar os contadores
+
+	def load_rows(self, table):
+
+		"""Copia as chaves de outra tabela (p. ex. a do estado guardado da MIB) e avança o próximo keyId
+
+		Só as chaves com keyIds entre next_key_id - capacidade e next_key_id são alcançáveis, pelo que uma
+		tabela cujos keyIds distem capacidade ou mais é rejeitada.
+		"""
+
+		ids = [key_id for key_id, _ in table.rows()] # keyIds por ordem crescente
+		if ids and ids[-1] - ids[0] >= self.capacity: # Se as chaves não couberem na janela de keyIds
+			raise ValueError(f"Os keyIds guardados vão de {ids[0]} a {ids[-1]} e a tabela partilhada só guarda {self.capacity} keyIds consecutivos.") # Lançar uma exceção
+		for key_id, slot in table.rows(): # Para cada chave
+			self.store.set_counter("next_key_id", max(self.store.counter("next_key_id"), key_id + 1)) # Manter a chave na janela de keyIds
+			self.insert(key_id, *table.row(slot)) # Copiar a linha
+
+	def snapshot(self):
+
+		"""Retorna uma GeneratedKeysTable com uma cópia das chaves (para guardar o estado da MIB)"""
+
+		table = GeneratedKeysTable(self.key_size) # Tabela local
+		for key_id, slot in self.rows(): # Para cada chave
+			table.insert(key_id, *self.row(slot)) # Copiar a linha
+		return table # Retornar a cópia
@@ -0,0 +1,131 @@
+import os
+import time
+
+import pytest
+
+from MIB import SNMPKeyShareMIB
+from mibJournal import MIBJournal, OP_ADD, OP_REMOVE, OP_SET, apply_record
+
+
+RECORDS = [ # Inserção de três chaves, alteração de um escalar e remoção de uma chave
+	(OP_ADD, 1, ["abc", "def", "ghi"], "127.0.0.1", int(time.time()) + 3600, [2, 2, 1]),
+	(OP_SET, "1.5.0", 77),
+	(OP_REMOVE, (2,)),
+	(OP_SET, "1.6.0", 120),
+]
+
+
+@pytest.fixture
+def journal_paths(tmp_path):
+
+	"""Caminhos do snapshot e do journal num diretório temporário"""
+
+	return str(tmp_path / "mib_state.snap"), str(tmp_path / "mib_state.wal")
+
+
+def state(mib):
+
+	"""Estado comparável da MIB: escalares alterados pelos registos e linhas da tabela"""
+
+	rows = tuple((mib.get(f"3.2.1.2.{key_id}"), mib.get(f"3.2.1.6.{key_id}")) if key_id in mib.table else None for key_id in (1, 2, 3))
+	return mib.get("1.5.0"), mib.get("1.6.0"), len(mib.table), rows
+
+
+def write_journal(journal_paths):
+
+	"""Escreve os registos (um fsync por registo) e retorna os estados esperados após cada prefixo e os
+	tamanhos do journal no fim de cada registo"""
+
+	journal = MIBJournal(*journal_paths, commit_interval=0)
+	mib = SNMPKeyShareMIB()
+	journal.start(mib) # Snapshot da geração 1 e journal vazio
+	states, ends = [state(mib)], [os.path.getsize(journal_paths[1])]
+	for record in RECORDS: # Aplicar e registar cada alteração
+		apply_record(mib, record)
+		journal.wait_durable(journal.append(*record))
+		states.append(state(mib))
+		ends.append(os.path.getsize(journal_paths[1]))
+	journal.close()
+	return states, ends
+
+
+def test_replay_restores_every_record(journal_paths):
+
+	"""Um arranque após uma paragem sem snapshot repete o journal inteiro"""
+
+	states, _ = write_journal(journal_paths)
+	journal = MIBJournal(*journal_paths)
+	mib = journal.load()
+	assert journal.replayed == len(RECORDS)
+	assert state(mib) == states[-1]
+
+
+def test_torn_write_keeps_complete_records(journal_paths):
+
+	"""Uma escrita interrompida a meio de qualquer registo só perde esse registo, e o journal é truncado
+	para que os registos seguintes sejam escritos depois do último completo"""
+
+	states, ends = write_journal(journal_paths)
+	with open(journal_paths[1], "rb") as f:
+		full = f.read()
+	for index in range(1, len(RECORDS) + 1): # Para cada registo
+		for cut in range(ends[index - 1] + 1, ends[index]): # Para cada ponto de interrupção dentro dele
+			with open(journal_paths[1], "wb") as f:
+				f.write(full[:cut])
+			journal = MIBJournal(*journal_paths)
+			mib = journal.load()
+			assert journal.replayed == index - 1
+			assert state(mib) == states[index - 1]
+			assert os.path.getsize(journal_paths[1]) == ends[index - 1]
+
+
+def test_journal_resumes_after_torn_write(journal_paths):
+
+	"""Após a truncagem o journal continua a ser escrito e o registo seguinte sobrevive a outro arranque"""
+
+	_, ends = write_journal(journal_paths)
+	with open(journal_paths[1], "r+b") as f:
+		f.truncate(ends[-1] - 3) # Último registo incompleto
+	journal = MIBJournal(*journal_paths, commit_interval=0)
+	mib = journal.load()
+	journal.start(mib)
+	apply_record(mib, (OP_SET, "1.4.0", 5))
+	journal.wait_durable(journal.append(OP_SET, "1.4.0", 5))
+	journal.close()
+
+	journal = MIBJournal(*journal_paths)
+	reloaded = journal.load()
+	assert journal.replayed == len(RECORDS)
+	assert state(reloaded) == state(mib) and reloaded.get("1.4.0") == 5
+
+
+def test_corrupted_record_stops_replay(journal_paths):
+
+	"""Um registo com o CRC errado termina a repetição (os registos seguintes não são aplicados)"""
+
+	states, ends = write_journal(journal_paths)
+	with open(journal_paths[1], "r+b") as f:
+		f.seek(ends[2] - 1) # Último byte do segundo registo
+		byte = f.read(1)
+		f.seek(ends[2] - 1)
+		f.write(bytes((byte[0] ^ 0xFF,)))
+	journal = MIBJournal(*journal_paths)
+	mib = journal.load()
+	assert journal.replayed == 1
+	assert state(mib) == states[1]
+
+
+def test_compaction_supersedes_journal(journal_paths):
+
+	"""Após uma compactação o estado vem do snapshot e o journal recomeça vazio"""
+
+	states, _ = write_journal(journal_paths)
+	journal = MIBJournal(*journal_paths)
+	mib = journal.load()
+	journal.compact(mib)
+	journal.close()
+
+	journal = MIBJournal(*journal_paths)
+	reloaded = journal.load()
+	assert journal.replayed == 0 and journal.generation == 2
+	assert state(reloaded) == states[-1]
@@ -0,0 +1,133 @@
+import pickle
+
+import pytest
+
+from SNMPKeySharePDU import SNMPKeySharePDU, TRUNCATED_RESPONSE, detect_wire_format
+
+
+def response(L_or_W, R=()):
+
+	"""PDU de resposta com as listas dadas"""
+
+	return SNMPKeySharePDU(P=7, Y=0, NL_or_NW=len(L_or_W), L_or_W=list(L_or_W), NR=len(R), R=list(R))
+
+
+def fields(pdu):
+
+	"""Campos comparáveis de um PDU (os erros são comparados pela mensagem)"""
+
+	def plain(value):
+		if isinstance(value, BaseException):
+			return ("erro", str(value))
+		if isinstance(value, (tuple, list)):
+			return tuple(plain(item) for item in value)
+		return value
+
+	return (pdu.S, pdu.NS, plain(pdu.Q), pdu.P, pdu.Y, pdu.NL_or_NW, plain(pdu.L_or_W), pdu.NR, plain(pdu.R), pdu.F, pdu.NF)
+
+
+VALUES = [0, -1, 1, 2 ** 70, -(2 ** 70), "", "texto", "ção ✓", "1.1.0", "3.2.1.6.4294967296", "01.2", "1.", "1", None, ("a", (1, None))] # Valores de todas as etiquetas
+
+
+@pytest.mark.parametrize("value", VALUES)
+def test_round_trip_values(value):
+
+	"""Cada valor sobrevive à codificação binária com o mesmo tipo e forma"""
+
+	pdu = response([("3.2.1.2.1", value)])
+	decoded = SNMPKeySharePDU.deserialize(pdu.serialize())
+	assert fields(decoded) == fields(pdu)
+	assert type(decoded.L_or_W[0][1]) is type(value)
+
+
+def test_round_trip_requests_and_errors():
+
+	"""Gets, sets e respostas com erros e parâmetros de segurança"""
+
+	pdus = [
+		SNMPKeySharePDU(P=1, Y=1, NL_or_NW=2, L_or_W=[("1.1.0", 0), ("3.2.1.1.1", 16)]),
+		SNMPKeySharePDU(P=2, Y=2, NL_or_NW=1, L_or_W=[("3.2.1.6.1", 2)]),
+		SNMPKeySharePDU(S=1, NS=2, Q=["chave", 5], P=-3, Y=0, NL_or_NW=0, L_or_W=[], NR=2, R=[(0, ValueError("P repetido")), ("2.1.0", ValueError("inválido"))]),
+	]
+	for pdu in pdus:
+		assert fields(SNMPKeySharePDU.deserialize(pdu.serialize())) == fields(pdu)
+
+
+def test_pickle_is_opt_in():
+
+	"""Os PDUs pickle só são aceites com allow_pickle, e só se forem PDUs"""
+
+	pdu = SNMPKeySharePDU(P=4, Y=1, NL_or_NW=1, L_or_W=[("1.1.0", 0)])
+	data = pdu.serialize("pickle")
+	assert detect_wire_format(data) == "pickle"
+	with pytest.raises(ValueError):
+		SNMPKeySharePDU.deserialize(data)
+	assert fields(SNMPKeySharePDU.deserialize(data, allow_pickle=True)) == fields(pdu)
+	with pytest.raises(ValueError):
+		SNMPKeySharePDU.deserialize(pickle.dumps({"P": 4}), allow_pickle=True)
+
+
+def test_every_truncation_is_rejected():
+
+	"""Nenhum prefixo de um PDU válido é aceite (e nunca é lançada outra exceção)"""
+
+	data = response([("3.2.1.2.1", "x" * 200), ("3.2.1.3.1", 2 ** 40)], [("9.9", ValueError("fim"))]).serialize()
+	for end in range(len(data)):
+		with pytest.raises(ValueError):
+			SNMPKeySharePDU.deserialize(data[:end])
+
+
+@pytest.mark.parametrize("data", [
+	b"",
+	b"\x00\x01",
+	b"\xa5",
+	b"\xa5\x09",
+	SNMPKeySharePDU(P=1, Y=1, NL_or_NW=1, L_or_W=[("1.1.0", 0)]).serialize() + b"\x00",
+	bytes((0xA5, 1, 0, 0, 0, 2, 2, 2, 1, 9, 0, 0)),
+	bytes((0xA5, 1, 0, 0, 0, 2, 2, 2, 1, 2, 2, 0xFF, 0xFE, 0)),
+	bytes((0xA5, 2, 4, 2, 0, 0, 0, 2, 0, 0, 0, 0, 0)),
+], ids=["vazio", "desconhecido", "sem-versao", "versao", "bytes-a-mais", "etiqueta", "utf8", "fragmento"])
+def test_malformed_datagrams_are_rejected(data):
+
+	"""Datagramas corrompidos lançam ValueError"""
+
+	with pytest.raises(ValueError):
+		SNMPKeySharePDU.deserialize(data)
+
+
+@pytest.mark.parametrize("L_or_W", [[5], [("1.1.0", "x")], [(5, 0)], [("1.1.0", 0, 1)]])
+def test_malformed_gets_are_rejected(L_or_W):
+
+	"""Um get bem codificado mas com pares inválidos é rejeitado"""
+
+	data = SNMPKeySharePDU(P=1, Y=1, NL_or_NW=len(L_or_W), L_or_W=L_or_W).serialize()
+	with pytest.raises(ValueError):
+		SNMPKeySharePDU.deserialize(data)
+
+
+def test_fragments_reassemble_in_any_order():
+
+	"""Uma resposta grande é dividida em fragmentos que respeitam o tamanho e se juntam pela ordem original"""
+
+	pdu = response([(f"3.2.1.2.{i}", "x" * 40) for i in range(100)], [("9.9", ValueError("fim da MIB"))])
+	datagrams = pdu.serialize_fragments(300)
+	assert len(datagrams) > 1 and all(len(datagram) <= 300 for datagram in datagrams)
+	fragments = [SNMPKeySharePDU.deserialize(datagram) for datagram in reversed(datagrams)]
+	assert fields(SNMPKeySharePDU.reassemble(fragments)) == fields(pdu)
+	with pytest.raises(ValueError):
+		SNMPKeySharePDU.reassemble(fragments[1:])
+
+
+def test_fragment_limit_reports_omitted_pairs():
+
+	"""Com max_fragments os pares que não cabem são omitidos e assinalados por um erro no fim"""
+
+	L_or_W = [(f"3.2.1.2.{i}", "x" * 40) for i in range(100)]
+	datagrams = response(L_or_W).serialize_fragments(300, 3)
+	assert len(datagrams) == 3 and all(len(datagram) <= 300 for datagram in datagrams)
+	merged = SNMPKeySharePDU.reassemble([SNMPKeySharePDU.deserialize(datagram) for datagram in datagrams])
+	kept = len(merged.L_or_W)
+	assert merged.L_or_W == L_or_W[:kept]
+	[(oid, error)] = merged.R
+	assert oid == L_or_W[kept][0]
+	assert str(error).startswith(TRUNCATED_RESPONSE) and f"{100 - kept} pares" in str(error)
@@ -0,0 +1,202 @@
+import os
+import random
+import threading
+import traceback
+
+import pytest
+
+from MIB import GeneratedKeysTable
+from sharedKeyStore import SharedKeyStore, SharedKeysTable, fcntl
+
+
+pytestmark = pytest.mark.skipif(fcntl is None or not hasattr(os, "fork"), reason="O estado partilhado precisa de fcntl e fork")
+
+NOW = 1700000000 # Instante de referência das expirações
+
+
+@pytest.fixture
+def store_path(tmp_path):
+
+	"""Ficheiro do estado partilhado criado num diretório temporário"""
+
+	path = str(tmp_path / "shared.bin")
+	SharedKeyStore.create(path, 512, 16, 64).close()
+	return path
+
+
+def run_in_child(target, *args):
+
+	"""Executa target(*args) num processo filho (fork) e retorna o pid"""
+
+	pid = os.fork()
+	if pid == 0: # Processo filho
+		code = 1
+		try:
+			target(*args)
+			code = 0
+		except BaseException: # O pytest só vê o código de saída do filho
+			traceback.print_exc()
+		finally:
+			os._exit(code)
+	return pid
+
+
+def wait_children(pids):
+
+	"""Espera pelos processos filhos e verifica que terminaram sem erros"""
+
+	for pid in pids:
+		_, status = os.waitpid(pid, 0)
+		assert os.WIFEXITED(status) and os.WEXITSTATUS(status) == 0
+
+
+def check_table(table):
+
+	"""Verifica os contadores partilhados e a ordem da heap das expirações"""
+
+	store, heap = table.store, table.expiry_wheel
+	rows = list(table.rows())
+	assert len(table) == len(heap) == len(rows)
+	assert table.visibility_counts == table.count_visibilities()
+	for position in range(len(heap)): # Cada slot sabe a sua posição e nenhum filho expira antes do pai
+		assert store.heap_positions[store.heap[position]] == position
+		for child in (2 * position + 1, 2 * position + 2):
+			if child < len(heap):
+				assert store.expires[store.heap[position]] <= store.expires[store.heap[child]]
+
+
+def test_allocate_is_unique_across_processes(store_path, tmp_path):
+
+	"""Os keyIds reservados em paralelo por vários processos nunca se repetem nem deixam buracos"""
+
+	def allocate(index):
+		store = SharedKeyStore(store_path)
+		ids = [store.allocate("next_key_id", 1) for _ in range(500)]
+		(tmp_path / f"ids{index}").write_text(" ".join(map(str, ids)))
+
+	wait_children([run_in_child(allocate, index) for index in range(4)])
+	ids = [int(key_id) for index in range(4) for key_id in (tmp_path / f"ids{index}").read_text().split()]
+	assert sorted(ids) == list(range(1, 2001))
+	assert SharedKeyStore(store_path).counter("next_key_id") == 2001
+
+
+def hold_lock(store_path, write, ready, release):
+
+	"""Processo filho: entra no lock da MIB, avisa por ready e espera por release para sair"""
+
+	store = SharedKeyStore(store_path)
+	(store.mib_lock.acquire_write if write else store.mib_lock.acquire_read)()
+	os.write(ready, b"x")
+	os.read(release, 1)
+	(store.mib_lock.release_write if write else store.mib_lock.release_read)()
+
+
+def test_writer_excludes_readers_of_other_processes(store_path):
+
+	"""Com um escritor noutro processo try_acquire_read falha sem esperar, e volta a entrar depois"""
+
+	store = SharedKeyStore(store_path)
+	ready, ready_w = os.pipe()
+	release_r, release = os.pipe()
+	pid = run_in_child(hold_lock, store_path, True, ready_w, release_r)
+	os.read(ready, 1) # O filho tem o lock exclusivo
+	assert not store.mib_lock.try_acquire_read()
+	os.write(release, b"x")
+	wait_children([pid])
+	assert store.mib_lock.try_acquire_read()
+	store.mib_lock.release_read()
+
+
+def test_readers_share_and_block_writers(store_path):
+
+	"""Leitores de processos diferentes entram juntos; um escritor espera que o leitor do outro processo saia"""
+
+	store = SharedKeyStore(store_path)
+	ready, ready_w = os.pipe()
+	release_r, release = os.pipe()
+	pid = run_in_child(hold_lock, store_path, False, ready_w, release_r)
+	os.read(ready, 1) # O filho tem o lock partilhado
+	assert store.mib_lock.try_acquire_read()
+	store.mib_lock.release_read()
+
+	acquired = threading.Event()
+
+	def write():
+		with store.mib_lock.write_locked():
+			acquired.set()
+
+	writer = threading.Thread(target=write)
+	writer.start()
+	assert not acquired.wait(0.3) # Bloqueado pelo leitor do filho
+	os.write(release, b"x")
+	assert acquired.wait(5)
+	writer.join()
+	wait_children([pid])
+
+
+def test_concurrent_writers_keep_table_consistent(store_path):
+
+	"""Inserções, reagendamentos, remoções e expirações de vários processos, com o lock da MIB exclusivo,
+	mantêm os contadores e a heap das expirações consistentes"""
+
+	def churn(seed):
+		rng = random.Random(seed)
+		store = SharedKeyStore(store_path)
+		table = SharedKeysTable(store)
+		for _ in range(150):
+			key_id = store.allocate("next_key_id", 1)
+			with store.mib_lock.write_locked():
+				table.insert(key_id, f"k{key_id}", "127.0.0.1", NOW + rng.randrange(100), rng.randrange(3))
+				operation = rng.random()
+				rows = list(table.rows())
+				if operation < 0.2 and rows: # Reagendar uma chave
+					table.set_value(5, rng.choice(rows)[1], rng.randrange(24) * 10000 + rng.randrange(60) * 100) # Nova keyExpirationTime (HHMMSS)
+				elif operation < 0.3 and rows: # Remover uma chave
+					table.remove(rng.choice(rows)[0])
+				elif operation < 0.4: # Remover as chaves expiradas
+					table.remove_expired(NOW + rng.randrange(100))
+
+	wait_children([run_in_child(churn, seed) for seed in range(3)])
+	table = SharedKeysTable(SharedKeyStore(store_path))
+	check_table(table)
+
+
+def test_expiry_sees_keys_of_every_process(store_path):
+
+	"""As chaves inseridas por outro processo expiram no processo que remove as vencidas, por ordem de expiração"""
+
+	def insert():
+		store = SharedKeyStore(store_path)
+		table = SharedKeysTable(store)
+		with store.mib_lock.write_locked():
+			for offset in (30, 10, 20, 40):
+				table.insert(store.allocate("next_key_id", 1), "k", "127.0.0.1", NOW + offset, 2)
+
+	wait_children([run_in_child(insert)])
+	store = SharedKeyStore(store_path)
+	table = SharedKeysTable(store)
+	with store.mib_lock.write_locked():
+		assert table.remove_expired(NOW + 25) == [2, 3]
+		assert table.remove_expired(NOW + 35) == [1]
+	check_table(table)
+	assert len(table) == 1 and 4 in table
+
+
+def test_load_rows_rejects_keys_outside_the_window(store_path):
+
+	"""Uma tabela guardada cujos keyIds distam a capacidade ou mais não é copiada"""
+
+	saved = GeneratedKeysTable(16)
+	saved.insert(1, "a", "127.0.0.1", NOW, 2)
+	saved.insert(513, "b", "127.0.0.1", NOW, 2)
+	table = SharedKeysTable(SharedKeyStore(store_path))
+	with pytest.raises(ValueError):
+		table.load_rows(saved)
+	assert len(table) == 0
+
+	saved.remove(1)
+	saved.insert(2, "a", "127.0.0.1", NOW, 2)
+	table.load_rows(saved)
+	assert [key_id for key_id, _ in table.rows()] == [2, 513]
+	assert table.store.counter("next_key_id") == 514
+	check_table(table)